@@ -0,0 +1,122 @@
+# rules.py - Búsqueda tolerante a tildes y erratas sobre las reglas de Code.chatbot
+#
+# Code.py es el AV original y no se modifica: las frases de sus reglas (cada
+# `"frase" in user_input` y las listas de `any(word in user_input for word in [...])`)
+# se leen de su código fuente al arrancar y se indexan con common/fuzzy.py. Si
+# chatbot() no reconoce la consulta, la frase más parecida por encima de
+# FUZZY_THRESHOLD responde con la misma respuesta que daría su regla.
+#
+# Las consultas de una o dos palabras ("fotosintessis", "mitosis") no se parecen a
+# ninguna frase entera ("explicame fotosíntesis"), así que se comparan además con los
+# temas: la última palabra de cada frase que solo aparece en frases de una misma regla.
+import ast
+import inspect
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import Code
+from common.fuzzy import FUZZY_THRESHOLD, FuzzyIndex, normalize
+
+# Lo que responde chatbot() cuando ninguna regla casa
+FALLBACK = Code.chatbot("")
+# Las consultas de hasta TOPIC_MAX_WORDS palabras se comparan también con los temas sueltos
+TOPIC_MAX_WORDS = 2
+
+
+def _is_user_input(node) -> bool:
+    return isinstance(node, ast.Name) and node.id == "user_input"
+
+
+def rule_phrases() -> List[str]:
+    """Frases que Code.chatbot busca en la consulta, en el orden de sus reglas"""
+    found = []  # (línea, columna, frase)
+    for node in ast.walk(ast.parse(inspect.getsource(Code.chatbot))):
+        if isinstance(node, ast.Compare) and isinstance(node.ops[0], ast.In) \
+                and _is_user_input(node.comparators[0]) \
+                and isinstance(node.left, ast.Constant) and isinstance(node.left.value, str):
+            found.append((node.lineno, node.col_offset, node.left.value))
+        # any(word in user_input for word in ["hola", "holi", ...])
+        elif isinstance(node, ast.GeneratorExp) and isinstance(node.elt, ast.Compare) \
+                and _is_user_input(node.elt.comparators[0]) and isinstance(node.generators[0].iter, ast.List):
+            found += [(e.lineno, e.col_offset, e.value) for e in node.generators[0].iter.elts
+                      if isinstance(e, ast.Constant) and isinstance(e.value, str)]
+    return [phrase for _, _, phrase in sorted(found)]
+
+
+def topic_words(answers: Dict[str, str]) -> Dict[str, str]:
+    """Tema -> respuesta: última palabra de las frases de varias palabras ("explica mitosis"),
+    si todas las frases en que aparece son de la misma regla ("capital" no lo es)"""
+    owners: Dict[str, set] = {}
+    for phrase, answer in answers.items():
+        for word in normalize(phrase).split():
+            owners.setdefault(word, set()).add(answer)
+    topics: Dict[str, str] = {}
+    for phrase, answer in answers.items():
+        words = normalize(phrase).split()
+        if len(words) > 1 and len(owners[words[-1]]) == 1:
+            topics.setdefault(words[-1], answer)
+    return topics
+
+
+class RuleMatcher:
+    """chatbot() exacto y, si no reconoce la consulta, la regla de la frase más parecida"""
+
+    def __init__(self, threshold: float = FUZZY_THRESHOLD):
+        # frase -> respuesta de su regla (la que da chatbot() a la propia frase)
+        self.answers: Dict[str, str] = {}
+        for phrase in rule_phrases():
+            answer = Code.chatbot(phrase)
+            if answer != FALLBACK:
+                self.answers.setdefault(phrase, answer)
+        self.index = FuzzyIndex(self.answers, threshold)
+        self.topics = topic_words(self.answers)
+        self.topic_index = FuzzyIndex(self.topics, threshold)
+        self.counts: Counter = Counter()
+        self.fuzzy_phrases: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def answer(self, query: str) -> Tuple[str, Dict]:
+        """(respuesta, metadatos del match: exact | fuzzy | miss)"""
+        response = Code.chatbot(query)
+        match: Dict = {"match": "exact"}
+        found: Optional[Tuple[str, float]] = None
+        if response == FALLBACK:
+            found = self.index.match(query)
+            answers = self.answers
+            if found is None and len(normalize(query).split()) <= TOPIC_MAX_WORDS:
+                found, answers = self.topic_index.match(query), self.topics
+            if found is None:
+                match = {"match": "miss"}
+            else:
+                phrase, similarity = found
+                response = answers[phrase]
+                match = {"match": "fuzzy", "phrase": phrase, "similarity": similarity}
+        with self._lock:
+            self.counts[match["match"]] += 1
+            if found is not None:
+                self.fuzzy_phrases[found[0]] += 1
+        return response, match
+
+    def stats(self, top: int = 10) -> Dict:
+        """Contadores desde el arranque; fuzzy = consultas que sin el índice no tendrían respuesta"""
+        with self._lock:
+            counts = dict(self.counts)
+            top_phrases = self.fuzzy_phrases.most_common(top)
+        total = sum(counts.values())
+        return {
+            "threshold": self.index.threshold,
+            "phrases": len(self.answers),
+            "indexed": len(self.index),
+            "topics": len(self.topic_index),
+            "total": total,
+            "exact": counts.get("exact", 0),
+            "fuzzy": counts.get("fuzzy", 0),
+            "miss": counts.get("miss", 0),
+            "fuzzy_rate": round(counts.get("fuzzy", 0) / total, 4) if total else 0.0,
+            "top_fuzzy": [{"phrase": p, "hits": n} for p, n in top_phrases],
+        }
+
+
+# Instancia global (el índice se construye al importar, una vez por proceso)
+matcher = RuleMatcher()
@@ -1,11 +1,24 @@
 # wrapper.py: Adaptador para el AV basado en reglas. Expone API JSON estandarizada.
 # Integra el código original del GitHub sin modificarlo.
 
+import logging
 from fastapi import FastAPI, Request  # Framework para API REST
+from fastapi.responses import JSONResponse
 app = FastAPI()  # Inicializa la app
 
 # Importa la función principal del AV original
-from Code import chatbot  # Asume que Code.py está en la misma carpeta y es importable
+# (Code.py en la misma carpeta; rules.py añade búsqueda tolerante a erratas sobre sus reglas)
+from rules import matcher
+from common.tracing import Tracer  # Trazas compartidas con el orquestador
+from common.deadline import Deadline
+from common.transport import AssistantResponse, UnsupportedMediaType, read_request, respond, unsupported_media_type
+from common.logs import log_event, setup_logging
+from common.profiling import add_profiling_routes
+
+setup_logging("rule_based")  # cola asíncrona: el log de acceso de uvicorn tampoco bloquea
+logger = logging.getLogger(__name__)
+tracer = Tracer("rule_based")
+add_profiling_routes(app, "rule_based")  # /debug/*: solo con X-Admin-Token
 
 
 
@@ -17,8 +30,13 @@ async def root():
 async def health():
     return {"status": "healthy", "service": "rule_based_av"}
 
+@app.get("/stats")
+async def stats(top: int = 10):
+    """Consultas resueltas por regla exacta, por parecido (fuzzy) o sin respuesta desde el arranque"""
+    return matcher.stats(top)
+
 
-# Endpoint: Recibe JSON estandarizado del Supervisor y devuelve JSON estandarizado
+# Endpoint: Recibe JSON (o msgpack) estandarizado del Supervisor y devuelve el mismo formato
 @app.post("/query")
 async def handle_query(request: Request):
     """
@@ -26,25 +44,39 @@ async def handle_query(request: Request):
     - Recibe JSON: {"query": "string", "context": {"topic": "string"}} (estandarizado)
     - Llama al AV original (regla-based).
     - Devuelve JSON: {"task": "string", "output_data": {"response": "string", "status": "string", "metadata": "object"}}
+    - Con Accept: application/msgpack devuelve el AssistantResponse de common/transport.py en msgpack.
     - Para hacerlo educativo: Agrega reglas en chatbot.py, e.g., if "suma" in user_input: return "Explicación de suma...".
       Por ahora, usa las reglas originales.
     """
-    data = await request.json()  # Parsea input JSON
-    query = data.get("query")  # Query principal
-    context = data.get("context", {})  # Contexto opcional (e.g., tema educativo)
-    
-    if not query:
-        return {"error": "No se proporcionó una query válida."}
+    # Si el orquestador ya abandonó la consulta (p. ej. estuvo en cola), no se procesa
+    deadline = Deadline.from_headers(request.headers)
+    if deadline is not None and deadline.expired:
+        return JSONResponse(status_code=504, content={"error": "deadline_exceeded"})
     
-    # Llama al AV original (regla-based)
-    response_text = chatbot(query)  # Llama a la función chatbot del archivo original
+    with tracer.start_trace("rule_based.query", request.headers.get("traceparent")):
+        with tracer.span("parse_request"):
+            try:
+                data = await read_request(request)  # Parsea input JSON o msgpack
+            except UnsupportedMediaType:
+                return unsupported_media_type()
+        query = data.query  # Query principal
+        context = data.context  # Contexto opcional (e.g., tema educativo)
+        
+        if not query:
+            return {"error": "No se proporcionó una query válida."}
+        
+        # Llama al AV original (regla-based); si no reconoce la consulta, prueba la regla más parecida
+        with tracer.span("chatbot"):
+            response_text, match = matcher.answer(query)
+        logger.debug("💬 '%.100s' → '%.100s'", query, response_text, extra=log_event("rule_based.answer", **match))
     
+    metadata = {"topic": context.get("topic", "general"), **match}  # Metadata educativa
     # Estandariza la salida JSON (universal para todos los AVs)
-    return {
+    return respond(request, AssistantResponse(response_text, metadata=metadata), legacy={
         "task": "explain_basic",  # Tipo de tarea (expande: "quiz", "adapt", etc.)
         "output_data": {
             "response": response_text,  # Respuesta del AV
             "status": "success",  # Estado
-            "metadata": {"topic": context.get("topic", "general")}  # Metadata educativa
+            "metadata": metadata
         }
-    }
\ No newline at end of file
+    })
\ No newline at end of file
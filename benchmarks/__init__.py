@@ -0,0 +1 @@
+# benchmarks/ - Microbenchmarks del camino de la consulta (ver run.py)
@@ -0,0 +1,71 @@
+# benchmarks/corpus.py - Corpus de consultas sintéticas y grabadas para los benchmarks
+import json
+import os
+import random
+from typing import List
+
+# Plantillas por ruta, con la mezcla aproximada del tráfico real (muchas definiciones y saludos)
+_TEMPLATES = {
+    "rule": [
+        "Hola", "hola, ¿cómo estás?", "Hello there", "Cuéntame un chiste", "¿Cuánto es 2+2?",
+        "qué es la fotosíntesis", "Explícame la suma", "causas de la revolución francesa",
+        "¿Cuál es la capital de Francia?", "adiós, gracias", "buenas tardes profe",
+    ],
+    "factual": [
+        "¿Qué es {tema}?", "Explica {tema}", "Define {tema}", "¿Quién fue {persona}?",
+        "¿Cuándo ocurrió {evento}?", "¿Dónde nació {persona}?", "¿Qué significa {tema}?",
+        "What is {topic_en}?", "Who was {persona}?", "Explain {topic_en} in simple words",
+    ],
+    "generative": [
+        "¿Cómo se hace {tarea}?", "Explícame paso a paso {tarea}", "Dame un ejemplo de {tema}",
+        "Escribe un resumen sobre {evento}", "Redacta un párrafo sobre {tema}",
+        "¿Crees que {opinion}?", "Ayúdame a entender {tema} para mi examen de mañana",
+    ],
+    "default": [
+        "{tema}", "tengo dudas con {tema} no entiendo nada", "necesito ayuda con la tarea de {tema}",
+        "me puedes ayudar", "{tema} {tema} ejercicios resueltos",
+    ],
+}
+_FILL = {
+    "tema": ["la fotosíntesis", "la mitosis", "el álgebra", "las matemáticas", "el agua", "la Tierra",
+             "una ecuación cuadrática", "la célula", "el teorema de Pitágoras", "la energía cinética",
+             "fotosintesis", "mitossis", "la revolucion fracesa"],
+    "topic_en": ["photosynthesis", "mitosis", "algebra", "the French Revolution", "water"],
+    "persona": ["Albert Einstein", "Isaac Newton", "Cristóbal Colón", "Marie Curie"],
+    "evento": ["la Revolución Francesa", "la toma de la Bastilla", "el descubrimiento de América"],
+    "tarea": ["una ecuación cuadrática", "una división larga", "un mapa conceptual", "un ensayo"],
+    "opinion": ["las matemáticas son difíciles", "la historia es importante"],
+}
+_WEIGHTS = {"rule": 0.3, "factual": 0.35, "generative": 0.15, "default": 0.2}
+
+
+def synthetic_queries(n: int = 2000, seed: int = 42) -> List[str]:
+    """Consultas deterministas con tildes, mayúsculas, errores y longitudes variadas"""
+    rng = random.Random(seed)
+    routes = list(_WEIGHTS)
+    weights = [_WEIGHTS[r] for r in routes]
+    queries = []
+    for _ in range(n):
+        template = rng.choice(_TEMPLATES[rng.choices(routes, weights)[0]])
+        query = template.format(**{k: rng.choice(v) for k, v in _FILL.items()})
+        if rng.random() < 0.1:
+            query = query.upper()
+        if rng.random() < 0.05:
+            query = " ".join([query] * rng.randint(3, 8))  # preguntas largas pegadas
+        queries.append(query)
+    return queries
+
+
+def recorded_queries(path: str = None, limit: int = 0) -> List[str]:
+    """Consultas capturadas por el orquestador (CAPTURE_TRAFFIC=file); [] si no hay"""
+    path = path or os.getenv("CAPTURE_FILE", "/tmp/traffic.jsonl")
+    if not os.path.exists(path):
+        return []
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                queries.append(json.loads(line)["query"])
+                if limit and len(queries) >= limit:
+                    break
+    return queries
@@ -0,0 +1,314 @@
+# benchmarks/run.py - Microbenchmarks de los caminos calientes en Python puro
+#
+# Uso:
+#   python benchmarks/run.py                    # compara con benchmarks/baseline.json
+#   python benchmarks/run.py --save-baseline    # graba una nueva línea base (toda, de esta pasada)
+#   python benchmarks/run.py --only deeppavlov --recorded /tmp/traffic.jsonl
+#
+# Todo corre sin red: el benchmark de extremo a extremo usa los stubs de loadtest/
+# y sustituye las escrituras en la BD por funciones vacías.
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import recorded_queries, synthetic_queries  # noqa: E402
+from loadtest.stubs import start_stubs  # noqa: E402
+
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+
+# nombre -> (capa, setup(corpus) -> (función, entradas))
+BENCHMARKS: Dict[str, Tuple[str, Callable]] = {}
+
+
+def benchmark(name: str, layer: str):
+    def register(setup):
+        BENCHMARKS[name] = (layer, setup)
+        return setup
+    return register
+
+
+def _import(subdir: str, module: str):
+    path = os.path.join(ROOT, subdir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(module)
+
+
+# --- Orquestador ---
+
+@benchmark("orchestrator.normalize_text", "orchestrator")
+def _normalize_text(corpus):
+    return _import("orchestrator", "main").Orchestrator.normalize_text, corpus
+
+
+@benchmark("orchestrator.analyze_query", "orchestrator")
+def _analyze_query(corpus):
+    return _import("orchestrator", "main").orchestrator.analyze_query, corpus
+
+
+# --- Transporte orquestador ↔ asistentes ---
+
+def _codec_roundtrip(content_type: str):
+    """Lo que cuesta el formato en una llamada: petición y respuesta, ida y vuelta"""
+    from common import transport
+
+    if content_type == transport.MSGPACK and transport.msgpack is None:
+        raise ImportError("msgpack no instalado")
+
+    def roundtrip(query):
+        request = transport.AssistantRequest.from_dict(
+            transport.decode(transport.encode(transport.AssistantRequest(query).to_dict(), content_type), content_type))
+        response = transport.AssistantResponse(request.query, metadata={"topic": "general"})
+        body = transport.encode(response.to_dict(), content_type)
+        return transport.AssistantResponse.from_dict(transport.decode(body, content_type))
+    return roundtrip
+
+
+@benchmark("transport.json_roundtrip", "transport")
+def _json_roundtrip(corpus):
+    from common.transport import JSON
+    return _codec_roundtrip(JSON), corpus
+
+
+@benchmark("transport.msgpack_roundtrip", "transport")
+def _msgpack_roundtrip(corpus):
+    from common.transport import MSGPACK
+    return _codec_roundtrip(MSGPACK), corpus
+
+
+@benchmark("transport.rule_based_call_legacy", "transport")
+def _rule_based_call_legacy(corpus):
+    # Como antes: requests.post sin sesión (conexión nueva por llamada) y JSON
+    import requests
+    url = f"{os.environ['RULE_BASED_URL']}/query"
+    return (lambda query: requests.post(url, json={"query": query}, timeout=10).json()), corpus[:500]
+
+
+def _rule_based_client(content_type: str, corpus):
+    from common import transport
+
+    if content_type == transport.MSGPACK and transport.msgpack is None:
+        raise ImportError("msgpack no instalado")
+    client = transport.AssistantClient(os.environ["RULE_BASED_URL"])
+    client.content_type = content_type
+    return (lambda query: client.query(transport.AssistantRequest(query))), corpus[:500]
+
+
+@benchmark("transport.rule_based_call_json", "transport")
+def _rule_based_call_json(corpus):
+    from common.transport import JSON
+    return _rule_based_client(JSON, corpus)
+
+
+@benchmark("transport.rule_based_call_msgpack", "transport")
+def _rule_based_call_msgpack(corpus):
+    from common.transport import MSGPACK
+    return _rule_based_client(MSGPACK, corpus)
+
+
+# --- Logging del camino de la consulta (nivel de producción: INFO) ---
+
+def _request_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(f"benchmarks.{name}")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+@benchmark("logging.request_sync", "logging")
+def _logging_sync(corpus):
+    # Como antes: f-strings, todo a INFO y escrito en el hilo que atiende la consulta
+    from common.logs import lean_records
+    from common.transport import AssistantResponse
+
+    lean_records(False)
+    handler = logging.StreamHandler(open(os.devnull, "w", encoding="utf-8"))
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger = _request_logger("sync", handler)
+
+    def log_request(query):
+        data = AssistantResponse(query, metadata={"topic": "general"})
+        logger.info(f"Consulta: '{query}' → Asistente primario: rule_based")
+        logger.info(f"📥 Respuesta cruda de rule_based: {data}")
+        logger.info(f"✅ Respuesta extraída de rule_based: {data.response[:100]}...")
+    return log_request, corpus
+
+
+def _logging_async(corpus, rates):
+    from common.logs import build_handler, lean_records, log_event
+    from common.transport import AssistantResponse
+
+    lean_records()  # lo que hace setup_logging en los servicios
+    # Cola sin límite: se mide lo que paga la consulta, no los descartes
+    handler, listener = build_handler("benchmark", open(os.devnull, "w", encoding="utf-8"), rates=rates,
+                                      queue_size=0)
+    listener.start()
+    logger = _request_logger(f"async{len(rates)}", handler)
+
+    def log_request(query):
+        data = AssistantResponse(query, metadata={"topic": "general"})
+        logger.info("Consulta: '%.200s' → Asistente primario: %s", query, "rule_based",
+                    extra=log_event("query.routed", route="rule"))
+        logger.debug("📥 Respuesta cruda de rule_based: %s", data, extra=log_event("rule_based.raw"))
+        logger.info("✅ Respuesta extraída de rule_based: %.100s...", data.response,
+                    extra=log_event("assistant.response", assistant="rule_based"))
+    return log_request, corpus
+
+
+@benchmark("logging.request_async", "logging")
+def _logging_async_all(corpus):
+    return _logging_async(corpus, {})
+
+
+@benchmark("logging.request_async_sampled", "logging")
+def _logging_async_sampled(corpus):
+    return _logging_async(corpus, {"assistant.response": 0.1, "query.routed": 0.1})
+
+
+# --- Asistente basado en reglas ---
+
+@benchmark("rule_based.chatbot", "rule_based")
+def _chatbot(corpus):
+    return _import("assistants/rule-based", "Code").chatbot, corpus
+
+
+@benchmark("rule_based.matcher", "rule_based")
+def _rule_matcher(corpus):
+    # chatbot() y, para lo que no reconoce, el índice de trigramas con distancia acotada
+    return _import("assistants/rule-based", "rules").matcher.answer, corpus
+
+
+@benchmark("rule_based.fuzzy_miss", "rule_based")
+def _rule_fuzzy_miss(corpus):
+    # Peor caso: consultas que ninguna regla reconoce recorren el índice entero
+    rules = _import("assistants/rule-based", "rules")
+    misses = [query for query in corpus if rules.Code.chatbot(query) == rules.FALLBACK]
+    return rules.matcher.index.match, misses
+
+
+# --- Asistente QA (sin cargar el modelo) ---
+
+@benchmark("deeppavlov.detectar_idioma", "deeppavlov")
+def _detectar_idioma(corpus):
+    return _import("assistants/deeppavlov-nlu", "conocimiento").detectar_idioma, corpus
+
+
+@benchmark("deeppavlov.mejorar_respuesta", "deeppavlov")
+def _mejorar_respuesta(corpus):
+    conocimiento = _import("assistants/deeppavlov-nlu", "conocimiento")
+    # Respuestas típicas del pipeline: vacías, cortas (fuerzan la búsqueda en el contexto) y largas
+    answers = ["", "1879", "CO2", "Einstein", "agua", "un proceso de división celular en organismos"]
+    inputs = []
+    for i, query in enumerate(corpus):
+        idioma = "es" if i % 4 else "en"
+        inputs.append((query, answers[i % len(answers)], conocimiento.CONTEXTOS[idioma], idioma))
+    return (lambda args: conocimiento.mejorar_respuesta(*args)), inputs
+
+
+# --- Extremo a extremo en proceso ---
+
+@benchmark("e2e.orchestrate", "e2e")
+def _orchestrate(corpus):
+    main = _import("orchestrator", "main")
+    # Sin BD: el benchmark mide el orquestador y el transporte, no Postgres
+    main.get_user = lambda username: (1, None)
+    main.log_metric = lambda *args, **kwargs: None
+    return main.orchestrate, corpus[:300]
+
+
+def run_one(fn: Callable, inputs: List, repeat: int) -> float:
+    """Mejor de `repeat` pasadas, en microsegundos por operación (como timeit: el ruido de
+    otros procesos solo suma tiempo, y en una máquina compartida dura más que una pasada)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        timings.append((time.perf_counter() - start) / len(inputs))
+    return min(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks del camino de la consulta")
+    parser.add_argument("--only", default="", help="filtra por subcadena del nombre")
+    parser.add_argument("--size", type=int, default=2000, help="consultas sintéticas")
+    parser.add_argument("--recorded", default=None, help="JSONL capturado (CAPTURE_TRAFFIC=file)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.25, help="regresión tolerada (0.25 = +25%%)")
+    parser.add_argument("--confirm", type=int, default=2, help="repeticiones de un benchmark antes de darlo por regresión")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="graba la línea base; con --only solo sustituye los benchmarks filtrados")
+    args = parser.parse_args()
+
+    # Stubs locales antes de importar el orquestador (lee las URLs al construirse)
+    urls = start_stubs("const:0", "const:0", "const:0")
+    os.environ.update(urls)
+    os.environ["OLLAMA_HOST"] = urls["OLLAMA_URL"]
+    os.environ.setdefault("TRACE_EXPORT", "off")
+    os.environ.setdefault("CAPTURE_TRAFFIC", "off")
+    # Un único usuario a miles de consultas por segundo: el límite de ritmo de su rol lo cortaría
+    os.environ.setdefault("SCHEDULER", "0")
+    # setup_logging() al importar main: sin esto, cada consulta del e2e escribe JSON INFO en stderr
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Sin caché de respuestas: cada pasada del e2e recorre el camino completo, no solo la caché
+    os.environ.setdefault("RESPONSE_CACHE_TTL", "0")
+
+    corpus = synthetic_queries(args.size) + recorded_queries(args.recorded)
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results, regressions = {}, []
+    print(f"{'benchmark':<42} {'capa':<13} {'µs/op':>10} {'base':>10} {'Δ':>8}")
+    for name, (layer, setup) in BENCHMARKS.items():
+        if args.only and args.only not in name:
+            continue
+        try:
+            fn, inputs = setup(corpus)
+        except ImportError as e:
+            print(f"{name:<42} {layer:<13} {'omitido':>10}  ({e})")
+            continue
+        fn(inputs[0])  # calentamiento (imports perezosos, cachés)
+        us = run_one(fn, inputs, args.repeat)
+        base = baseline.get(name)
+        # Una racha de ruido puede durar más que todas las pasadas: se confirma antes de marcarla
+        for _ in range(args.confirm):
+            if not (base and us > base * (1 + args.threshold)):
+                break
+            us = min(us, run_one(fn, inputs, args.repeat))
+        results[name] = round(us, 3)
+        delta = f"{(us / base - 1) * 100:+.1f}%" if base else "-"
+        flag = ""
+        if base and us > base * (1 + args.threshold):
+            regressions.append(name)
+            flag = "  ⚠️ REGRESIÓN"
+        print(f"{name:<42} {layer:<13} {us:>10.2f} {base or 0:>10.2f} {delta:>8}{flag}")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump({
+                "machine": f"{platform.machine()} / Python {platform.python_version()}",
+                "corpus_size": len(corpus),
+                # Una línea base completa sale de una sola pasada: mezclar pasadas sueltas en una
+                # máquina ruidosa da referencias que la siguiente ejecución completa no alcanza
+                "results": {**baseline, **results} if args.only else results,
+            }, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"💾 Línea base guardada en {BASELINE_FILE}")
+    elif regressions:
+        print(f"❌ {len(regressions)} regresiones por encima del {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
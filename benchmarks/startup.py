@@ -0,0 +1,86 @@
+# benchmarks/startup.py - Tiempo de import y de arranque del orquestador
+#
+# Uso:
+#   python benchmarks/startup.py              # import de main/api/wrappers y carga de cada wrapper
+#   python benchmarks/startup.py --top 15     # además, los módulos más lentos (python -X importtime)
+#
+# Cada medida corre en un intérprete nuevo para que no influyan los módulos ya importados.
+#
+# Referencia (x86_64, Python 3.11, mediana de 5-7 arranques, dependencias de requirements.txt):
+#                               antes (import eager)   registro perezoso
+#   import wrappers                   1621 ms               27 ms
+#   rule_based / deeppavlov / llm     1608-1703 ms          25-96 ms
+#   ml                                1743 ms (entrena)     911 ms (carga el .joblib)
+# "antes" es wrappers.py previo al registro: import wrappers + construir la clase.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ORCHESTRATOR = os.path.join(ROOT, "orchestrator")
+
+# Sin red ni exportadores: se mide el coste de Python, no el de los servicios
+ENV = {**os.environ, "TRACE_EXPORT": "off", "CAPTURE_TRAFFIC": "off"}
+
+
+def run_python(code: str, extra_args=()) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *extra_args, "-c", code], cwd=ORCHESTRATOR, env=ENV,
+                          capture_output=True, text=True)
+
+
+def timed(code: str, repeat: int) -> float:
+    """Mediana en milisegundos de `code`, medido dentro del proceso hijo"""
+    probe = f"import time; _t = time.perf_counter(); {code}; print((time.perf_counter() - _t) * 1000)"
+    timings = []
+    for _ in range(repeat):
+        result = run_python(probe)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def slowest_imports(module: str, top: int):
+    """Módulos con más tiempo acumulado según python -X importtime"""
+    result = run_python(f"import {module}", ["-X", "importtime"])
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de import y arranque del orquestador")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="muestra los N imports más lentos")
+    args = parser.parse_args()
+
+    cases = [("import wrappers", "import wrappers"),
+             ("import main", "import main"),
+             ("import api", "import api")]
+    # Carga de cada wrapper por separado (en frío: incluye sus imports pesados)
+    cases += [(f"registry.get({name!r})", f"from wrappers import registry; registry.get({name!r})")
+              for name in ("rule_based", "deeppavlov", "llm", "nlu", "ml")]
+
+    print(f"{'medida':<32} {'ms':>10}")
+    for label, code in cases:
+        try:
+            print(f"{label:<32} {timed(code, args.repeat):>10.1f}")
+        except RuntimeError as e:
+            print(f"{label:<32} {'omitido':>10}  ({e})")
+
+    if args.top:
+        for module in ("wrappers", "api"):
+            print(f"\n🐢 Imports más lentos de {module}:")
+            for cumulative_us, name in slowest_imports(module, args.top):
+                print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
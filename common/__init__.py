@@ -0,0 +1,2 @@
+# common/ - Utilidades compartidas por el orquestador y los asistentes
+# Cada Dockerfile copia este paquete junto al código del servicio.
@@ -0,0 +1,104 @@
+# common/deadline.py - Plazo de extremo a extremo para cada consulta
+#
+# El orquestador fija un plazo al recibir la consulta y lo envía a los asistentes en
+# la cabecera X-Request-Deadline-Ms (instante absoluto, ms desde epoch: todos los
+# contenedores corren en el mismo host y comparten reloj). Así el tiempo que una
+# petición pasa en cola también cuenta, y un asistente puede rechazar trabajo que
+# el orquestador ya ha abandonado.
+#
+# Variables de entorno:
+#   REQUEST_BUDGET_SECONDS  plazo por defecto de una consulta en el orquestador (60)
+#   MIN_ATTEMPT_BUDGET      por debajo de esto no merece la pena empezar otra llamada (0.05)
+import contextlib
+import contextvars
+import os
+import time
+from typing import Dict, Mapping, Optional
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "60"))
+MIN_ATTEMPT_BUDGET = float(os.getenv("MIN_ATTEMPT_BUDGET", "0.05"))
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """El plazo de la consulta venció antes de (o durante) la etapa indicada"""
+
+
+class Deadline:
+    __slots__ = ("expires_at",)
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at  # time.time() en el que vence
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.time() + seconds)
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> Optional["Deadline"]:
+        value = headers.get(DEADLINE_HEADER)
+        if not value:
+            return None
+        try:
+            return cls(int(value) / 1000)
+        except ValueError:
+            return None
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.time())
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+    def check(self, stage: str) -> None:
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, cap: float, stage: str = "call") -> float:
+        """Timeout de una llamada: su tope propio o lo que queda del plazo, lo que sea menor"""
+        remaining = self.remaining()
+        if remaining < MIN_ATTEMPT_BUDGET:
+            raise DeadlineExceeded(stage)
+        return min(cap, remaining)
+
+    def headers(self) -> Dict[str, str]:
+        return {DEADLINE_HEADER: str(int(self.expires_at * 1000))}
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Hace visible el plazo a todo el código que corre dentro del bloque"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def check_deadline(stage: str) -> None:
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def has_budget() -> bool:
+    """¿Queda plazo suficiente para empezar otro intento (fallback, siguiente nivel de la cascada)?"""
+    deadline = _current_deadline.get()
+    return deadline is None or deadline.remaining() >= MIN_ATTEMPT_BUDGET
+
+
+def call_timeout(cap: float, stage: str = "call") -> float:
+    deadline = _current_deadline.get()
+    return cap if deadline is None else deadline.timeout(cap, stage)
+
+
+def deadline_headers() -> Dict[str, str]:
+    deadline = _current_deadline.get()
+    return {} if deadline is None else deadline.headers()
@@ -0,0 +1,138 @@
+# common/fuzzy.py - Búsqueda de frases cortas tolerante a tildes y erratas
+#
+# Índice de trigramas de caracteres sobre las frases (reglas, palabras clave). Una consulta
+# solo se compara con las frases que comparten suficientes trigramas con ella, y la
+# similitud se verifica con una distancia de edición acotada entre la frase y la ventana de
+# palabras de la consulta que mejor encaja: "causas de la revolucion fracesa" encuentra
+# "revolución francesa" (1 edición en 19 caracteres).
+#
+# Variables de entorno:
+#   FUZZY_THRESHOLD   similitud mínima, 1 - ediciones / longitud de la frase (0.8)
+#   FUZZY_MIN_LENGTH  las frases más cortas solo casan de forma exacta ("hola", "bye") (6)
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", "0.8"))
+FUZZY_MIN_LENGTH = int(os.getenv("FUZZY_MIN_LENGTH", "6"))
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes, solo palabras separadas por un espacio"""
+    text = "".join(c for c in unicodedata.normalize("NFD", (text or "").lower())
+                   if unicodedata.category(c) != "Mn")
+    return " ".join(_WORD.findall(text))
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_levenshtein(a: str, b: str, max_edits: int) -> Optional[int]:
+    """Distancia de edición entre a y b, o None en cuanto se sabe que supera max_edits.
+    Solo se calcula la banda de la diagonal de ancho 2*max_edits+1: O(len(a) * max_edits)"""
+    if abs(len(a) - len(b)) > max_edits:
+        return None
+    if a == b:
+        return 0
+    limit = max_edits + 1  # "infinito" dentro de la banda
+    previous = [j if j <= max_edits else limit for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        low, high = max(1, i - max_edits), min(len(b), i + max_edits)
+        current = [limit] * (len(b) + 1)
+        current[0] = i if i <= max_edits else limit
+        row_min = current[0]
+        for j in range(low, high + 1):
+            # min(sustitución, borrado, inserción) sin llamar a min(): es el bucle caliente
+            cost = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] < cost:
+                cost = previous[j] + 1
+            if current[j - 1] < cost:
+                cost = current[j - 1] + 1
+            if cost > limit:
+                cost = limit
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_edits:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= max_edits else None
+
+
+class FuzzyIndex:
+    """Frases normalizadas indexadas por trigramas; match() devuelve la más parecida"""
+
+    def __init__(self, phrases: Iterable[str], threshold: float = FUZZY_THRESHOLD,
+                 min_length: int = FUZZY_MIN_LENGTH):
+        self.threshold = threshold
+        self._phrases: List[Tuple[str, int, str, int]] = []  # (normalizada, palabras, original, nº trigramas)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        seen = set()
+        for phrase in phrases:
+            norm = normalize(phrase)
+            if len(norm) < min_length or norm in seen:
+                continue
+            seen.add(norm)
+            grams = trigrams(norm)
+            for gram in grams:
+                self._postings[gram].append(len(self._phrases))
+            self._phrases.append((norm, len(norm.split()), phrase, len(grams)))
+
+    def __len__(self) -> int:
+        return len(self._phrases)
+
+    def max_edits(self, phrase: str) -> int:
+        return int(len(phrase) * (1 - self.threshold) + 1e-9)
+
+    def match(self, text: str) -> Optional[Tuple[str, float]]:
+        """(frase original, similitud) de la mejor frase que supera el umbral, o None"""
+        norm = normalize(text)
+        if not norm:
+            return None
+        shared: Counter = Counter()
+        for gram in trigrams(norm):
+            for phrase_id in self._postings.get(gram, ()):
+                shared[phrase_id] += 1
+        words = norm.split()
+        best = None
+        for phrase_id, count in shared.items():
+            phrase, n_words, original, n_grams = self._phrases[phrase_id]
+            max_edits = self.max_edits(phrase)
+            # Cada edición rompe como mucho 3 trigramas de la frase: descarte sin calcular distancias
+            if count < n_grams - 3 * max_edits:
+                continue
+            distance = self._best_window(phrase, n_words, words, max_edits)
+            if distance is None:
+                continue
+            similarity = 1 - distance / len(phrase)
+            if best is None or similarity > best[1] or (similarity == best[1] and phrase_id < best[2]):
+                best = (original, similarity, phrase_id)
+        return (best[0], round(best[1], 3)) if best else None
+
+    @staticmethod
+    def _best_window(phrase: str, n_words: int, words: List[str], max_edits: int) -> Optional[int]:
+        """Menor distancia entre la frase y una ventana de n-1..n+1 palabras de la consulta"""
+        offsets = [0]  # offsets[k] = longitud de " ".join(words[:k]) + 1
+        for word in words:
+            offsets.append(offsets[-1] + len(word) + 1)
+        best = None
+        for size in (n_words, n_words - 1, n_words + 1):  # palabras partidas o pegadas
+            if size < 1:
+                continue
+            for start in range(len(words) - size + 1):
+                budget = max_edits if best is None else best
+                # Por longitud se descartan casi todas las ventanas sin construirlas
+                if abs(offsets[start + size] - offsets[start] - 1 - len(phrase)) > budget:
+                    continue
+                distance = bounded_levenshtein(phrase, " ".join(words[start:start + size]), budget)
+                if distance is not None and (best is None or distance < best):
+                    if distance == 0:
+                        return 0
+                    best = distance
+        return best
@@ -0,0 +1,159 @@
+# common/logs.py - Logging estructurado y asíncrono para el orquestador y los asistentes
+#
+# El hilo que atiende la consulta solo encola el LogRecord, todavía sin formatear; un
+# hilo aparte construye el mensaje, lo serializa (JSON o texto) y lo escribe. Si la cola
+# se llena el registro se descarta y se cuenta: escribir logs nunca frena una consulta.
+#
+# - Nivel: lo que queda por debajo de LOG_LEVEL se corta en logger.debug(...) antes de
+#   crear el record. Para que eso salga gratis, argumentos con %: nunca f-strings
+#   (logger.info("Respuesta: %.100s", texto) no trocea ni formatea si no se escribe).
+# - Muestreo por tipo de mensaje: extra=log_event("ollama.response") y
+#   LOG_SAMPLE="ollama.response=0.1" deja pasar uno de cada diez. WARNING y superiores
+#   no se muestrean nunca.
+# - Los args se formatean más tarde en otro hilo: no pasar objetos que se vayan a modificar.
+#
+# Variables de entorno:
+#   LOG_LEVEL       nivel mínimo (INFO)
+#   LOG_FORMAT      "json" (por defecto) | "text"
+#   LOG_SAMPLE      tipo=fracción,... (los tipos que no aparecen se escriben siempre)
+#   LOG_QUEUE_SIZE  registros pendientes antes de empezar a descartar (10000; 0 = sin límite)
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from typing import Dict, Optional
+
+from common.tracing import current_trace_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Atributos propios de LogRecord: el resto son campos estructurados (extra=...)
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+_listener: Optional[logging.handlers.QueueListener] = None
+_SRCFILE = logging._srcfile
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+LOG_SAMPLE = _parse_rates(os.getenv("LOG_SAMPLE", ""))
+
+
+def log_event(event: str, **fields) -> Dict:
+    """extra= de un mensaje: tipo (para el muestreo) y campos estructurados"""
+    return {"event": event, **fields}
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar una fracción de cada tipo de mensaje por debajo de WARNING"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or random.random() < rate
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el hilo que llama y no bloquea con la cola llena"""
+
+    def __init__(self, log_queue: "queue.SimpleQueue", max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # El contextvar del span no existe en el hilo de escritura: se copia ahora
+        if not hasattr(record, "trace_id"):
+            record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # SimpleQueue (en C, sin Condition) con un límite aproximado: qsize() y put() no son
+        # atómicos, pero pasarse por unos pocos registros no importa
+        if self.max_size and self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro: ts, level, service, logger, msg y los campos de extra="""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RESERVED and v is not None)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def lean_records(enabled: bool = True) -> None:
+    """LogRecord sin fichero, línea, hilo ni proceso (receta "Optimization" del HOWTO de logging):
+    ningún formato de aquí los usa y averiguar el llamante recorre la pila en cada mensaje"""
+    logging._srcfile = None if enabled else _SRCFILE
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = not enabled
+
+
+def build_handler(service: str, stream=None, fmt: str = LOG_FORMAT, rates: Optional[Dict[str, float]] = None,
+                  queue_size: int = LOG_QUEUE_SIZE):
+    """(handler para los loggers, listener que escribe en `stream`); el listener hay que arrancarlo"""
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter(service) if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    handler = AsyncQueueHandler(log_queue, queue_size)
+    handler.addFilter(SamplingFilter(LOG_SAMPLE if rates is None else rates))
+    return handler, logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+
+
+def setup_logging(service: str, level: str = LOG_LEVEL) -> None:
+    """Sustituye los handlers del logger raíz (y los de uvicorn) por la cola asíncrona; idempotente"""
+    global _listener
+    if _listener is not None:
+        return
+    lean_records()
+    handler, _listener = build_handler(service)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # uvicorn trae sus propios handlers síncronos (incluido el log de acceso por petición)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    _listener.start()
+    atexit.register(_listener.stop)  # vacía la cola al salir
+
+
+def dropped() -> int:
+    """Registros descartados por cola llena en este proceso"""
+    handlers = logging.getLogger().handlers
+    return sum(h.dropped for h in handlers if isinstance(h, AsyncQueueHandler))
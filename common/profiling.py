@@ -0,0 +1,202 @@
+# common/profiling.py - Perfilado bajo demanda de los servicios en producción
+#
+# Endpoints de administración (cabecera X-Admin-Token = PROFILING_TOKEN) que se montan en
+# la app FastAPI de cada servicio con add_profiling_routes(app, "orchestrator"):
+#
+#   GET /debug/profile?seconds=10   muestreo de pilas de todos los hilos durante `seconds`;
+#                                   por defecto en formato "collapsed" (una línea por pila,
+#                                   "hilo;marco;marco;... muestras"), el que leen flamegraph.pl,
+#                                   speedscope o inferno. format=json da además el top de funciones.
+#   GET /debug/threads              pila actual de cada hilo (p. ej. hilos que siguen esperando a
+#                                   Ollama después de que la consulta se abandonara)
+#   GET /debug/memory?seconds=10    top de líneas por memoria reservada con tracemalloc
+#
+# Sin petición en curso no hay nada activo: el muestreo lo hace el hilo que atiende la
+# petición mientras dura la ventana y tracemalloc se arranca y se para con ella (salvo que ya estuviera activo con
+# PYTHONTRACEMALLOC). Un perfil a la vez por proceso; el resto recibe 409.
+#
+# Variables de entorno:
+#   PROFILING_TOKEN        token de administración (vacío = endpoints desactivados, 404)
+#   PROFILE_MAX_SECONDS    duración máxima de una ventana de perfilado (60)
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+ADMIN_HEADER = "X-Admin-Token"
+
+# Hojas de pila de un hilo parado esperando trabajo: sin idle=true no se cuentan
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("socket.py", "accept"),
+}
+
+_profile_lock = threading.Lock()
+_memory_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Ya hay una ventana de perfilado en curso en este proceso"""
+
+
+def _frame_label(frame) -> Tuple[str, str]:
+    return os.path.basename(frame.f_code.co_filename), frame.f_code.co_name
+
+
+def _thread_names() -> Dict[int, str]:
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+def sample_stacks(seconds: float, interval: float = 0.01, idle: bool = False,
+                  lines: bool = False) -> Tuple[Counter, int]:
+    """(pilas colapsadas → muestras, nº de barridos) de todos los hilos salvo el propio muestreador"""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        stacks: Counter = Counter()
+        me = threading.get_ident()
+        names = _thread_names()
+        sweeps = 0
+        end = time.monotonic() + min(seconds, PROFILE_MAX_SECONDS)
+        while time.monotonic() < end:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if not idle and _frame_label(frame) in IDLE_LEAVES:
+                    continue
+                labels = []
+                while frame is not None:
+                    filename, function = _frame_label(frame)
+                    labels.append(f"{filename}:{function}:{frame.f_lineno}" if lines else f"{filename}:{function}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = _thread_names()  # hilo nuevo desde el último barrido
+                labels.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(labels))] += 1
+            sweeps += 1
+            time.sleep(interval)
+        return stacks, sweeps
+    finally:
+        _profile_lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    """Formato "collapsed" de flamegraph.pl: "raíz;...;hoja muestras" por línea"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_functions(stacks: Counter, top: int = 20) -> List[Dict]:
+    """Funciones por muestras propias (hoja) y totales (en cualquier punto de la pila)"""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]  # sin el nombre del hilo
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    samples = sum(stacks.values()) or 1
+    return [{"function": f, "self": own[f], "total": n, "total_pct": round(100 * n / samples, 1)}
+            for f, n in total.most_common(top)]
+
+
+def thread_dump() -> str:
+    """Pila de cada hilo, con nombre y si es daemon (como faulthandler, pero con los nombres)"""
+    threads = {t.ident: t for t in threading.enumerate()}
+    frames = sys._current_frames()
+    out = [f"# {len(frames)} hilos, {time.strftime('%Y-%m-%d %H:%M:%S')}\n"]
+    for ident, frame in sorted(frames.items(), key=lambda item: getattr(threads.get(item[0]), "name", "")):
+        thread = threads.get(ident)
+        name = thread.name if thread else f"thread-{ident}"
+        daemon = " daemon" if thread is not None and thread.daemon else ""
+        out.append(f"\n--- {name} (id {ident}{daemon}) ---\n")
+        out.extend(traceback.format_stack(frame))
+    return "".join(out)
+
+
+def memory_top(seconds: float = 10, top: int = 20, key: str = "lineno") -> Dict:
+    """Top de reservas de memoria. Si tracemalloc no estaba activo se activa solo durante `seconds`
+    y el top refleja lo reservado (y aún vivo) en esa ventana; "growth" compara inicio y final"""
+    if not _memory_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    started = not tracemalloc.is_tracing()
+    try:
+        if started:
+            tracemalloc.start(25 if key == "traceback" else 1)
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__),
+                  tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+        before = tracemalloc.take_snapshot().filter_traces(ignore)
+        time.sleep(max(0.0, min(seconds, PROFILE_MAX_SECONDS)))
+        after = tracemalloc.take_snapshot().filter_traces(ignore)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started:
+            tracemalloc.stop()
+        _memory_lock.release()
+
+    def stat_entry(stat) -> Dict:
+        return {"where": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+
+    return {
+        "window_seconds": seconds,
+        "traced_since_start": not started,  # True: tracemalloc ya estaba activo (PYTHONTRACEMALLOC)
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": [stat_entry(s) for s in after.statistics(key)[:top]],
+        "growth": [{**stat_entry(s), "size_diff_kb": round(s.size_diff / 1024, 1), "count_diff": s.count_diff}
+                   for s in after.compare_to(before, key)[:top] if s.size_diff],
+    }
+
+
+def add_profiling_routes(app, service: str, token: str = PROFILING_TOKEN) -> None:
+    """Monta /debug/profile, /debug/threads y /debug/memory en la app FastAPI del servicio"""
+    from fastapi import Header, HTTPException
+    from fastapi.responses import PlainTextResponse
+
+    def require_admin(supplied: Optional[str]) -> None:
+        if not token:
+            raise HTTPException(status_code=404, detail="Perfilado desactivado (PROFILING_TOKEN vacío)")
+        if not supplied or not hmac.compare_digest(supplied, token):
+            raise HTTPException(status_code=403, detail=f"Se necesita la cabecera {ADMIN_HEADER}")
+
+    # Endpoints síncronos: FastAPI los ejecuta en su pool de hilos y el bucle de eventos
+    # sigue atendiendo consultas (que son justo lo que se quiere ver en el perfil)
+    def profile(seconds: float = 10, interval: float = 0.01, format: str = "collapsed", idle: bool = False,
+                lines: bool = False, top: int = 20, x_admin_token: Optional[str] = Header(None)):
+        require_admin(x_admin_token)
+        if format not in ("collapsed", "json"):
+            raise HTTPException(status_code=400, detail="format debe ser 'collapsed' o 'json'")
+        try:
+            stacks, sweeps = sample_stacks(seconds, max(interval, 0.001), idle, lines)
+        except ProfilerBusy:
+            raise HTTPException(status_code=409, detail="Ya hay un perfil en curso")
+        if format == "collapsed":
+            return PlainTextResponse(collapsed(stacks))
+        return {"service": service, "seconds": min(seconds, PROFILE_MAX_SECONDS), "interval": interval,
+                "sweeps": sweeps, "samples": sum(stacks.values()), "top": top_functions(stacks, top),
+                "stacks": dict(stacks.most_common())}
+
+    def threads(x_admin_token: Optional[str] = Header(None)):
+        require_admin(x_admin_token)
+        return PlainTextResponse(thread_dump())
+
+    def memory(seconds: float = 10, top: int = 20, key: str = "lineno", x_admin_token: Optional[str] = Header(None)):
+        require_admin(x_admin_token)
+        if key not in ("lineno", "filename", "traceback"):
+            raise HTTPException(status_code=400, detail="key debe ser 'lineno', 'filename' o 'traceback'")
+        try:
+            return {"service": service, **memory_top(seconds, top, key)}
+        except ProfilerBusy:
+            raise HTTPException(status_code=409, detail="Ya hay un perfil de memoria en curso")
+
+    app.add_api_route("/debug/profile", profile, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/threads", threads, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/memory", memory, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,202 @@
+# common/tracing.py - Trazas por etapas con muestreo y exportación en segundo plano
+#
+# Propagación con la cabecera W3C `traceparent` y exportación en formato Zipkin v2
+# (JSON), a un fichero JSONL o a un colector HTTP (Zipkin, Jaeger, OTel Collector).
+#
+# Variables de entorno:
+#   TRACE_SAMPLE_RATE  fracción de consultas trazadas (por defecto 0.01)
+#   TRACE_EXPORT       "file:/ruta/traces.jsonl" | "http://collector:9411/api/v2/spans" | "off"
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    """trace_id del span muestreado activo (None si la consulta no se traza)"""
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+class _NoopSpan:
+    """Span vacío para consultas no muestreadas (coste casi nulo)"""
+
+    sampled = False
+
+    def set_tag(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    sampled = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str], tags: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.tags = {k: str(v) for k, v in tags.items()}
+        self._start_wall = 0.0
+        self._start = 0.0
+        self._token = None
+
+    def set_tag(self, key, value):
+        self.tags[key] = str(value)
+
+    def __enter__(self):
+        self._start_wall = time.time()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.tags["error"] = str(exc)
+        self.tracer._export(self, duration)
+        return False
+
+    def to_zipkin(self, duration: float) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": int(self._start_wall * 1_000_000),
+            "duration": max(1, int(duration * 1_000_000)),
+            "localEndpoint": {"serviceName": self.tracer.service},
+            "tags": self.tags,
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        return span
+
+
+_TRACEPARENT = re.compile(r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+
+
+def _parse_traceparent(header: Optional[str]):
+    """Devuelve (trace_id, parent_span_id, sampled) o None si la cabecera no es válida.
+    Una cabecera mal formada del cliente se ignora (W3C Trace Context): se empieza una traza nueva"""
+    if not header:
+        return None
+    match = _TRACEPARENT.fullmatch(header.strip())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, int(flags, 16) & 1 == 1
+
+
+class Tracer:
+    def __init__(self, service: str, sample_rate: Optional[float] = None, export: Optional[str] = None):
+        self.service = service
+        if sample_rate is None:
+            sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+        if export is None:
+            export = os.getenv("TRACE_EXPORT", f"file:/tmp/traces-{service}.jsonl")
+        self.sample_rate = sample_rate
+        self.export = export
+        self.enabled = export != "off" and sample_rate > 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=10000)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    # --- API de instrumentación ---
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, **tags):
+        """Span raíz: continúa la traza entrante o decide el muestreo localmente"""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = "%032x" % random.getrandbits(128), None
+            sampled = random.random() < self.sample_rate
+        if not sampled:
+            return NOOP_SPAN
+        return Span(self, name, trace_id, parent_id, tags)
+
+    def span(self, name: str, **tags):
+        """Span hijo del span activo; no-op si la consulta no está muestreada"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, tags)
+
+    def inject(self, headers: Optional[Dict] = None) -> Dict:
+        """Añade `traceparent` a las cabeceras salientes si hay un span muestreado activo"""
+        headers = {} if headers is None else headers
+        current = _current_span.get()
+        if current is not None:
+            headers[TRACEPARENT_HEADER] = f"00-{current.trace_id}-{current.span_id}-01"
+        return headers
+
+    # --- Exportación en segundo plano ---
+
+    def _export(self, span: Span, duration: float) -> None:
+        if self._worker is None:
+            self._start_worker()
+        try:
+            self._queue.put_nowait(span.to_zipkin(duration))
+        except queue.Full:
+            pass  # Nunca bloquear el camino de la consulta por las trazas
+
+    def _start_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(0.5)  # agrupar spans de la misma consulta
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning("⚠️ No se pudieron exportar %d spans: %.200s", len(batch), e)
+
+    def _write(self, batch) -> None:
+        if self.export.startswith("file:"):
+            with open(self.export[len("file:"):], "a", encoding="utf-8") as f:
+                for span in batch:
+                    f.write(json.dumps(span, ensure_ascii=False) + "\n")
+        elif self.export.startswith(("http://", "https://")):
+            req = urllib.request.Request(
+                self.export,
+                data=json.dumps(batch).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            urllib.request.urlopen(req, timeout=5).close()
@@ -0,0 +1,159 @@
+# common/transport.py - Transporte interno orquestador ↔ asistentes
+#
+# Esquemas tipados de petición/respuesta compartidos por el orquestador y los
+# wrappers de los asistentes, codificados en msgpack (binario, compacto) sobre
+# conexiones HTTP keep-alive. JSON sigue funcionando como alternativa: el cliente
+# lo negocia con Content-Type/Accept y baja a JSON si el servidor no entiende
+# msgpack (415) o si msgpack no está instalado.
+#
+# Variables de entorno:
+#   ASSISTANT_TRANSPORT  "msgpack" (por defecto) | "json"
+#   ASSISTANT_HTTP_POOL  conexiones keep-alive por asistente (16)
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+try:
+    import msgpack
+except ImportError:  # imagen sin msgpack: todo el tráfico va en JSON
+    msgpack = None
+
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+ASSISTANT_TRANSPORT = os.getenv("ASSISTANT_TRANSPORT", "msgpack")
+ASSISTANT_HTTP_POOL = int(os.getenv("ASSISTANT_HTTP_POOL", "16"))
+
+
+class UnsupportedMediaType(Exception):
+    """El cuerpo viene en un formato que este proceso no sabe decodificar"""
+
+
+def preferred_content_type() -> str:
+    return MSGPACK if ASSISTANT_TRANSPORT == "msgpack" and msgpack is not None else JSON
+
+
+def _is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(MSGPACK)
+
+
+def encode(payload: Dict, content_type: str) -> bytes:
+    if _is_msgpack(content_type):
+        if msgpack is None:
+            raise UnsupportedMediaType(content_type)
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(body: bytes, content_type: Optional[str]) -> Dict:
+    if not body:
+        return {}
+    if _is_msgpack(content_type):
+        if msgpack is None:
+            raise UnsupportedMediaType(content_type)
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+
+# --- Esquemas ---
+
+@dataclass
+class AssistantRequest:
+    query: str
+    context: Dict = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {"query": self.query, "context": self.context} if self.context else {"query": self.query}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AssistantRequest":
+        return cls(query=data.get("query") or "", context=data.get("context") or {})
+
+
+@dataclass
+class AssistantResponse:
+    response: str
+    status: str = "success"
+    language: Optional[str] = None
+    model: Optional[str] = None
+    metadata: Dict = field(default_factory=dict)
+    error: bool = False
+
+    def to_dict(self) -> Dict:
+        data = {"response": self.response, "status": self.status}
+        if self.language:
+            data["language"] = self.language
+        if self.model:
+            data["model"] = self.model
+        if self.metadata:
+            data["metadata"] = self.metadata
+        if self.error:
+            data["error"] = True
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "AssistantResponse":
+        """Acepta el esquema tipado y los formatos JSON históricos de cada asistente"""
+        if "output_data" in data:  # rule_based: {"task", "output_data": {"response", "status", "metadata"}}
+            output = data["output_data"]
+            return cls(response=output.get("response", "Sin respuesta"), status=output.get("status", "success"),
+                       metadata=output.get("metadata") or {})
+        if "response" in data:
+            return cls(response=data["response"], status=data.get("status", "success"),
+                       language=data.get("language"), model=data.get("model"),
+                       metadata=data.get("metadata") or {}, error=bool(data.get("error", False)))
+        return cls(response=str(data), status="unknown")  # Como fallback
+
+
+# --- Cliente (orquestador) ---
+
+class AssistantClient:
+    """POST /query a un asistente con conexiones keep-alive y el formato negociado"""
+
+    def __init__(self, base_url: str, pool_size: int = ASSISTANT_HTTP_POOL):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = f"{base_url}/query"
+        self.content_type = preferred_content_type()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def query(self, request: AssistantRequest, headers: Optional[Dict] = None,
+              timeout: float = 10) -> AssistantResponse:
+        content_type = self.content_type
+        r = self.session.post(self.url, data=encode(request.to_dict(), content_type), timeout=timeout,
+                              headers={**(headers or {}), "Content-Type": content_type,
+                                       "Accept": f"{content_type}, {JSON};q=0.5"})
+        if r.status_code == 415 and content_type != JSON:
+            # Servidor sin msgpack: JSON a partir de ahora para este asistente
+            self.content_type = JSON
+            return self.query(request, headers, timeout)
+        r.raise_for_status()
+        return AssistantResponse.from_dict(decode(r.content, r.headers.get("Content-Type")))
+
+
+# --- Servidor (wrappers FastAPI de los asistentes) ---
+
+async def read_request(request) -> AssistantRequest:
+    """Decodifica el cuerpo según Content-Type (sin pasar por request.json())"""
+    body = await request.body()
+    return AssistantRequest.from_dict(decode(body, request.headers.get("content-type")))
+
+
+def respond(request, response: AssistantResponse, legacy: Optional[Dict] = None, status_code: int = 200):
+    """Responde en msgpack si el cliente lo acepta; en JSON, con el formato histórico si se da"""
+    from fastapi.responses import Response
+
+    if msgpack is not None and MSGPACK in request.headers.get("accept", ""):
+        return Response(encode(response.to_dict(), MSGPACK), status_code=status_code, media_type=MSGPACK)
+    payload = legacy if legacy is not None else response.to_dict()
+    return Response(encode(payload, JSON), status_code=status_code, media_type=JSON)
+
+
+def unsupported_media_type():
+    from fastapi.responses import JSONResponse
+
+    return JSONResponse(status_code=415, content={"error": "unsupported_media_type", "accepts": [JSON]})
@@ -22,4 +22,63 @@ CREATE TABLE queries (
 );
 
 ALTER TABLE users ADD COLUMN rol VARCHAR(50);
-ALTER TABLE users ADD COLUMN nivel VARCHAR(50);
\ No newline at end of file
+ALTER TABLE users ADD COLUMN nivel VARCHAR(50);
+
+-- Rollups incrementales de métricas (se actualizan en log_metric)
+-- users_hll: sketch HyperLogLog (1024 registros) para usuarios distintos
+CREATE TABLE metrics_rollup_minute (
+    bucket TIMESTAMP NOT NULL,
+    assistant_type VARCHAR(50) NOT NULL,
+    total_queries BIGINT NOT NULL DEFAULT 0,
+    latency_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    latency_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    error_rate_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    failed_queries BIGINT NOT NULL DEFAULT 0,
+    users_hll BYTEA NOT NULL,
+    PRIMARY KEY (bucket, assistant_type)
+);
+
+CREATE TABLE metrics_rollup_day (
+    bucket DATE NOT NULL,
+    assistant_type VARCHAR(50) NOT NULL,
+    total_queries BIGINT NOT NULL DEFAULT 0,
+    latency_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    latency_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    error_rate_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    failed_queries BIGINT NOT NULL DEFAULT 0,
+    users_hll BYTEA NOT NULL,
+    PRIMARY KEY (bucket, assistant_type)
+);
+
+-- Captura de tráfico (CAPTURE_TRAFFIC=db) para reproducir carga real
+ALTER TABLE queries ADD COLUMN route VARCHAR(50);
+ALTER TABLE queries ADD COLUMN assistant_type VARCHAR(50);
+ALTER TABLE queries ADD COLUMN latency FLOAT;
+ALTER TABLE queries ADD COLUMN outcome VARCHAR(20);
+CREATE INDEX idx_queries_timestamp ON queries (timestamp);
+
+-- Tokens y tiempos de Ollama por consulta (NULL si no la respondió Ollama)
+ALTER TABLE metrics ADD COLUMN route VARCHAR(50);
+ALTER TABLE metrics ADD COLUMN model VARCHAR(100);
+ALTER TABLE metrics ADD COLUMN prompt_tokens INTEGER;
+ALTER TABLE metrics ADD COLUMN completion_tokens INTEGER;
+ALTER TABLE metrics ADD COLUMN prompt_eval_seconds DOUBLE PRECISION;
+ALTER TABLE metrics ADD COLUMN eval_seconds DOUBLE PRECISION;
+ALTER TABLE metrics ADD COLUMN load_seconds DOUBLE PRECISION;
+-- Exportación por rangos de tiempo (/metrics/export, export.py)
+CREATE INDEX idx_metrics_timestamp ON metrics (timestamp);
+
+-- Rollup diario de generación por ruta y modelo (una fila por llamada a Ollama, niveles de cascada incluidos)
+CREATE TABLE generation_rollup_day (
+    bucket DATE NOT NULL,
+    route VARCHAR(50) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    calls BIGINT NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    prompt_eval_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    eval_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    load_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cold_loads BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, route, model)
+);
@@ -0,0 +1 @@
+# loadtest/ - Herramientas de captura, reproducción y stubs de carga
@@ -0,0 +1,187 @@
+# loadtest/replay.py - Reproduce el tráfico capturado contra el orquestador
+#
+# Ejemplos:
+#   # Contra un orquestador desplegado (HTTP), al doble de velocidad
+#   python loadtest/replay.py --source /tmp/traffic.jsonl --speed 2 --target http://localhost:8000
+#
+#   # En proceso, con stubs locales de Ollama/QA (sin red ni GPU; necesita la BD)
+#   python loadtest/replay.py --source db --speed 100 --in-process --ollama-latency lognormal:2,0.6
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loadtest.stubs import add_stub_arguments, start_stubs  # noqa: E402
+
+_ASSISTANT_RE = re.compile(r"\(Asistente usado: (.+?) • Tiempo")
+
+
+def load_events(source: str, limit: int = 0) -> List[Dict]:
+    """Lee eventos capturados de un fichero JSONL o de la tabla queries ('db')"""
+    if source == "db":
+        sys.path.insert(0, os.path.join(ROOT, "orchestrator"))
+        from db_utils import get_db_connection
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT EXTRACT(EPOCH FROM timestamp), username, query, route, latency
+            FROM queries ORDER BY timestamp
+        """ + (" LIMIT %d" % limit if limit else ""))
+        events = [
+            {"ts": float(ts), "username": user or "anonymous", "query": query, "route": route, "latency": latency}
+            for ts, user, query, route, latency in cur.fetchall()
+        ]
+        cur.close()
+        conn.close()
+        return events
+    events = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                events.append(json.loads(line))
+                if limit and len(events) >= limit:
+                    break
+    events.sort(key=lambda e: e["ts"])
+    return events
+
+
+def http_sender(target: str, timeout: float, admin_token: str = "") -> Callable[[Dict], str]:
+    # Con X-Admin-Token el orquestador no aplica los límites de ritmo: se reproduce a 100x
+    # el tráfico de muchos usuarios, no el de uno que dispara en bucle
+    headers = {"Content-Type": "application/json"}
+    if admin_token:
+        headers["X-Admin-Token"] = admin_token
+
+    def send(event: Dict) -> str:
+        body = json.dumps({"query": event["query"], "username": event.get("username", "anonymous")}).encode("utf-8")
+        req = urllib.request.Request(f"{target}/query", data=body, headers=headers)
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return json.loads(r.read())
+    return send
+
+
+def in_process_sender() -> Callable[[Dict], str]:
+    sys.path.insert(0, os.path.join(ROOT, "orchestrator"))
+    from main import orchestrate
+    return lambda event: orchestrate(event["query"], event.get("username", "anonymous"), rate_limited=False)
+
+
+def classify(response: str) -> str:
+    match = _ASSISTANT_RE.search(response or "")
+    if not match:
+        return "unknown"
+    assistant = match.group(1)
+    if "emergencia" in assistant:
+        return "emergency"
+    if "(fallback)" in assistant:
+        return "fallback"
+    return "primary"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def replay(events: List[Dict], send: Callable[[Dict], str], speed: float, concurrency: int) -> Dict:
+    """Envía cada evento respetando los intervalos originales divididos por `speed`"""
+    results = []
+    lock = threading.Lock()
+    max_lag = 0.0
+
+    def run(event):
+        start = time.perf_counter()
+        try:
+            outcome = classify(send(event))
+        except Exception:
+            outcome = "error"
+        latency = time.perf_counter() - start
+        with lock:
+            results.append((event, outcome, latency))
+
+    t0 = events[0]["ts"]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for event in events:
+            due = start + (event["ts"] - t0) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            pool.submit(run, event)
+    elapsed = time.perf_counter() - start
+
+    latencies = [lat for _, outcome, lat in results if outcome != "error"]
+    outcomes = Counter(outcome for _, outcome, _ in results)
+    recorded = [e["latency"] for e in events if e.get("latency") is not None]
+    by_route = {}
+    for event, outcome, lat in results:
+        stats = by_route.setdefault(event.get("route") or "?", {"count": 0, "latencies": []})
+        stats["count"] += 1
+        stats["latencies"].append(lat)
+    return {
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0,
+        "latency_s": {q: round(percentile(latencies, p), 4) for q, p in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "recorded_latency_s": {q: round(percentile(recorded, p), 4) for q, p in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "fallback_rate": round(outcomes["fallback"] / len(results), 4) if results else 0,
+        "emergency_rate": round(outcomes["emergency"] / len(results), 4) if results else 0,
+        "error_rate": round(outcomes["error"] / len(results), 4) if results else 0,
+        "max_schedule_lag_s": round(max_lag, 3),
+        "by_route": {
+            route: {"count": s["count"], "p95_s": round(percentile(s["latencies"], .95), 4)}
+            for route, s in by_route.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce tráfico capturado contra el orquestador")
+    parser.add_argument("--source", default=os.getenv("CAPTURE_FILE", "/tmp/traffic.jsonl"),
+                        help="fichero JSONL capturado o 'db' para la tabla queries")
+    parser.add_argument("--speed", type=float, default=1.0, help="1, 10, 100... veces la velocidad original")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--target", default="http://localhost:8000")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--admin-token", default=os.getenv("ADMIN_TOKEN", ""),
+                        help="X-Admin-Token del orquestador: sin él, los límites de ritmo frenan la reproducción")
+    parser.add_argument("--in-process", action="store_true",
+                        help="llama a orchestrate() directamente con stubs locales de Ollama y asistentes")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    events = load_events(args.source, args.limit)
+    if not events:
+        print("No hay tráfico capturado que reproducir")
+        return
+    if args.in_process:
+        urls = start_stubs(args.ollama_latency, args.qa_latency, args.rule_latency,
+                           args.error_rate, args.models.split(","))
+        os.environ.update(urls)
+        os.environ["OLLAMA_HOST"] = urls["OLLAMA_URL"]
+        send = in_process_sender()
+    else:
+        send = http_sender(args.target, args.timeout, args.admin_token)
+
+    print(f"▶️ Reproduciendo {len(events)} consultas a {args.speed}x")
+    report = replay(events, send, args.speed, args.concurrency)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
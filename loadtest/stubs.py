@@ -0,0 +1,275 @@
+# loadtest/stubs.py - Servidores locales que sustituyen a Ollama y a los asistentes
+#
+# Permiten medir la capacidad del orquestador sin red ni GPU. Cada servidor responde
+# con una latencia sacada de una distribución configurable:
+#   const:0.05 | uniform:0.01,0.2 | exp:0.5 | lognormal:<mediana>,<sigma> | normal:<media>,<desv>
+#
+# Uso: python loadtest/stubs.py --ollama-latency lognormal:2,0.6 --qa-latency uniform:0.1,0.4
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Los stubs de los asistentes negocian msgpack/JSON igual que los wrappers reales
+from common.transport import JSON, MSGPACK, decode, encode, msgpack  # noqa: E402
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Convierte 'tipo:a,b' en una función que devuelve segundos"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "const":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    raise ValueError(f"Distribución de latencia desconocida: {spec}")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo van en dos write(): con keep-alive, Nagle + ACK retardado añadían
+    # ~40 ms a cada respuesta (uvicorn, el servidor real, ya usa TCP_NODELAY)
+    disable_nagle_algorithm = True
+    routes: Dict[Tuple[str, str], Callable[[Dict], Dict]] = {}
+    latency: Callable[[], float] = staticmethod(lambda: 0.0)
+    error_rate: float = 0.0
+
+    def log_message(self, format, *args):
+        pass  # silencio: miles de peticiones por segundo
+
+    def _reply(self, status: int, body: Dict) -> None:
+        content_type = MSGPACK if msgpack is not None and MSGPACK in self.headers.get("Accept", "") else JSON
+        data = encode(body, content_type)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = decode(self.rfile.read(length), self.headers.get("Content-Type")) if length else {}
+        handler = self.routes.get((method, self.path.split("?")[0]))
+        if handler is None:
+            self._reply(404, {"error": "not found"})
+            return
+        if method == "POST":
+            time.sleep(self.latency())
+            if random.random() < self.error_rate:
+                self._reply(500, {"error": "stub: error inyectado"})
+                return
+        self._reply(200, handler(payload))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+def _ollama_routes(models: List[str]) -> Dict:
+    def stats(prompt: str, text: str) -> Dict:
+        return {
+            "done": True,
+            "total_duration": 0,
+            "load_duration": 0,
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "prompt_eval_duration": 0,
+            "eval_count": max(1, len(text) // 4),
+            "eval_duration": 0,
+        }
+
+    def chat(payload):
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        text = "Respuesta simulada del modelo de lenguaje para pruebas de carga."
+        return {"model": payload.get("model"), "message": {"role": "assistant", "content": text},
+                **stats(prompt, text)}
+
+    def generate(payload):
+        prompt = payload.get("prompt", "")
+        text = "Respuesta simulada del modelo de lenguaje para pruebas de carga."
+        context = list(payload.get("context") or []) + list(range(len(prompt) // 4 + len(text) // 4))
+        return {"model": payload.get("model"), "response": text, "context": context,
+                **stats(prompt, text)}
+
+    return {
+        ("GET", "/api/tags"): lambda _: {"models": [{"name": f"{m}:latest", "model": f"{m}:latest"} for m in models]},
+        ("GET", "/api/ps"): lambda _: {"models": [{"name": f"{m}:latest"} for m in models]},
+        ("POST", "/api/chat"): chat,
+        ("POST", "/api/generate"): generate,
+    }
+
+
+def _qa_routes() -> Dict:
+    return {
+        ("GET", "/"): lambda _: {"message": "QA stub", "status": "ok"},
+        ("GET", "/health"): lambda _: {"status": "healthy", "service": "qa_stub"},
+        ("POST", "/query"): lambda p: {"response": f"Respuesta simulada a: {p.get('query', '')}",
+                                       "language": "es", "model": "stub"},
+    }
+
+
+def _rule_routes() -> Dict:
+    return {
+        ("GET", "/"): lambda _: {"message": "Rule-based stub", "status": "ok"},
+        ("GET", "/health"): lambda _: {"status": "healthy", "service": "rule_stub"},
+        ("POST", "/query"): lambda p: {"task": "explain_basic",
+                                       "output_data": {"response": "¡Hola! Respuesta de reglas simulada.",
+                                                       "status": "success", "metadata": {}}},
+    }
+
+
+def start_stub(name: str, routes: Dict, port: int, latency: str, error_rate: float = 0.0,
+               host: str = "127.0.0.1") -> Tuple[ThreadingHTTPServer, str]:
+    """Arranca un servidor stub en un hilo y devuelve (servidor, url base)"""
+    handler = type(f"{name}Handler", (_StubHandler,), {
+        "routes": routes,
+        "latency": staticmethod(parse_latency(latency)),
+        "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"stub-{name}", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def start_stubs(ollama_latency: str = "lognormal:1.5,0.5", qa_latency: str = "uniform:0.05,0.3",
+                rule_latency: str = "const:0.002", error_rate: float = 0.0,
+                models: List[str] = ("phi", "tinyllama"), ports: Tuple[int, int, int] = (0, 0, 0)) -> Dict[str, str]:
+    """Arranca los tres stubs (puerto 0 = libre) y devuelve las URLs para el orquestador"""
+    _, ollama_url = start_stub("ollama", _ollama_routes(list(models)), ports[0], ollama_latency, error_rate)
+    _, qa_url = start_stub("qa", _qa_routes(), ports[1], qa_latency, error_rate)
+    _, rule_url = start_stub("rule", _rule_routes(), ports[2], rule_latency, error_rate)
+    return {"OLLAMA_URL": ollama_url, "DEEPPAVLOV_URL": qa_url, "RULE_BASED_URL": rule_url}
+
+
+class _RespHandler(StreamRequestHandler):
+    """Subconjunto de Redis (RESP2) que usa orchestrator/state.py: GET, SET [PX|EX], INCR(BY), PEXPIRE, DEL
+    y EVAL (solo el script del token bucket, RedisStore._TAKE_SCRIPT, reproducido aquí sin Lua)"""
+
+    data: Dict[bytes, Tuple[bytes, float]] = {}
+    lock = threading.Lock()
+    disable_nagle_algorithm = True
+
+    def _read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            size = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def _live(self, key: bytes):
+        item = self.data.get(key)
+        if item is not None and item[1] and item[1] < time.time():
+            del self.data[key]
+            return None
+        return item
+
+    def _execute(self, args) -> bytes:
+        cmd = args[0].upper()
+        with self.lock:
+            if cmd in (b"PING", b"SELECT", b"AUTH"):
+                return b"+OK\r\n" if cmd != b"PING" else b"+PONG\r\n"
+            if cmd == b"GET":
+                item = self._live(args[1])
+                return b"$-1\r\n" if item is None else b"$%d\r\n%s\r\n" % (len(item[0]), item[0])
+            if cmd == b"SET":
+                expires_at = 0.0
+                if len(args) >= 5 and args[3].upper() in (b"PX", b"EX"):
+                    scale = 1000 if args[3].upper() == b"PX" else 1
+                    expires_at = time.time() + int(args[4]) / scale
+                self.data[args[1]] = (args[2], expires_at)
+                return b"+OK\r\n"
+            if cmd in (b"INCR", b"INCRBY"):
+                item = self._live(args[1])
+                value = int(item[0]) + (int(args[2]) if cmd == b"INCRBY" else 1) if item else \
+                    (int(args[2]) if cmd == b"INCRBY" else 1)
+                self.data[args[1]] = (str(value).encode(), item[1] if item else 0.0)
+                return b":%d\r\n" % value
+            if cmd == b"PEXPIRE":
+                item = self._live(args[1])
+                if item is None:
+                    return b":0\r\n"
+                self.data[args[1]] = (item[0], time.time() + int(args[2]) / 1000)
+                return b":1\r\n"
+            if cmd == b"EVAL":
+                # EVAL script 1 key now intervalo tolerancia
+                now, interval, tolerance = (float(arg) for arg in args[4:7])
+                item = self._live(args[3])
+                tat = max(float(item[0]) if item else now, now) + interval
+                wait = tat - now - tolerance
+                if wait > 0:
+                    return b"$%d\r\n%s\r\n" % (len(repr(wait)), repr(wait).encode())
+                self.data[args[3]] = (repr(tat).encode(), tat)
+                return b"$1\r\n0\r\n"
+            if cmd == b"DEL":
+                removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+                return b":%d\r\n" % removed
+        return b"-ERR comando no soportado por el stub\r\n"
+
+    def handle(self):
+        while True:
+            args = self._read_command()
+            if not args:
+                return
+            self.wfile.write(self._execute(args))
+
+
+def start_resp_stub(port: int = 0, host: str = "127.0.0.1") -> Tuple[ThreadingTCPServer, str]:
+    """Servidor RESP en memoria para probar STATE_STORE=redis://... sin Redis"""
+    handler = type("RespHandler", (_RespHandler,), {"data": {}, "lock": threading.Lock()})
+    ThreadingTCPServer.allow_reuse_address = True
+    server = ThreadingTCPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-resp", daemon=True).start()
+    return server, f"redis://{host}:{server.server_address[1]}/0"
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ollama-latency", default="lognormal:1.5,0.5")
+    parser.add_argument("--qa-latency", default="uniform:0.05,0.3")
+    parser.add_argument("--rule-latency", default="const:0.002")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 500")
+    parser.add_argument("--models", default="phi,tinyllama")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stubs locales de Ollama y asistentes")
+    add_stub_arguments(parser)
+    parser.add_argument("--ollama-port", type=int, default=11434)
+    parser.add_argument("--qa-port", type=int, default=5002)
+    parser.add_argument("--rule-port", type=int, default=5001)
+    parser.add_argument("--redis-port", type=int, default=None, help="arranca también un stand-in de Redis")
+    args = parser.parse_args()
+    urls = start_stubs(args.ollama_latency, args.qa_latency, args.rule_latency, args.error_rate,
+                       args.models.split(","), (args.ollama_port, args.qa_port, args.rule_port))
+    if args.redis_port is not None:
+        _, urls["STATE_STORE"] = start_resp_stub(args.redis_port)
+    print("Stubs activos. Arranca el orquestador con:")
+    for key, url in urls.items():
+        print(f"  export {key}={url}")
+    print(f"  export OLLAMA_HOST={urls['OLLAMA_URL']}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
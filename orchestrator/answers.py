@@ -0,0 +1,146 @@
+# orchestrator/answers.py - Respuestas precalculadas (ver precompute.py)
+#
+# Cada ejecución del job escribe una versión nueva e inmutable del almacén:
+#   ANSWER_STORE_DIR/answers-<versión>.json.gz   {"format", "version", "created_at", "meta", "answers"}
+#   ANSWER_STORE_DIR/CURRENT                      nombre del fichero de la versión activa
+# "answers" es {clave: [respuesta, asistente, ruta]}, con la clave sin tildes, mayúsculas ni
+# signos, de modo que "¿Qué es la fotosíntesis?" y "que es la fotosintesis" comparten respuesta.
+#
+# El orquestador carga la versión activa al arrancar y, como mucho cada ANSWER_STORE_CHECK
+# segundos, mira si CURRENT ha cambiado: el job no necesita reiniciar a nadie.
+#
+# Variables de entorno:
+#   ANSWER_STORE_DIR    directorio del almacén (vacío = desactivado)
+#   ANSWER_STORE_CHECK  segundos entre comprobaciones de versión nueva (30)
+#   ANSWER_STORE_KEEP   versiones antiguas que se conservan para volver atrás (3)
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from telemetry import telemetry
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+ANSWER_STORE_DIR = os.getenv("ANSWER_STORE_DIR", "")
+ANSWER_STORE_CHECK = float(os.getenv("ANSWER_STORE_CHECK", "30"))
+ANSWER_STORE_KEEP = int(os.getenv("ANSWER_STORE_KEEP", "3"))
+FORMAT_VERSION = 1
+POINTER = "CURRENT"
+
+telemetry.describe("edu_precomputed_answers", "gauge", "Respuestas precalculadas cargadas en este worker")
+
+_WORD = re.compile(r"\w+")
+
+
+def answer_key(text: str) -> str:
+    """Clave de búsqueda: palabras en minúsculas y sin tildes, separadas por un espacio"""
+    text = "".join(c for c in unicodedata.normalize("NFD", (text or "").lower())
+                   if unicodedata.category(c) != "Mn")
+    return " ".join(_WORD.findall(text))
+
+
+def write_answers(answers: Dict[str, List[str]], directory: str = ANSWER_STORE_DIR,
+                  meta: Optional[Dict] = None, keep: int = ANSWER_STORE_KEEP) -> str:
+    """Escribe una versión nueva, la activa (CURRENT) y borra las que sobran; devuelve la ruta"""
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now().strftime("%Y%m%dT%H%M%S")
+    name = f"answers-{version}.json.gz"
+    path = os.path.join(directory, name)
+    payload = {"format": FORMAT_VERSION, "version": version, "created_at": datetime.now().isoformat(),
+               "meta": meta or {}, "answers": answers}
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=9) as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+    pointer_tmp = os.path.join(directory, f"{POINTER}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(pointer_tmp, os.path.join(directory, POINTER))  # los lectores ven la versión vieja o la nueva
+    versions = sorted(n for n in os.listdir(directory) if n.startswith("answers-") and n.endswith(".json.gz"))
+    for old in versions[:-(keep + 1)]:
+        os.remove(os.path.join(directory, old))
+    return path
+
+
+class AnswerStore:
+    """Versión activa del almacén en memoria: get() es un acceso a un dict"""
+
+    def __init__(self, directory: str = ANSWER_STORE_DIR, check_interval: float = ANSWER_STORE_CHECK):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.check_interval = check_interval
+        self.version: Optional[str] = None
+        self._answers: Dict[str, List[str]] = {}
+        self._pointer_mtime = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> bool:
+        """(Re)carga la versión de CURRENT si cambió; True si hay una versión nueva en memoria"""
+        if not self.enabled:
+            return False
+        pointer = os.path.join(self.directory, POINTER)
+        try:
+            mtime = os.stat(pointer).st_mtime
+            if mtime == self._pointer_mtime:
+                return False
+            with open(pointer, encoding="utf-8") as f:
+                name = f.read().strip()
+            with gzip.open(os.path.join(self.directory, name), "rt", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error("❌ No se pudo cargar el almacén de respuestas de %s: %.200s", self.directory, e,
+                         extra=log_event("answers.load_failed"))
+            return False
+        if payload.get("format") != FORMAT_VERSION:
+            logger.warning("⚠️ %s: formato %s no soportado (se espera %s)", name, payload.get("format"), FORMAT_VERSION,
+                           extra=log_event("answers.bad_format"))
+            return False
+        self._answers = payload["answers"]  # se sustituye la referencia: los lectores no necesitan lock
+        self.version = payload["version"]
+        self._pointer_mtime = mtime
+        telemetry.set_gauge("edu_precomputed_answers", len(self._answers))
+        logger.info("📚 %d respuestas precalculadas cargadas (versión %s)", len(self._answers), self.version,
+                    extra=log_event("answers.loaded", version=self.version))
+        return True
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = now
+            self.load()
+        finally:
+            self._lock.release()
+
+    def get(self, query: str) -> Optional[Dict]:
+        """{"response", "assistant", "route"} si la consulta está precalculada"""
+        if not self.enabled:
+            return None
+        self._maybe_reload()
+        entry = self._answers.get(answer_key(query))
+        if entry is None:
+            return None
+        response, assistant, route = entry
+        return {"response": response, "assistant": assistant, "route": route}
+
+    def entries(self) -> Dict[str, List[str]]:
+        return self._answers
+
+    def info(self) -> Dict:
+        return {"enabled": self.enabled, "version": self.version, "answers": len(self._answers)}
+
+
+# Instancia global
+answer_store = AnswerStore()
@@ -1,14 +1,26 @@
 # orchestrator/api.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+import hmac
+import os
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from main import orchestrate 
+from main import orchestrate, health_poller, model_manager
+from sessions import session_store
 from db_utils import get_db_connection
-import requests
-from datetime import datetime
+from sketches import hll_estimate, hll_merge
+from telemetry import telemetry
+from dashboard import DashboardCache
+from common.deadline import Deadline, DEADLINE_HEADER
+from common.logs import log_event
+from wrappers import registry
+from scheduler import BATCH_ROLE, RateLimited, scheduler
+from answers import answer_store
+from common.profiling import add_profiling_routes
+import export
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -25,10 +37,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_profiling_routes(app, "orchestrator")  # /debug/*: solo con X-Admin-Token
 
 class QueryRequest(BaseModel):
     query: str
     username: str = "anonymous"
+    session_id: Optional[str] = None  # conversación multi-turno (contexto en el servidor)
+
+class BatchRequest(BaseModel):
+    assistant: str
+    queries: List[str]
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))
+# /batch es solo para administración (cabecera X-Admin-Token); vacío = desactivado.
+# En /query, la misma cabecera exime de los límites de ritmo (reproducción de tráfico)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Desactivado (ADMIN_TOKEN vacío)")
+    if not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Se necesita la cabecera X-Admin-Token")
 
 @app.get("/")
 async def root():
@@ -37,96 +66,122 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "POST /query": "Procesar consulta",
+            "POST /batch": "Procesar muchas consultas con un mismo asistente (X-Admin-Token)",
             "GET /health": "Estado del sistema",
             "GET /metrics": "Obtener métricas",
-            "GET /stats": "Estadísticas generales"
+            "GET /metrics/export": "Métricas de un rango en Arrow IPC o Parquet (streaming)",
+            "GET /metrics/generation": "Tokens y tokens/s de Ollama por ruta y modelo",
+            "GET /metrics/prometheus": "Histogramas de latencia (formato Prometheus)",
+            "GET /stats": "Estadísticas generales",
+            "GET /dashboard": "Salud + estadísticas + métricas 7d precalculadas (ETag)",
+            "GET /scheduler": "Colas justas por backend y esperas por usuario",
+            "GET /answers": "Versión activa del almacén de respuestas precalculadas",
+            "DELETE /sessions/{session_id}": "Olvidar una conversación",
+            "GET /debug/profile|threads|memory": "Perfilado bajo demanda (cabecera X-Admin-Token)"
         }
     }
 
+@app.on_event("startup")
+async def start_background_tasks():
+    health_poller.start()
+    model_manager.start()  # precarga en segundo plano: no retrasa el arranque
+    dashboard.start()
+    answer_store.load()  # respuestas precalculadas (ANSWER_STORE_DIR); después se recargan solas
+
 @app.get("/health")
 async def health_check():
-    """Health check simple pero funcional"""
-    try:
-        # Verificar servicios básicos
-        services_status = {}
-        
-        # Verificar rule_based
-        try:
-            rule_response = requests.get("http://rule_based:5001/", timeout=2)
-            services_status["rule_based"] = "healthy" if rule_response.status_code == 200 else "unhealthy"
-        except:
-            services_status["rule_based"] = "unreachable"
-        
-        # Verificar deeppavlov
-        try:
-            dp_response = requests.get("http://deeppavlov_nlu:5002/", timeout=2)
-            services_status["deeppavlov"] = "healthy" if dp_response.status_code == 200 else "unhealthy"
-        except:
-            services_status["deeppavlov"] = "unreachable"
-        
-        # Verificar ollama
-        try:
-            ollama_response = requests.get("http://ollama:11434/api/tags", timeout=2)
-            services_status["ollama"] = "healthy" if ollama_response.status_code == 200 else "unhealthy"
-        except:
-            services_status["ollama"] = "unreachable"
-        
-        # Verificar base de datos
-        try:
-            conn = get_db_connection()
-            conn.close()
-            db_status = "healthy"
-        except:
-            db_status = "unhealthy"
-        
-        # Determinar estado general
-        all_healthy = all("healthy" in status for status in services_status.values())
-        
-        return {
-            "status": "healthy" if all_healthy else "degraded",
-            "timestamp": datetime.now().isoformat(),
-            "services": services_status,
-            "database": db_status
-        }
-        
-    except Exception as e:
-        return {
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-}
+    """Estado del sistema: devuelve la última instantánea del sondeo en segundo plano"""
+    return health_poller.snapshot()
+
 @app.post("/query")
-async def process_query(request: QueryRequest):
-    """Endpoint principal para procesar consultas"""
+def process_query(request: QueryRequest, traceparent: Optional[str] = Header(None),
+                  deadline_ms: Optional[str] = Header(None, alias=DEADLINE_HEADER),
+                  x_admin_token: Optional[str] = Header(None)):
+    """Endpoint principal para procesar consultas (síncrono: orchestrate bloquea, corre en el threadpool)"""
+    # Con X-Admin-Token (loadtest/replay.py) no se aplican los límites de ritmo
+    rate_limited = not (ADMIN_TOKEN and x_admin_token and hmac.compare_digest(x_admin_token, ADMIN_TOKEN))
     try:
-        logger.info(f"📥 Consulta de '{request.username}': {request.query}")
-        result = orchestrate(request.query, request.username)
+        logger.info("📥 Consulta de '%s': %.200s", request.username, request.query,
+                    extra=log_event("query.received"))
+        deadline = Deadline.from_headers({DEADLINE_HEADER: deadline_ms}) if deadline_ms else None
+        result = orchestrate(request.query, request.username, traceparent, request.session_id, deadline,
+                             rate_limited)
         return result
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=f"Demasiadas consultas seguidas. {e}",
+                            headers={"Retry-After": str(max(1, round(e.retry_after)))})
     except Exception as e:
-        logger.error(f"❌ Error en endpoint /query: {e}")
+        logger.error("❌ Error en endpoint /query: %.200s", e, extra=log_event("api.error", endpoint="/query"))
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/batch")
+def process_batch(request: BatchRequest, x_admin_token: Optional[str] = Header(None)):
+    """Inferencia por lotes a través del registro de wrappers (síncrono: corre en el threadpool)"""
+    require_admin(x_admin_token)
+    if request.assistant not in registry.names():
+        raise HTTPException(status_code=400, detail=f"assistant debe ser uno de: {', '.join(registry.names())}")
+    if len(request.queries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_SIZE} consultas por lote")
+    try:
+        # Con el peso mínimo en la cola justa: un lote no adelanta a las consultas interactivas
+        with scheduler.requester(f"batch:{request.assistant}", BATCH_ROLE):
+            results = registry.process_batch(request.assistant, request.queries)
+    except ImportError as e:
+        # nlu/ml necesitan spacy/scikit-learn, que no van en la imagen mínima del orquestador
+        raise HTTPException(status_code=503, detail=f"{request.assistant} no disponible: {e}")
+    except Exception as e:
+        logger.error("❌ Error en endpoint /batch: %.200s", e, extra=log_event("api.error", endpoint="/batch"))
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "assistant": request.assistant,
+        "total": len(results),
+        "failed": sum(1 for _, _, error_rate in results if error_rate),
+        "results": [
+            {"response": output, "latency": latency, "error_rate": error_rate}
+            for output, latency, error_rate in results
+        ],
+    }
+
+@app.get("/scheduler")
+async def get_scheduler(top: int = 20):
+    """Plazas por backend y los usuarios con más espera en la cola justa (este worker)"""
+    return scheduler.snapshot(top)
+
+@app.get("/answers")
+async def get_answers():
+    """Versión del almacén de respuestas precalculadas cargada en este worker"""
+    return answer_store.info()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Libera el historial y el contexto de Ollama de una conversación"""
+    return {"session_id": session_id, "deleted": session_store.delete(session_id)}
+
 @app.get("/metrics")
-async def get_metrics(days: int = 7):
-    """Obtener métricas detalladas"""
+def get_metrics(days: int = 7, granularity: str = "day"):
+    """Obtener métricas detalladas (leídas de los rollups, no de la tabla cruda)"""
+    if granularity not in ("day", "minute"):
+        raise HTTPException(status_code=400, detail="granularity debe ser 'day' o 'minute'")
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         
-        cur.execute("""
-            SELECT 
-                assistant_type,
-                COUNT(*) as total_queries,
-                AVG(latency) as avg_latency,
-                AVG(error_rate) as avg_error_rate,
-                COUNT(CASE WHEN error_rate > 0 THEN 1 END) as failed_queries,
-                COUNT(DISTINCT user_id) as unique_users,
-                DATE(timestamp) as date
-            FROM metrics
-            WHERE timestamp >= NOW() - INTERVAL '%s days'
-            GROUP BY assistant_type, DATE(timestamp)
-            ORDER BY date DESC, assistant_type
-        """, (days,))
+        if granularity == "day":
+            cur.execute("""
+                SELECT assistant_type, total_queries, latency_sum, error_rate_sum,
+                       failed_queries, users_hll, bucket
+                FROM metrics_rollup_day
+                WHERE bucket > CURRENT_DATE - %s
+                ORDER BY bucket DESC, assistant_type
+            """, (days,))
+        else:
+            cur.execute("""
+                SELECT assistant_type, total_queries, latency_sum, error_rate_sum,
+                       failed_queries, users_hll, bucket
+                FROM metrics_rollup_minute
+                WHERE bucket >= LOCALTIMESTAMP - %s * INTERVAL '1 day'
+                ORDER BY bucket DESC, assistant_type
+            """, (days,))
         
         rows = cur.fetchall()
         cur.close()
@@ -134,19 +189,20 @@ async def get_metrics(days: int = 7):
         
         # Convertir a diccionarios
         metrics = []
-        for row in rows:
+        for assistant_type, count, latency_sum, error_sum, failed, users_hll, bucket in rows:
             metrics.append({
-                "assistant_type": row[0],
-                "total_queries": row[1],
-                "avg_latency_ms": float(row[2]) if row[2] else 0,
-                "avg_error_rate": float(row[3]) if row[3] else 0,
-                "failed_queries": row[4],
-                "unique_users": row[5],
-                "date": str(row[6]) if row[6] else None
+                "assistant_type": assistant_type,
+                "total_queries": count,
+                "avg_latency_ms": latency_sum * 1000 / count if count else 0,
+                "avg_error_rate": error_sum / count if count else 0,
+                "failed_queries": failed,
+                "unique_users": hll_estimate(users_hll),
+                "date": str(bucket) if bucket else None
             })
         
         return {
             "period_days": days,
+            "granularity": granularity,
             "total_metrics": len(metrics),
             "metrics": metrics
         }
@@ -155,68 +211,116 @@ async def get_metrics(days: int = 7):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/metrics/export")
+def export_metrics(source: str = "rollup_day", start: Optional[str] = None, end: Optional[str] = None,
+                   days: int = 7, format: str = "arrow"):
+    """Rango de métricas en formato columnar, leído y enviado por bloques (memoria acotada)"""
+    if export.pa is None:
+        raise HTTPException(status_code=501, detail="pyarrow no está instalado en el orquestador")
+    if source not in export.SOURCES:
+        raise HTTPException(status_code=400, detail=f"source debe ser uno de {sorted(export.SOURCES)}")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de {sorted(export.FORMATS)}")
+    try:
+        start_dt, end_dt = export.time_range(start, end, days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, extension = export.FORMATS[format]
+    filename = f"{source}_{start_dt:%Y%m%d}_{end_dt:%Y%m%d}.{extension}"
+    return StreamingResponse(export.stream_export(export.SOURCES[source], start_dt, end_dt, format),
+                             media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@app.get("/metrics/generation")
+def get_generation_metrics(days: int = 7):
+    """Coste de generación por ruta y modelo: tokens, velocidad y carga del modelo por separado"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        # SUM de BIGINT es numeric (Decimal en psycopg2): ::bigint para operarlo con los float
+        cur.execute("""
+            SELECT route, model, SUM(calls)::bigint, SUM(prompt_tokens)::bigint, SUM(completion_tokens)::bigint,
+                   SUM(prompt_eval_seconds), SUM(eval_seconds), SUM(load_seconds), SUM(cold_loads)::bigint
+            FROM generation_rollup_day
+            WHERE bucket > CURRENT_DATE - %s
+            GROUP BY route, model
+            ORDER BY SUM(completion_tokens) DESC
+        """, (days,))
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    generation = []
+    for route, model, calls, prompt, completion, prompt_s, eval_s, load_s, cold in rows:
+        generation.append({
+            "route": route,
+            "model": model,
+            "calls": calls,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "avg_prompt_tokens": round(prompt / calls, 1) if calls else 0,
+            "avg_completion_tokens": round(completion / calls, 1) if calls else 0,
+            # Velocidades sin la carga del modelo: eval_count / eval_duration como en Ollama
+            "prompt_tokens_per_second": round(prompt / prompt_s, 1) if prompt_s else None,
+            "tokens_per_second": round(completion / eval_s, 1) if eval_s else None,
+            "avg_generation_ms": round(eval_s * 1000 / calls, 1) if calls else 0,
+            "load_seconds": round(load_s, 2),
+            "cold_loads": cold,
+        })
+    return {"period_days": days, "generation": generation}
+
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Percentiles, errores y colas en memoria para el scrape de Prometheus (sin tocar la BD)"""
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/stats")
-async def get_stats():
-    """Obtener estadísticas generales"""
+def get_stats():
+    """Obtener estadísticas generales a partir de los rollups diarios"""
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Total de consultas
-        cur.execute("SELECT COUNT(*) as total FROM metrics")
-        total_result = cur.fetchone()
-        total = total_result[0] if total_result else 0
-        
-        # Distribución por asistente (protegido contra división por cero)
+        # Totales por asistente: una sola pasada sobre el rollup (SUM de BIGINT es numeric →
+        # Decimal en psycopg2, que no se opera con float: se devuelve como bigint)
         cur.execute("""
-            SELECT 
-                assistant_type,
-                COUNT(*) as count,
-                CASE 
-                    WHEN (SELECT COUNT(*) FROM metrics) = 0 THEN 0
-                    ELSE ROUND(COUNT(*) * 100.0 / NULLIF((SELECT COUNT(*) FROM metrics), 0), 2)
-                END as percentage
-            FROM metrics
+            SELECT assistant_type, SUM(total_queries)::bigint, SUM(latency_sum), SUM(failed_queries)::bigint
+            FROM metrics_rollup_day
             GROUP BY assistant_type
-            ORDER BY count DESC
+            ORDER BY 2 DESC
         """)
         rows = cur.fetchall()
-        by_assistant = [
-            {"assistant": row[0], "count": row[1], "percentage": float(row[2]) if row[2] else 0}
-            for row in rows
-        ]
-        
-        # Latencia promedio
-        cur.execute("SELECT AVG(latency) as avg_latency FROM metrics")
-        avg_result = cur.fetchone()
-        avg_latency = float(avg_result[0]) if avg_result and avg_result[0] else 0
-        
-        # Usuarios activos
-        cur.execute("""
-            SELECT COUNT(DISTINCT user_id) as active_users 
-            FROM metrics 
-            WHERE timestamp >= NOW() - INTERVAL '7 days'
-        """)
-        active_result = cur.fetchone()
-        active_users = active_result[0] if active_result else 0
         
-        # Tasa de éxito (protegido contra división por cero)
-        cur.execute("""
-            SELECT 
-                CASE 
-                    WHEN COUNT(*) = 0 THEN 0 
-                    ELSE COUNT(CASE WHEN error_rate = 0 THEN 1 END) * 100.0 / COUNT(*) 
-                END as success_rate
-            FROM metrics
-        """)
-        success_result = cur.fetchone()
-        success_rate = float(success_result[0]) if success_result and success_result[0] else 0
+        # Usuarios activos: unión de los sketches de los últimos 7 días
+        cur.execute("SELECT users_hll FROM metrics_rollup_day WHERE bucket > CURRENT_DATE - 7")
+        active_users = hll_estimate(hll_merge(row[0] for row in cur.fetchall()))
         
         cur.close()
         conn.close()
         
+        total = sum(row[1] for row in rows)
+        latency_sum = sum(row[2] for row in rows)
+        failed = sum(row[3] for row in rows)
+        
+        # Distribución por asistente (protegido contra división por cero)
+        by_assistant = [
+            {
+                "assistant": assistant,
+                "count": int(count),
+                "percentage": round(count * 100.0 / total, 2) if total else 0
+            }
+            for assistant, count, _, _ in rows
+        ]
+        avg_latency = latency_sum * 1000 / total if total else 0
+        success_rate = (total - failed) * 100.0 / total if total else 0
+        
         return {
-            "total_queries": total,
+            "total_queries": int(total),
             "avg_latency_ms": round(avg_latency, 2),
             "success_rate_percentage": round(success_rate, 2),
             "active_users_7d": active_users,
@@ -224,7 +328,7 @@ async def get_stats():
         }
         
     except Exception as e:
-        logger.error(f"Error en /stats: {e}")
+        logger.error("Error en /stats: %.200s", e, extra=log_event("api.error", endpoint="/stats"))
         return {
             "total_queries": 0,
             "avg_latency_ms": 0,
@@ -232,4 +336,30 @@ async def get_stats():
             "active_users_7d": 0,
             "distribution_by_assistant": [],
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+
+def _build_dashboard():
+    """Todo lo que pinta la barra lateral y la sección de análisis de la UI"""
+    try:
+        metrics = get_metrics(days=7)
+    except HTTPException as e:
+        metrics = {"period_days": 7, "total_metrics": 0, "metrics": [], "error": e.detail}
+    health = health_poller.snapshot()
+    return {
+        # Sin marcas de tiempo del sondeo: el ETag solo cambia si cambia el estado
+        "health": {k: health.get(k) for k in ("status", "services", "database")},
+        "stats": get_stats(),
+        "metrics": metrics,
+    }
+
+dashboard = DashboardCache(_build_dashboard)
+
+@app.get("/dashboard")
+def get_dashboard(if_none_match: Optional[str] = Header(None)):
+    """Instantánea precalculada; con If-None-Match devuelve 304 si no ha cambiado"""
+    body, etag = dashboard.get()
+    headers = {"ETag": etag, "Cache-Control": f"max-age={int(dashboard.ttl)}"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
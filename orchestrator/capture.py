@@ -0,0 +1,95 @@
+# orchestrator/capture.py - Captura asíncrona del tráfico de consultas para reproducirlo después
+#
+# CAPTURE_TRAFFIC = off (defecto) | db (tabla queries) | file (JSONL en CAPTURE_FILE)
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List
+
+from db_utils import get_db_connection
+from telemetry import telemetry
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_TRAFFIC = os.getenv("CAPTURE_TRAFFIC", "off")
+CAPTURE_FILE = os.getenv("CAPTURE_FILE", "/tmp/traffic.jsonl")
+CAPTURE_QUEUE_SIZE = int(os.getenv("CAPTURE_QUEUE_SIZE", "10000"))
+_BATCH_SIZE = 200
+_FLUSH_INTERVAL = 1.0
+
+telemetry.describe("edu_capture_dropped_total", "counter", "Eventos de captura descartados por cola llena")
+
+
+class TrafficCapture:
+    """Encola eventos de consulta y los escribe por lotes en un hilo aparte"""
+
+    def __init__(self, mode: str = CAPTURE_TRAFFIC, path: str = CAPTURE_FILE):
+        self.mode = mode
+        self.path = path
+        self.enabled = mode in ("db", "file")
+        self._queue: "queue.Queue" = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+        self._worker = None
+        self._lock = threading.Lock()
+        if mode not in ("off", "db", "file"):
+            logger.warning("⚠️ CAPTURE_TRAFFIC desconocido: %s (captura desactivada)", mode)
+
+    def record(self, **event) -> None:
+        """No bloquea: si la cola está llena el evento se descarta"""
+        if not self.enabled:
+            return
+        if self._worker is None:
+            self._start_worker()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            telemetry.inc("edu_capture_dropped_total")
+
+    def _start_worker(self) -> None:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+                self._worker.start()
+                logger.info("🎙️ Captura de tráfico activada (%s)", self.mode)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + _FLUSH_INTERVAL
+            while len(batch) < _BATCH_SIZE and time.time() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error("❌ Error guardando %d eventos de tráfico: %.200s", len(batch), e,
+                             extra=log_event("capture.write_failed"))
+
+    def _write(self, batch: List[Dict]) -> None:
+        if self.mode == "file":
+            with open(self.path, "a", encoding="utf-8") as f:
+                for event in batch:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            return
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.executemany("""
+            INSERT INTO queries (username, query, response, route, assistant_type, latency, outcome, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, to_timestamp(%s)::timestamp)
+        """, [
+            (e["username"], e["query"], e["response"], e["route"], e["assistant"],
+             e["latency"], e["outcome"], e["ts"])
+            for e in batch
+        ])
+        conn.commit()
+        cur.close()
+        conn.close()
+
+
+# Instancia global
+traffic_capture = TrafficCapture()
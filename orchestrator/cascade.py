@@ -0,0 +1,61 @@
+# orchestrator/cascade.py - Cascada de modelos: primero el pequeño, escalar solo si hace falta
+#
+# LLM_CASCADE=1 activa el modo cascada
+# LLM_CASCADE_MODELS="tinyllama,phi" (de menor a mayor)
+# LLM_ROUTE_BUDGETS="factual=96:384,generative=256:768" (num_predict por ruta y nivel)
+import os
+from typing import Dict, List, Optional, Tuple
+
+from telemetry import telemetry
+
+# num_predict por ruta: (modelo pequeño, modelos mayores)
+DEFAULT_ROUTE_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "rule": (64, 256),
+    "factual": (96, 384),
+    "generative": (256, 768),
+    "default": (128, 512),
+}
+
+# Frases con las que un modelo pequeño suele admitir que no sabe la respuesta
+HEDGING_PHRASES = (
+    "no estoy seguro", "no lo sé", "no sé", "no tengo información", "no puedo responder",
+    "i'm not sure", "i am not sure", "i don't know", "i do not know", "as an ai", "i cannot answer",
+)
+MIN_ANSWER_CHARS = 20
+
+telemetry.describe("edu_cascade_tier_total", "counter", "Respuestas por nivel de la cascada y resultado")
+telemetry.describe("edu_cascade_tier_latency_seconds", "summary", "Latencia de cada nivel de la cascada")
+telemetry.describe("edu_cascade_escalations_total", "counter", "Escaladas al siguiente modelo por motivo")
+
+
+def _parse_budgets(spec: str) -> Dict[str, Tuple[int, int]]:
+    budgets = dict(DEFAULT_ROUTE_BUDGETS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, values = item.partition("=")
+        small, _, large = values.partition(":")
+        budgets[route] = (int(small), int(large or small))
+    return budgets
+
+
+class CascadeConfig:
+    def __init__(self):
+        self.enabled = os.getenv("LLM_CASCADE", "0") == "1"
+        self.tiers: List[str] = [m.strip() for m in os.getenv("LLM_CASCADE_MODELS", "tinyllama,phi").split(",")
+                                 if m.strip()]
+        self.budgets = _parse_budgets(os.getenv("LLM_ROUTE_BUDGETS", ""))
+
+    def budget(self, route: str, tier: int) -> int:
+        small, large = self.budgets.get(route, self.budgets["default"])
+        return small if tier == 0 else large
+
+
+def needs_escalation(response: str, result: Dict, num_predict: Optional[int]) -> Optional[str]:
+    """Heurística barata de confianza; devuelve el motivo para escalar o None"""
+    if result.get("done_reason") == "length" or (num_predict and result.get("eval_count", 0) >= num_predict):
+        return "truncated"
+    if len(response) < MIN_ANSWER_CHARS:
+        return "too_short"
+    lowered = response.lower()
+    if any(phrase in lowered for phrase in HEDGING_PHRASES):
+        return "uncertain"
+    return None
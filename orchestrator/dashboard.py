@@ -0,0 +1,62 @@
+# orchestrator/dashboard.py - Instantánea precalculada para el panel de la UI (/dashboard)
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_TTL = float(os.getenv("DASHBOARD_TTL", "10"))
+
+
+class DashboardCache:
+    """Reconstruye la instantánea en segundo plano; las peticiones solo leen bytes ya serializados"""
+
+    def __init__(self, builder: Callable[[], Dict], ttl: float = DASHBOARD_TTL):
+        self.builder = builder
+        self.ttl = ttl
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("❌ Error construyendo /dashboard: %.200s", e, extra=log_event("dashboard.failed"))
+            if self._stop.wait(self.ttl):
+                break
+
+    def refresh(self) -> None:
+        snapshot = self.builder()
+        snapshot["generated_at"] = datetime.now().isoformat()
+        snapshot["ttl_seconds"] = self.ttl
+        # El ETag depende solo de los datos, no de la hora de generación
+        data = {k: v for k, v in snapshot.items() if k != "generated_at"}
+        etag = '"' + hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:16] + '"'
+        body = json.dumps(snapshot, default=str, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            if etag != self._etag:
+                self._body, self._etag = body, etag
+
+    def get(self) -> Tuple[bytes, str]:
+        """Primera llamada antes del hilo de fondo: se construye una vez de forma síncrona"""
+        if self._body is None:
+            self.refresh()
+        return self._body, self._etag
@@ -1,5 +1,17 @@
 import psycopg2
 import os
+import time
+from sketches import hll_position, hll_single, hll_empty, hll_add
+from ollama_models import COLD_START_THRESHOLD, GenerationUsage
+
+# Tablas de rollup: (tabla, expresión del bucket)
+ROLLUP_TABLES = (
+    ("metrics_rollup_minute", "date_trunc('minute', LOCALTIMESTAMP)"),
+    ("metrics_rollup_day", "CURRENT_DATE"),
+)
+MINUTE_ROLLUP_RETENTION_DAYS = int(os.getenv('MINUTE_ROLLUP_RETENTION_DAYS', '14'))
+_PRUNE_INTERVAL = 3600
+_last_prune = 0.0
 
 def get_db_connection():
     conn = psycopg2.connect(
@@ -10,26 +22,137 @@ def get_db_connection():
     )
     return conn
 
-def log_metric(assistant_type, latency, error_rate, user_id):
+def update_rollups(cur, assistant_type, latency, error_rate, user_id):
+    """Actualiza incrementalmente los rollups por minuto y por día (misma transacción)"""
+    failed = 1 if error_rate > 0 else 0
+    # Registro y rango del usuario en el sketch; rango 0 no modifica nada
+    index, rank = hll_position(user_id) if user_id is not None else (0, 0)
+    for table, bucket in ROLLUP_TABLES:
+        cur.execute(f"""
+            INSERT INTO {table} AS r (bucket, assistant_type, total_queries, latency_sum,
+                                      latency_sumsq, error_rate_sum, failed_queries, users_hll)
+            VALUES ({bucket}, %s, 1, %s, %s, %s, %s, %s)
+            ON CONFLICT (bucket, assistant_type) DO UPDATE SET
+                total_queries = r.total_queries + 1,
+                latency_sum = r.latency_sum + EXCLUDED.latency_sum,
+                latency_sumsq = r.latency_sumsq + EXCLUDED.latency_sumsq,
+                error_rate_sum = r.error_rate_sum + EXCLUDED.error_rate_sum,
+                failed_queries = r.failed_queries + EXCLUDED.failed_queries,
+                users_hll = set_byte(r.users_hll, %s, GREATEST(get_byte(r.users_hll, %s), %s))
+        """, (assistant_type, latency, latency * latency, error_rate, failed,
+              psycopg2.Binary(hll_single(user_id)), index, index, rank))
+
+def update_generation_rollup(cur, route, usage):
+    """Tokens y tiempos de una llamada a Ollama en el rollup diario por ruta y modelo"""
+    cur.execute("""
+        INSERT INTO generation_rollup_day AS r (bucket, route, model, calls, prompt_tokens, completion_tokens,
+                                                prompt_eval_seconds, eval_seconds, load_seconds, cold_loads)
+        VALUES (CURRENT_DATE, %s, %s, 1, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (bucket, route, model) DO UPDATE SET
+            calls = r.calls + 1,
+            prompt_tokens = r.prompt_tokens + EXCLUDED.prompt_tokens,
+            completion_tokens = r.completion_tokens + EXCLUDED.completion_tokens,
+            prompt_eval_seconds = r.prompt_eval_seconds + EXCLUDED.prompt_eval_seconds,
+            eval_seconds = r.eval_seconds + EXCLUDED.eval_seconds,
+            load_seconds = r.load_seconds + EXCLUDED.load_seconds,
+            cold_loads = r.cold_loads + EXCLUDED.cold_loads
+    """, (route or "unknown", usage.model, usage.prompt_tokens, usage.completion_tokens,
+          usage.prompt_eval_seconds, usage.eval_seconds, usage.load_seconds, 1 if usage.cold else 0))
+
+def prune_minute_rollups(cur, retention_days=MINUTE_ROLLUP_RETENTION_DAYS):
+    cur.execute(
+        "DELETE FROM metrics_rollup_minute WHERE bucket < LOCALTIMESTAMP - %s * INTERVAL '1 day'",
+        (retention_days,)
+    )
+
+def log_metric(assistant_type, latency, error_rate, user_id, route=None, usages=None):
+    """usages: GenerationUsage de las llamadas a Ollama de la consulta (una por nivel de la cascada);
+    en la fila de metrics va la suma, en el rollup cada llamada con su modelo"""
+    global _last_prune
+    usage = GenerationUsage.total(usages or [])
     conn = get_db_connection()
     cur = conn.cursor()
     cur.execute("""
-        INSERT INTO metrics (assistant_type, latency, error_rate, user_id)
-        VALUES (%s, %s, %s, %s)
-    """, (assistant_type, latency, error_rate, user_id))
+        INSERT INTO metrics (assistant_type, latency, error_rate, user_id, route, model, prompt_tokens,
+                             completion_tokens, prompt_eval_seconds, eval_seconds, load_seconds)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, (assistant_type, latency, error_rate, user_id, route) + (
+        (usage.model, usage.prompt_tokens, usage.completion_tokens, usage.prompt_eval_seconds,
+         usage.eval_seconds, usage.load_seconds) if usage else (None,) * 6))
+    update_rollups(cur, assistant_type, latency, error_rate, user_id)
+    for call in usages or []:
+        update_generation_rollup(cur, route, call)
+    # Los rollups por minuto solo sirven para ventanas recientes
+    if time.time() - _last_prune > _PRUNE_INTERVAL:
+        _last_prune = time.time()
+        prune_minute_rollups(cur)
     conn.commit()
     cur.close()
     conn.close()
 
-def get_or_create_user(username):
+def rebuild_rollups():
+    """Recalcula los rollups desde la tabla metrics (migración o reparación)"""
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+    for table, _ in ROLLUP_TABLES:
+        bucket = "DATE(timestamp)" if table == "metrics_rollup_day" else "date_trunc('minute', timestamp)"
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(f"""
+            INSERT INTO {table} (bucket, assistant_type, total_queries, latency_sum,
+                                 latency_sumsq, error_rate_sum, failed_queries, users_hll)
+            SELECT {bucket}, assistant_type, COUNT(*), SUM(latency), SUM(latency * latency),
+                   SUM(error_rate), COUNT(CASE WHEN error_rate > 0 THEN 1 END), %s
+            FROM metrics
+            GROUP BY 1, 2
+        """, (psycopg2.Binary(bytes(hll_empty())),))
+        cur.execute(f"""
+            SELECT DISTINCT {bucket}, assistant_type, user_id
+            FROM metrics
+            WHERE user_id IS NOT NULL
+            ORDER BY 1, 2
+        """)
+        sketches = {}
+        for bucket_value, assistant_type, user_id in cur.fetchall():
+            hll_add(sketches.setdefault((bucket_value, assistant_type), hll_empty()), user_id)
+        for (bucket_value, assistant_type), registers in sketches.items():
+            cur.execute(
+                f"UPDATE {table} SET users_hll = %s WHERE bucket = %s AND assistant_type = %s",
+                (psycopg2.Binary(bytes(registers)), bucket_value, assistant_type)
+            )
+    # Sin el desglose por llamada, cada consulta cuenta como una llamada de su último modelo
+    cur.execute("DELETE FROM generation_rollup_day")
+    cur.execute("""
+        INSERT INTO generation_rollup_day (bucket, route, model, calls, prompt_tokens, completion_tokens,
+                                           prompt_eval_seconds, eval_seconds, load_seconds, cold_loads)
+        SELECT DATE(timestamp), COALESCE(route, 'unknown'), model, COUNT(*), SUM(prompt_tokens),
+               SUM(completion_tokens), SUM(prompt_eval_seconds), SUM(eval_seconds), SUM(load_seconds),
+               COUNT(CASE WHEN load_seconds > %s THEN 1 END)
+        FROM metrics
+        WHERE model IS NOT NULL
+        GROUP BY 1, 2, 3
+    """, (COLD_START_THRESHOLD,))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+def get_user(username):
+    """(id, rol) del usuario; lo crea sin rol si no existe"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, rol FROM users WHERE username = %s", (username,))
     user = cur.fetchone()
     if not user:
-        cur.execute("INSERT INTO users (username) VALUES (%s) RETURNING id", (username,))
+        cur.execute("INSERT INTO users (username) VALUES (%s) RETURNING id, rol", (username,))
         user = cur.fetchone()
     conn.commit()
     cur.close()
     conn.close()
-    return user[0]
\ No newline at end of file
+    return user[0], user[1]
+
+def get_or_create_user(username):
+    return get_user(username)[0]
+
+if __name__ == "__main__":
+    # python db_utils.py → reconstruir rollups a partir de la tabla metrics
+    rebuild_rollups()
+    print("✅ Rollups reconstruidos")
@@ -0,0 +1,222 @@
+# orchestrator/export.py - Exportación columnar de métricas (Arrow IPC o Parquet)
+#
+# Lee un rango de tiempo con un cursor de servidor (psycopg2 con nombre): Postgres entrega
+# las filas en bloques de EXPORT_CHUNK_ROWS y cada bloque se convierte en un RecordBatch de
+# Arrow y se escribe antes de pedir el siguiente. La memoria queda acotada por un bloque,
+# sea una semana de rollups o varios meses de la tabla metrics.
+#
+#   GET /metrics/export?source=metrics&start=2026-01-01&end=2026-04-01&format=parquet
+#   docker compose exec orchestrator python export.py --source metrics --days 90 --out metrics.parquet
+#
+# Fuentes: metrics (una fila por consulta), rollup_day, rollup_minute (con usuarios únicos
+# estimados del sketch HLL) y generation (tokens de Ollama por día, ruta y modelo).
+#
+# Variables de entorno:
+#   EXPORT_CHUNK_ROWS  filas por bloque / RecordBatch (50000)
+import argparse
+import io
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # imagen sin pyarrow: /metrics/export responde 501
+    pa = pq = None
+
+from db_utils import get_db_connection
+from sketches import hll_estimate
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+FORMATS = {
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class Source(NamedTuple):
+    table: str
+    time_column: str
+    columns: Tuple[Tuple[str, str], ...]  # (columna, tipo de _arrow_type)
+
+
+SOURCES: Dict[str, Source] = {
+    "metrics": Source("metrics", "timestamp", (
+        ("timestamp", "timestamp"), ("assistant_type", "string"), ("route", "string"), ("model", "string"),
+        ("latency", "float64"), ("error_rate", "float64"), ("user_id", "int32"),
+        ("prompt_tokens", "int32"), ("completion_tokens", "int32"), ("prompt_eval_seconds", "float64"),
+        ("eval_seconds", "float64"), ("load_seconds", "float64"),
+    )),
+    "rollup_day": Source("metrics_rollup_day", "bucket", (
+        ("bucket", "date"), ("assistant_type", "string"), ("total_queries", "int64"), ("latency_sum", "float64"),
+        ("latency_sumsq", "float64"), ("error_rate_sum", "float64"), ("failed_queries", "int64"),
+        ("users_hll", "hll"),
+    )),
+    "rollup_minute": Source("metrics_rollup_minute", "bucket", (
+        ("bucket", "timestamp"), ("assistant_type", "string"), ("total_queries", "int64"),
+        ("latency_sum", "float64"), ("latency_sumsq", "float64"), ("error_rate_sum", "float64"),
+        ("failed_queries", "int64"), ("users_hll", "hll"),
+    )),
+    "generation": Source("generation_rollup_day", "bucket", (
+        ("bucket", "date"), ("route", "string"), ("model", "string"), ("calls", "int64"),
+        ("prompt_tokens", "int64"), ("completion_tokens", "int64"), ("prompt_eval_seconds", "float64"),
+        ("eval_seconds", "float64"), ("load_seconds", "float64"), ("cold_loads", "int64"),
+    )),
+}
+
+
+def _arrow_type(name: str):
+    # El sketch HLL no sale tal cual: se exporta su estimación de usuarios únicos
+    return {"timestamp": pa.timestamp("us"), "date": pa.date32(), "string": pa.string(), "float64": pa.float64(),
+            "int32": pa.int32(), "int64": pa.int64(), "hll": pa.int64()}[name]
+
+
+def schema_for(source: Source):
+    return pa.schema([("unique_users" if kind == "hll" else column, _arrow_type(kind))
+                      for column, kind in source.columns])
+
+
+def time_range(start: Optional[str] = None, end: Optional[str] = None, days: int = 7) -> Tuple[datetime, datetime]:
+    """[inicio, fin) a partir de fechas ISO; sin inicio, los `days` días anteriores al fin (ahora)"""
+    end_dt = datetime.fromisoformat(end) if end else datetime.now()
+    start_dt = datetime.fromisoformat(start) if start else end_dt - timedelta(days=days)
+    if start_dt >= end_dt:
+        raise ValueError("start debe ser anterior a end")
+    return start_dt, end_dt
+
+
+def iter_batches(source: Source, start: datetime, end: datetime,
+                 chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator["pa.RecordBatch"]:
+    """RecordBatches de hasta `chunk_rows` filas leídos con un cursor de servidor"""
+    schema = schema_for(source)
+    bound, bound_end = start, end
+    if source.columns[0][1] == "date":
+        # Rollups por día: el día de `end` entra si `end` no es medianoche (con end=ahora, hoy)
+        bound = start.date()
+        bound_end = end.date() if end.time() == datetime.min.time() else end.date() + timedelta(days=1)
+    conn = get_db_connection()
+    try:
+        # Cursor con nombre = DECLARE ... CURSOR en Postgres: solo viaja un bloque cada vez
+        cur = conn.cursor(name=f"export_{source.table}_{os.getpid()}_{time.monotonic_ns()}")
+        cur.itersize = chunk_rows
+        cur.execute(f"""
+            SELECT {", ".join(column for column, _ in source.columns)}
+            FROM {source.table}
+            WHERE {source.time_column} >= %s AND {source.time_column} < %s
+            ORDER BY {source.time_column}
+        """, (bound, bound_end))
+        hll_columns = [i for i, (_, kind) in enumerate(source.columns) if kind == "hll"]
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            columns = [list(values) for values in zip(*rows)]
+            del rows
+            for i in hll_columns:
+                columns[i] = [hll_estimate(sketch) for sketch in columns[i]]
+            yield pa.RecordBatch.from_arrays([pa.array(values, type=field.type)
+                                              for values, field in zip(columns, schema)], schema=schema)
+        cur.close()
+    finally:
+        conn.close()
+
+
+class _Drain(io.RawIOBase):
+    """Destino de escritura que se vacía tras cada bloque; tell() cuenta todo lo escrito
+    (ParquetWriter guarda offsets absolutos en el pie del fichero)"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _open_writer(sink, schema, fmt: str):
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    return pa.ipc.new_stream(sink, schema)
+
+
+def stream_export(source: Source, start: datetime, end: datetime, fmt: str = "arrow",
+                  chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Bytes del fichero Arrow IPC (stream) o Parquet, un trozo por bloque de filas"""
+    drain = _Drain()
+    writer = _open_writer(pa.PythonFile(drain, mode="w"), schema_for(source), fmt)
+    rows = 0
+    started = time.time()
+    try:
+        for batch in iter_batches(source, start, end, chunk_rows):
+            # Parquet: un row group por bloque, así el escritor no acumula filas
+            writer.write_table(pa.Table.from_batches([batch]))
+            rows += batch.num_rows
+            data = drain.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield drain.take()
+    logger.info("📦 Exportadas %d filas de %s (%s) en %.1fs", rows, source.table, fmt, time.time() - started,
+                extra=log_event("export.done", table=source.table, format=fmt))
+
+
+def export_to_file(source: Source, start: datetime, end: datetime, path: str, fmt: str,
+                   chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """Escribe el rango en `path`; devuelve las filas exportadas"""
+    rows = 0
+    with pa.OSFile(path, "wb") as sink:
+        writer = _open_writer(sink, schema_for(source), fmt)
+        try:
+            for batch in iter_batches(source, start, end, chunk_rows):
+                writer.write_table(pa.Table.from_batches([batch]))
+                rows += batch.num_rows
+        finally:
+            writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta métricas en Arrow IPC o Parquet")
+    parser.add_argument("--source", choices=sorted(SOURCES), default="metrics")
+    parser.add_argument("--start", help="fecha u hora ISO de inicio (incluida)")
+    parser.add_argument("--end", help="fecha u hora ISO de fin (excluida; por defecto ahora). "
+                                         "En las fuentes por día, una hora que no sea medianoche incluye su día")
+    parser.add_argument("--days", type=int, default=30, help="días hacia atrás si no se indica --start")
+    parser.add_argument("--format", choices=sorted(FORMATS), help="por defecto, según la extensión de --out")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument("--out", required=True, help="fichero de salida (.parquet o .arrows)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if pa is None:
+        parser.error("pyarrow no está instalado")
+    fmt = args.format or ("parquet" if args.out.endswith(".parquet") else "arrow")
+    start, end = time_range(args.start, args.end, args.days)
+    started = time.time()
+    rows = export_to_file(SOURCES[args.source], start, end, args.out, fmt, args.chunk_rows)
+    logger.info("💾 %d filas de %s (%s → %s) en %s (%.1fs)", rows, args.source, f"{start:%Y-%m-%d %H:%M}",
+                f"{end:%Y-%m-%d %H:%M}", args.out, time.time() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# orchestrator/health.py - Sondeo de salud en segundo plano
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import requests
+from db_utils import get_db_connection
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+HEALTH_POLL_INTERVAL = float(os.getenv("HEALTH_POLL_INTERVAL", "5"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+
+# Estados con los que el router deja de enviar tráfico a un backend
+DOWN_STATES = ("unhealthy", "unreachable")
+
+
+def _http_probe(url: str, timeout: float) -> str:
+    try:
+        r = requests.get(url, timeout=timeout)
+    except requests.RequestException:
+        return "unreachable"
+    if r.status_code != 200:
+        return "unhealthy"
+    try:
+        status = r.json().get("status", "healthy")
+    except ValueError:
+        return "healthy"
+    # /health de los asistentes devuelve "healthy" o "degraded"
+    return status if status in ("healthy", "degraded") else "healthy"
+
+
+def _db_probe() -> str:
+    try:
+        conn = get_db_connection()
+        conn.close()
+        return "healthy"
+    except Exception:
+        return "unhealthy"
+
+
+class HealthPoller:
+    """Sondea todos los backends en paralelo cada `interval` segundos y guarda una instantánea"""
+
+    def __init__(self, services: Dict[str, str], ollama_url: str,
+                 interval: float = HEALTH_POLL_INTERVAL, timeout: float = HEALTH_PROBE_TIMEOUT):
+        self.interval = interval
+        self.probes: Dict[str, Callable[[], str]] = {
+            name: (lambda url=f"{url}/health": _http_probe(url, timeout))
+            for name, url in services.items()
+        }
+        self.probes["ollama"] = lambda: _http_probe(f"{ollama_url}/api/tags", timeout)
+        self.probes["database"] = _db_probe
+        self._executor = ThreadPoolExecutor(max_workers=len(self.probes), thread_name_prefix="health")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot = {
+            "status": "starting",
+            "timestamp": datetime.now().isoformat(),
+            "services": {},
+            "database": "unknown",
+            "details": {},
+        }
+        self._checked_at = 0.0
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="health-poller", daemon=True)
+            self._thread.start()
+            logger.info("🩺 Sondeo de salud cada %ss: %s", self.interval, list(self.probes))
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error("❌ Error en el sondeo de salud: %.200s", e, extra=log_event("health.poll_failed"))
+            self._stop.wait(self.interval)
+
+    def _timed(self, probe: Callable[[], str]):
+        start = time.time()
+        status = probe()
+        return status, round((time.time() - start) * 1000, 1)
+
+    def poll(self) -> Dict:
+        """Ejecuta todas las sondas a la vez; la duración total es la de la más lenta"""
+        futures = {name: self._executor.submit(self._timed, probe) for name, probe in self.probes.items()}
+        checked_at = datetime.now().isoformat()
+        services, details = {}, {}
+        for name, future in futures.items():
+            status, latency_ms = future.result()
+            details[name] = {"status": status, "latency_ms": latency_ms, "checked_at": checked_at}
+            if name != "database":
+                services[name] = status
+        database = details["database"]["status"]
+        all_healthy = database == "healthy" and all(s == "healthy" for s in services.values())
+        self._snapshot = {
+            "status": "healthy" if all_healthy else "degraded",
+            "timestamp": checked_at,
+            "services": services,
+            "database": database,
+            "details": details,
+        }
+        self._checked_at = time.time()
+        return self._snapshot
+
+    def snapshot(self) -> Dict:
+        return self._snapshot
+
+    def is_available(self, name: str) -> bool:
+        """False solo si la última sonda (reciente) marcó el backend como caído"""
+        if time.time() - self._checked_at > 3 * self.interval:
+            return True  # instantánea ausente o caducada: no decidir por ella
+        return self._snapshot["services"].get(name) not in DOWN_STATES
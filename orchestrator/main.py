@@ -1,26 +1,69 @@
 # orchestrator/main.py - Versión final completa y corregida
+import os
 import time
 import requests
-import ollama
 import unicodedata
 import logging
-import threading
-from typing import Dict, Any, Tuple
-from db_utils import get_or_create_user, log_metric
+from typing import Dict, Any, Optional, Tuple
+from db_utils import get_user, log_metric
+from telemetry import telemetry
+from common.tracing import Tracer
+from common.logs import log_event, setup_logging
+from common.fuzzy import FuzzyIndex
+from common.transport import AssistantClient, AssistantRequest
+from common.deadline import (Deadline, DeadlineExceeded, REQUEST_BUDGET_SECONDS, call_timeout,
+                             deadline_headers, deadline_scope, has_budget)
+from health import HealthPoller
+from capture import traffic_capture
+from sessions import ChatSession, session_store
+from ollama_models import ModelManager, OLLAMA_KEEP_ALIVE, usage_scope
+from cascade import CascadeConfig, needs_escalation
+from state import breaker, response_cache
+from answers import answer_store
+from scheduler import scheduler
 
-# Configurar logging
-logging.basicConfig(level=logging.INFO)
+# Configurar logging (cola asíncrona, LOG_LEVEL / LOG_SAMPLE)
+setup_logging("orchestrator")
 logger = logging.getLogger(__name__)
+tracer = Tracer("orchestrator")
+
+OLLAMA_SYSTEM_PROMPT = """Eres un tutor educativo paciente y claro.
+Responde en el mismo idioma de la pregunta.
+Sé conciso pero informativo."""
+
+telemetry.describe("edu_deadline_exceeded_total", "counter", "Intentos descartados por plazo agotado, por etapa")
+telemetry.describe("edu_route_fuzzy_total", "counter", "Consultas enviadas a rule_based por parecido (con erratas) en vez de a Ollama")
+
+RULE_KEYWORDS = ["hola", "hello", "hi", "chiste", "joke", "suma", "resta", "cuanto es", "fotosintesis", "revolucion francesa"]
+DP_KEYWORDS = ["que es", "explica", "defin", "quien es", "quien fue", "cuando", "donde", "por que", "que significa"]
+# Reencaminado con erratas: solo palabras clave que rule_based contesta por sí solas (frase o
+# tema de rules.py). "cuanto es" no vale: la regla necesita la operación ("cuánto es 2+2")
+RULE_FUZZY_KEYWORDS = ["fotosintesis", "mitosis", "revolucion francesa"]
+LLM_KEYWORDS = ["como se hace", "como hago", "paso a paso", "dame un ejemplo", "escribe", "redacta", "opina", "crees que", "ayudame a"]
 
 class Orchestrator:
     def __init__(self):
         self.services = {
-            "rule_based": "http://rule-based:5001",
-            "deeppavlov": "http://deeppavlov-nlu:5002",
+            "rule_based": os.getenv("RULE_BASED_URL", "http://rule-based:5001"),
+            "deeppavlov": os.getenv("DEEPPAVLOV_URL", "http://deeppavlov-nlu:5002"),
         }
-        # Modelo de Ollama - usa 'phi' o 'tinyllama' según lo que tengas disponible
-        self.llm_model = "phi"  # Cambia a "tinyllama" si phi no funciona
-        logger.info(f"✅ Orquestador inicializado con modelo Ollama: {self.llm_model}")
+        # Conexiones keep-alive y msgpack (JSON como alternativa) hacia cada asistente
+        self.clients = {name: AssistantClient(url) for name, url in self.services.items()}
+        self.ollama_url = os.getenv("OLLAMA_URL", "http://ollama:11434")
+        # Modelo de Ollama - usa 'phi' o 'tinyllama' según lo que tengas disponible (LLM_MODEL)
+        self.llm_model = os.getenv("LLM_MODEL", "phi")
+        # Modelos que se precargan y se verifican contra los descargados en Ollama (PRELOAD_MODELS;
+        # no OLLAMA_MODELS, que para Ollama es el directorio donde guarda los modelos)
+        self.ollama_models = [m.strip() for m in os.getenv("PRELOAD_MODELS", self.llm_model).split(",") if m.strip()]
+        if self.llm_model not in self.ollama_models:
+            self.ollama_models.insert(0, self.llm_model)
+        # Cascada opcional de modelos (LLM_CASCADE=1): del más pequeño al más grande
+        self.cascade = CascadeConfig()
+        if self.cascade.enabled:
+            self.ollama_models += [m for m in self.cascade.tiers if m not in self.ollama_models]
+        # Palabras clave de rule_based con tildes y erratas ("revolucion fracesa"), umbral FUZZY_THRESHOLD
+        self.rule_index = FuzzyIndex(RULE_FUZZY_KEYWORDS)
+        logger.info("✅ Orquestador inicializado con modelo Ollama: %s", self.llm_model)
 
     @staticmethod
     def normalize_text(text: str) -> str:
@@ -35,196 +78,343 @@ class Orchestrator:
     def analyze_query(self, query: str) -> Dict[str, Any]:
         """Decide qué asistente usar basado en keywords"""
         norm_query = self.normalize_text(query)
-        
-        rule_keywords = ["hola", "hello", "hi", "chiste", "joke", "suma", "resta", "cuanto es", "fotosintesis", "revolucion francesa"]
-        dp_keywords = ["que es", "explica", "defin", "quien es", "quien fue", "cuando", "donde", "por que", "que significa"]
-        llm_keywords = ["como se hace", "como hago", "paso a paso", "dame un ejemplo", "escribe", "redacta", "opina", "crees que", "ayudame a"]
 
-        if any(k in norm_query for k in rule_keywords):
-            return {"assistant": "rule_based", "confidence": 0.9}
-        elif any(k in norm_query for k in dp_keywords):
-            return {"assistant": "deeppavlov", "confidence": 0.8}
-        elif any(k in norm_query for k in llm_keywords):
-            return {"assistant": "ollama", "confidence": 0.7}
-        else:
-            return {"assistant": "ollama", "confidence": 0.5}  # Ollama es el más versátil
+        if any(k in norm_query for k in RULE_KEYWORDS):
+            return {"assistant": "rule_based", "confidence": 0.9, "route": "rule"}
+        elif any(k in norm_query for k in DP_KEYWORDS):
+            return {"assistant": "deeppavlov", "confidence": 0.8, "route": "factual"}
+        elif any(k in norm_query for k in LLM_KEYWORDS):
+            return {"assistant": "ollama", "confidence": 0.7, "route": "generative"}
+        # Antes de mandar a Ollama lo que nadie reconoce: ¿es una regla con erratas?
+        fuzzy = self.rule_index.match(norm_query)
+        if fuzzy is not None:
+            telemetry.inc("edu_route_fuzzy_total", keyword=fuzzy[0])
+            return {"assistant": "rule_based", "confidence": round(0.9 * fuzzy[1], 2), "route": "rule"}
+        return {"assistant": "ollama", "confidence": 0.5, "route": "default"}  # Ollama es el más versátil
 
-    def call_assistant(self, assistant: str, query: str) -> Tuple[str, float, float]:
+    def call_assistant(self, assistant: str, query: str, session: Optional[ChatSession] = None,
+                       route: str = "default") -> Tuple[str, float, float]:
         """Llama al asistente con manejo de errores y fallback"""
         start = time.time()
+        telemetry.gauge_add("edu_assistant_in_flight", 1, assistant=assistant)
         
-        try:
-            if assistant == "rule_based":
-                result = self.call_rule_based(query)
-            elif assistant == "deeppavlov":
-                result = self.call_deeppavlov(query)
-            elif assistant == "ollama":
-                result = self.call_ollama(query)
-            else:
-                result = {"success": False, "error": "Asistente desconocido"}
-        except Exception as e:
-            result = {"success": False, "error": str(e)}
+        with tracer.span(f"call_{assistant}") as span:
+            try:
+                # Turno justo frente al backend (por usuario y rol); la espera cuenta en la latencia
+                with scheduler.slot(assistant) as queue_wait:
+                    span.set_tag("queue_wait", round(queue_wait, 4))
+                    if assistant == "rule_based":
+                        result = self.call_rule_based(query)
+                    elif assistant == "deeppavlov":
+                        result = self.call_deeppavlov(query)
+                    elif assistant == "ollama":
+                        result = self.call_ollama(query, session, route)
+                    else:
+                        result = {"success": False, "error": "Asistente desconocido"}
+            except DeadlineExceeded as e:
+                telemetry.inc("edu_deadline_exceeded_total", stage=str(e))
+                result = {"success": False, "error": f"Plazo agotado ({e})", "deadline": True}
+            except Exception as e:
+                result = {"success": False, "error": str(e)}
+            finally:
+                telemetry.gauge_add("edu_assistant_in_flight", -1, assistant=assistant)
+            span.set_tag("success", result["success"])
         
         latency = time.time() - start
         error_rate = 0.0 if result["success"] else 1.0
+        telemetry.observe("edu_assistant_latency_seconds", latency, assistant=assistant)
+        if error_rate > 0:
+            telemetry.inc("edu_assistant_errors_total", assistant=assistant)
+            # Quedarse sin plazo o no reconocer la consulta no es culpa del asistente
+            if not result.get("deadline") and not result.get("unanswered"):
+                breaker.record_failure(assistant)
         response = result.get("response", f"Error: {result.get('error', 'Desconocido')}")
         
         return response, latency, error_rate
 
     def call_rule_based(self, query: str) -> Dict:
-        """Llamar rule-based con manejo de formatos"""
+        """Llamar rule-based (AssistantResponse acepta también sus formatos JSON históricos)"""
         try:
-            # Asegurarnos de enviar el formato correcto
-            payload = {"query": query}
-            r = requests.post(f"{self.services['rule_based']}/query", json=payload, timeout=10)
-            r.raise_for_status()
-            data = r.json()
+            data = self.clients["rule_based"].query(AssistantRequest(query), headers=tracer.inject(deadline_headers()),
+                                                    timeout=call_timeout(10, "rule_based"))
             
-            logger.info(f"📥 Respuesta cruda de rule_based: {data}")
+            logger.debug("📥 Respuesta cruda de rule_based: %s", data, extra=log_event("rule_based.raw"))
             
-            if "output_data" in data:
-                response = data["output_data"].get("response", "Sin respuesta")
-            elif "response" in data:
-                response = data.get("response", "Sin respuesta")
-            else:
-                response = str(data)  # Como fallback
+            response = data.response
+            if data.metadata.get("match") == "miss":
+                # "Lo siento, no entendí..." no es una respuesta: que pruebe el fallback
+                logger.info("🤷 rule_based no reconoce la consulta", extra=log_event("rule_based.miss"))
+                return {"success": False, "error": "rule_based no reconoce la consulta", "unanswered": True}
             
-            logger.info(f"✅ Respuesta extraída de rule_based: {response[:100]}...")
+            logger.info("✅ Respuesta extraída de rule_based: %.100s...", response,
+                        extra=log_event("assistant.response", assistant="rule_based"))
             return {"success": True, "response": response}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            logger.error(f"❌ Error en call_rule_based: {e}")
+            logger.error("❌ Error en call_rule_based: %.200s", e, extra=log_event("assistant.error", assistant="rule_based"))
             return {"success": False, "error": str(e)}
 
     def call_deeppavlov(self, query: str) -> Dict:
         """Llamar DeepPavlov"""
         try:
-            payload = {"query": query}
-            r = requests.post(f"{self.services['deeppavlov']}/query", json=payload, timeout=30)
-            r.raise_for_status()
-            data = r.json()
+            data = self.clients["deeppavlov"].query(AssistantRequest(query), headers=tracer.inject(deadline_headers()),
+                                                    timeout=call_timeout(30, "deeppavlov"))
             
-            response = data.get("response", "No respuesta de DeepPavlov")
-            logger.info(f"✅ Respuesta de DeepPavlov: {response[:100]}...")
+            response = data.response or "No respuesta de DeepPavlov"
+            logger.info("✅ Respuesta de DeepPavlov: %.100s...", response,
+                        extra=log_event("assistant.response", assistant="deeppavlov"))
             return {"success": True, "response": response}
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            logger.error(f"❌ Error en call_deeppavlov: {e}")
+            logger.error("❌ Error en call_deeppavlov: %.200s", e, extra=log_event("assistant.error", assistant="deeppavlov"))
             return {"success": False, "error": str(e)}
 
-    def call_ollama(self, query: str) -> Dict:
-        """Llamar Ollama con prompt educativo y manejo de errores mejorado"""
-        try:
-            prompt = f"""Eres un tutor educativo paciente y claro.
-Responde en el mismo idioma de la pregunta.
-Sé conciso pero informativo.
-
-Pregunta del estudiante: {query}
+    @staticmethod
+    def build_ollama_prompt(query: str, pending_turns=(), has_context: bool = False) -> str:
+        """Prompt educativo; con contexto de sesión solo se envían los turnos nuevos"""
+        parts = [] if has_context else [OLLAMA_SYSTEM_PROMPT, ""]
+        for previous_query, previous_answer in pending_turns:
+            parts += [f"Pregunta del estudiante: {previous_query}", f"Respuesta: {previous_answer}", ""]
+        parts += [f"Pregunta del estudiante: {query}", "", "Respuesta:"]
+        return "\n".join(parts)
 
-Respuesta:"""
+    def call_ollama(self, query: str, session: Optional[ChatSession] = None, route: str = "default") -> Dict:
+        """Llamar Ollama; en modo cascada empieza por el modelo pequeño y escala si hace falta"""
+        models = self.cascade.tiers if self.cascade.enabled else [self.llm_model]
+        result = {"success": False, "error": "Ningún modelo de Ollama disponible"}
+        best = None  # respuesta de un nivel inferior por si el superior falla
+        for tier, model in enumerate(models):
+            if tier and not has_budget():
+                logger.warning("⏱️ Cascada: sin plazo para escalar a %s", model,
+                               extra=log_event("deadline.exceeded", stage="cascade", model=model))
+                telemetry.inc("edu_deadline_exceeded_total", stage="cascade")
+                break
+            last_tier = tier == len(models) - 1
+            options = {"temperature": 0.7}
+            num_predict = self.cascade.budget(route, tier) if self.cascade.enabled else None
+            if num_predict:
+                options["num_predict"] = num_predict
             
-            logger.info(f"🔍 Llamando a Ollama con modelo: {self.llm_model}")
-            logger.info(f"📝 Prompt: {prompt[:100]}...")
+            start = time.time()
+            result = self._ollama_generate(query, model, session, options)
+            if not self.cascade.enabled:
+                return result
+            telemetry.observe("edu_cascade_tier_latency_seconds", time.time() - start, tier=model, route=route)
             
-            # Verificar conexión y modelo primero
-            try:
-                models = ollama.list()
-                logger.info(f"📋 Modelos disponibles en Ollama: {[m['name'] for m in models.get('models', [])]}")
-                
-                model_available = False
-                for model in models.get('models', []):
-                    if self.llm_model in model['name']:
-                        model_available = True
-                        break
-                
-                if not model_available:
-                    logger.error(f"❌ Modelo {self.llm_model} no encontrado en Ollama")
-                    return {"success": False, "error": f"Modelo {self.llm_model} no disponible"}
-            except Exception as e:
-                logger.error(f"❌ Error al listar modelos de Ollama: {e}")
-                return {"success": False, "error": f"Error de conexión con Ollama: {str(e)}"}
+            if result["success"]:
+                reason = None if last_tier else needs_escalation(result["response"], result["raw"], num_predict)
+                if reason is None:
+                    telemetry.inc("edu_cascade_tier_total", tier=model, route=route, result="accepted")
+                    return result
+                best = best or (model, result)
+            else:
+                reason = "error"
+            if not last_tier:
+                logger.info("⬆️ Cascada: %s → %s (%s)", model, models[tier + 1], reason,
+                            extra=log_event("cascade.escalated"))
+                telemetry.inc("edu_cascade_tier_total", tier=model, route=route, result="escalated")
+                telemetry.inc("edu_cascade_escalations_total", tier=model, reason=reason)
+        if best is not None:
+            model, result = best
+            telemetry.inc("edu_cascade_tier_total", tier=model, route=route, result="accepted_after_failure")
+            if session is not None:
+                session.set_pending_context(result["raw"].get("context"), model)
+        elif session is not None:
+            session.set_pending_context(None, None)
+        return result
+
+    def _ollama_generate(self, query: str, model: str, session: Optional[ChatSession], options: Dict) -> Dict:
+        """Una llamada a /api/generate; reutiliza el contexto (KV-cache) de la sesión"""
+        try:
+            context = session.ollama_context(model) if session else None
+            pending = session.pending_turns(model) if session else ()
+            prompt = self.build_ollama_prompt(query, pending, has_context=context is not None)
             
-            # Función para llamar a Ollama de manera asíncrona con timeout
-            def call_ollama_async():
-                try:
-                    resp = ollama.chat(
-                        model=self.llm_model,
-                        messages=[{"role": "user", "content": prompt}],
-                        options={"temperature": 0.7}
-                    )
-                    return resp
-                except Exception as e:
-                    return {"error": str(e)}
+            logger.debug("🔍 Llamando a Ollama con modelo: %s", model, extra=log_event("ollama.call"))
+            logger.debug("📝 Prompt: %.100s...", prompt, extra=log_event("ollama.prompt"))
             
-            # Ejecutar con timeout
-            result = None
-            thread = threading.Thread(target=lambda: globals().update({'result': call_ollama_async()}))
-            thread.start()
-            thread.join(timeout=30)  # 30 segundos timeout
+            # Verificar el modelo con el inventario del ModelManager (sin petición extra)
+            if not model_manager.is_available(model):
+                logger.error("❌ Modelo %s no encontrado en Ollama", model, extra=log_event("ollama.model_missing", model=model))
+                return {"success": False, "error": f"Modelo {model} no disponible"}
             
-            if thread.is_alive():
-                logger.error("❌ Timeout en llamada a Ollama")
+            # /api/generate acepta el `context` del turno anterior: Ollama no reprocesa la conversación
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": False,
+                "options": options,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+            }
+            if context is not None:
+                payload["context"] = context
+            try:
+                # Si el modelo no está cargado, el timeout cubre también la carga (recortado al plazo)
+                timeout = call_timeout(model_manager.timeout_for(model), "ollama")
+                with tracer.span("ollama.generate", model=model, reused_context=context is not None):
+                    r = requests.post(f"{self.ollama_url}/api/generate", json=payload, timeout=timeout)
+                    r.raise_for_status()
+                    result = r.json()
+            except requests.Timeout:
+                logger.error("❌ Timeout en llamada a Ollama", extra=log_event("ollama.timeout", model=model))
                 return {"success": False, "error": "Timeout - Ollama tardó demasiado en responder"}
             
-            if result and 'error' in result:
-                logger.error(f"❌ Error en Ollama: {result['error']}")
+            if 'error' in result:
+                logger.error("❌ Error en Ollama: %.200s", result['error'], extra=log_event("ollama.error", model=model))
                 return {"success": False, "error": result['error']}
             
-            if result and 'message' in result and 'content' in result['message']:
-                response_text = result['message']['content'].strip()
-                logger.info(f"✅ Ollama respondió: {response_text[:200]}...")
-                return {"success": True, "response": response_text}
+            if 'response' in result:
+                model_manager.observe_response(model, result)
+                response_text = result['response'].strip()
+                logger.info("✅ Ollama respondió: %.200s...", response_text,
+                            extra=log_event("assistant.response", assistant="ollama", model=model))
+                if session is not None:
+                    session.set_pending_context(result.get("context"), model)
+                return {"success": True, "response": response_text, "raw": result}
             else:
-                logger.error(f"❌ Formato de respuesta inesperado de Ollama: {result}")
+                logger.error("❌ Formato de respuesta inesperado de Ollama: %.200s", result,
+                             extra=log_event("ollama.bad_response", model=model))
                 return {"success": False, "error": "Formato de respuesta inesperado"}
                 
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            logger.error(f"❌ Error en call_ollama: {e}", exc_info=True)
+            logger.error("❌ Error en call_ollama: %.200s", e, exc_info=True, extra=log_event("ollama.error", model=model))
             return {"success": False, "error": str(e)}
 
 # Instancia global
 orchestrator = Orchestrator()
+# El sondeo lo arranca la API al iniciar; sin él, is_available() siempre es True
+health_poller = HealthPoller(orchestrator.services, orchestrator.ollama_url)
+# Precarga y keep-alive de los modelos (también arrancado por la API)
+model_manager = ModelManager(orchestrator.ollama_url, orchestrator.ollama_models)
 
-def orchestrate(task: str, username: str = "anonymous") -> str:
-    """Función principal que usa el orquestador"""
+def orchestrate(task: str, username: str = "anonymous", traceparent: str = None,
+                session_id: str = None, deadline: Optional[Deadline] = None, rate_limited: bool = True) -> str:
+    """Función principal que usa el orquestador (rate_limited=False: tráfico reproducido, sin límites de ritmo)"""
     if not task.strip():
         return "Por favor, escribe una pregunta."
     
-    user_id = get_or_create_user(username)
+    # Un único plazo para primario + fallbacks; el cliente puede acortarlo con X-Request-Deadline-Ms,
+    # pero nunca alargarlo más allá de REQUEST_BUDGET_SECONDS
+    budget = Deadline.after(REQUEST_BUDGET_SECONDS)
+    if deadline is None or deadline.expires_at > budget.expires_at:
+        deadline = budget
+    telemetry.gauge_add("edu_requests_in_flight", 1)
+    try:
+        with tracer.start_trace("orchestrate", traceparent, username=username) as root, deadline_scope(deadline):
+            return _orchestrate(task, username, root, session_id, rate_limited)
+    finally:
+        telemetry.gauge_add("edu_requests_in_flight", -1)
+
+def is_available(assistant: str) -> bool:
+    """Sondeo de salud de este worker + circuit breaker compartido por todos"""
+    return health_poller.is_available(assistant) and not breaker.is_open(assistant)
+
+def _orchestrate(task: str, username: str, root_span, session_id: Optional[str], rate_limited: bool) -> str:
+    request_start = time.time()
+    session = session_store.get(session_id) if session_id else None
+    with tracer.span("get_or_create_user"):
+        user_id, rol = get_user(username)
+    if rate_limited:
+        scheduler.admit(username, session_id, rol)  # RateLimited (429 en la API) si supera el ritmo de su rol
     
     # 1. Analizar qué asistente usar
-    analysis = orchestrator.analyze_query(task)
+    with tracer.span("analyze_query"):
+        analysis = orchestrator.analyze_query(task)
     primary_assistant = analysis["assistant"]
+    route = analysis["route"]
+    root_span.set_tag("route", route)
+    
+    logger.info("Consulta: '%.200s' → Asistente primario: %s", task, primary_assistant,
+                extra=log_event("query.routed", route=route))
+    
+    # Respuestas precalculadas y caché compartida entre workers, con o sin sesión: solo Ollama
+    # usa el historial, así que únicamente su respuesta a una conversación ya empezada es propia
+    shareable = session is None or not session.history or primary_assistant != "ollama"
+    cache_key = orchestrator.normalize_text(task).strip() if shareable else None
+    precomputed = answer_store.get(task) if cache_key else None
+    cached = response_cache.get(cache_key) if cache_key and not precomputed else None
+    usages = None
+    if precomputed:
+        response, latency, error_rate = precomputed["response"], time.time() - request_start, 0.0
+        final_assistant, outcome = f"{precomputed['assistant']} (precalculada)", "precomputed"
+    elif cached:
+        response, latency, error_rate = cached["response"], time.time() - request_start, 0.0
+        final_assistant, outcome = f"{cached['assistant']} (caché)", "cache"
+    else:
+        with scheduler.requester(username, rol), usage_scope() as usages:
+            response, latency, error_rate, final_assistant, outcome = _answer(task, primary_assistant, session,
+                                                                              route, root_span)
+        if cache_key and outcome == "primary":  # un fallback no debe sobrevivir a la recuperación del primario
+            response_cache.set(cache_key, {"response": response, "assistant": final_assistant})
     
-    logger.info(f"Consulta: '{task}' → Asistente primario: {primary_assistant}")
+    # 4. Loguear métrica (con los tokens de cada llamada a Ollama de la consulta)
+    with tracer.span("log_metric"):
+        log_metric(final_assistant, latency, error_rate, user_id, route=route, usages=usages)
+    root_span.set_tag("outcome", outcome)
+    root_span.set_tag("assistant", final_assistant)
+    if session is not None and outcome != "emergency":
+        session.record(task, response)
+        session_store.save(session)
+    total_latency = time.time() - request_start
+    telemetry.observe("edu_request_latency_seconds", total_latency, route=route, outcome=outcome)
+    telemetry.inc("edu_requests_total", route=route, outcome=outcome)
     
-    # 2. Intentar con el primario
-    response, latency, error_rate = orchestrator.call_assistant(primary_assistant, task)
+    # 5. Respuesta final
+    result = f"{response}\n\n(Asistente usado: {final_assistant} • Tiempo: {latency:.1f}s)"
+    traffic_capture.record(ts=request_start, username=username, query=task, response=result,
+                           route=route, assistant=final_assistant, latency=total_latency, outcome=outcome)
+    return result
+
+def _answer(task: str, primary_assistant: str, session: Optional[ChatSession], route: str,
+            root_span) -> Tuple[str, float, float, str, str]:
+    """Primario y fallbacks: (respuesta, latencia, error_rate, asistente final, outcome)"""
+    # 2. Intentar con el primario (salvo que el sondeo de salud o el breaker lo marquen caído)
+    if is_available(primary_assistant):
+        response, latency, error_rate = orchestrator.call_assistant(primary_assistant, task, session, route)
+    else:
+        logger.warning("⏭️ %s marcado como caído (sondeo de salud o breaker)", primary_assistant,
+                       extra=log_event("assistant.unavailable", assistant=primary_assistant))
+        response, latency, error_rate = "", 0.0, 1.0
     
     # 3. Fallback inteligente si falla
     fallback_used = False
+    outcome = "primary"
     final_assistant = primary_assistant.capitalize()
     
     if error_rate > 0:
-        logger.warning(f"⚠️ {primary_assistant} falló → intentando fallback")
+        logger.warning("⚠️ %s falló → intentando fallback", primary_assistant,
+                       extra=log_event("fallback.start", assistant=primary_assistant))
         
         # Orden de fallback: rule_based -> deeppavlov -> respuesta genérica
         fallback_order = ["rule_based", "deeppavlov"]
         
         for fallback in fallback_order:
-            if fallback != primary_assistant:
-                logger.info(f"🔄 Probando fallback: {fallback}")
+            if not has_budget():
+                logger.warning("⏱️ Plazo agotado: no se prueban más fallbacks",
+                               extra=log_event("deadline.exceeded", stage="fallback"))
+                telemetry.inc("edu_deadline_exceeded_total", stage="fallback")
+                root_span.set_tag("deadline_exceeded", True)
+                break
+            if fallback != primary_assistant and is_available(fallback):
+                logger.info("🔄 Probando fallback: %s", fallback, extra=log_event("fallback.try", assistant=fallback))
                 response, latency, error_rate = orchestrator.call_assistant(fallback, task)
                 final_assistant = f"{fallback.capitalize()} (fallback)"
                 fallback_used = True
+                outcome = "fallback"
                 
                 if error_rate == 0:
-                    logger.info(f"✅ Fallback exitoso con {fallback}")
+                    logger.info("✅ Fallback exitoso con %s", fallback, extra=log_event("fallback.ok", assistant=fallback))
                     break
                 else:
-                    logger.warning(f"❌ Fallback {fallback} también falló")
+                    logger.warning("❌ Fallback %s también falló", fallback, extra=log_event("fallback.failed", assistant=fallback))
         
         # Si todos los fallbacks fallaron
         if error_rate > 0:
-            logger.error("🚨 Todos los fallbacks fallaron")
+            logger.error("🚨 Todos los fallbacks fallaron", extra=log_event("fallback.exhausted"))
             response = """Lo siento, los servicios de asistencia no están disponibles en este momento. 
 
 Sugerencias:
@@ -238,14 +428,11 @@ Ejemplos de preguntas que podrían funcionar:
 - "Cuéntame un chiste"
 """
             final_assistant = "sistema (emergencia)"
+            outcome = "emergency"
             error_rate = 0.0  # No contar como error del usuario
             latency = 0.1
     
-    # 4. Loguear métrica
-    log_metric(final_assistant, latency, error_rate, user_id)
-    
-    # 5. Respuesta final
-    return f"{response}\n\n(Asistente usado: {final_assistant} • Tiempo: {latency:.1f}s)"
+    return response, latency, error_rate, final_assistant, outcome
 
 # Para pruebas locales
 if __name__ == "__main__":
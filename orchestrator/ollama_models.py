@@ -0,0 +1,236 @@
+# orchestrator/ollama_models.py - Precarga de modelos de Ollama y pings de keep-alive
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set
+
+import requests
+from telemetry import telemetry
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+# Tiempo que Ollama mantiene el modelo en memoria tras cada petición
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "10m")
+# Solo se mantienen calientes los modelos usados en esta ventana (segundos)
+OLLAMA_IDLE_WINDOW = float(os.getenv("OLLAMA_IDLE_WINDOW", "1800"))
+OLLAMA_AUTO_PULL = os.getenv("OLLAMA_AUTO_PULL", "0") == "1"
+OLLAMA_WARM_TIMEOUT = float(os.getenv("OLLAMA_WARM_TIMEOUT", "30"))
+OLLAMA_COLD_TIMEOUT = float(os.getenv("OLLAMA_COLD_TIMEOUT", "120"))
+# Por encima de este load_duration la petición se cuenta como arranque en frío
+COLD_START_THRESHOLD = 0.5
+
+telemetry.describe("edu_ollama_load_seconds", "summary", "Tiempo de carga del modelo (arranques en frío)")
+telemetry.describe("edu_ollama_inference_seconds", "summary", "Tiempo de inferencia de Ollama sin la carga del modelo")
+telemetry.describe("edu_ollama_model_loads_total", "counter", "Cargas de modelo observadas por motivo")
+telemetry.describe("edu_ollama_model_missing", "gauge", "1 si un modelo configurado no está descargado en Ollama")
+telemetry.describe("edu_ollama_tokens_total", "counter", "Tokens de prompt y generados por modelo")
+telemetry.describe("edu_ollama_tokens_per_second", "summary", "Velocidad de generación (eval_count / eval_duration)")
+
+
+@dataclass
+class GenerationUsage:
+    """Tokens y tiempos de una llamada a /api/generate (Ollama los da en nanosegundos)"""
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    prompt_eval_seconds: float = 0.0
+    eval_seconds: float = 0.0
+    load_seconds: float = 0.0
+
+    @classmethod
+    def from_response(cls, model: str, result: Dict) -> "GenerationUsage":
+        return cls(
+            model=model,
+            prompt_tokens=int(result.get("prompt_eval_count") or 0),
+            completion_tokens=int(result.get("eval_count") or 0),
+            prompt_eval_seconds=(result.get("prompt_eval_duration") or 0) / 1e9,
+            eval_seconds=(result.get("eval_duration") or 0) / 1e9,
+            load_seconds=(result.get("load_duration") or 0) / 1e9,
+        )
+
+    @property
+    def cold(self) -> bool:
+        return self.load_seconds > COLD_START_THRESHOLD
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        return self.completion_tokens / self.eval_seconds if self.eval_seconds else None
+
+    @staticmethod
+    def total(usages: List["GenerationUsage"]) -> Optional["GenerationUsage"]:
+        """Suma de las llamadas de una consulta (niveles de la cascada); el modelo es el último"""
+        if not usages:
+            return None
+        return GenerationUsage(
+            model=usages[-1].model,
+            prompt_tokens=sum(u.prompt_tokens for u in usages),
+            completion_tokens=sum(u.completion_tokens for u in usages),
+            prompt_eval_seconds=sum(u.prompt_eval_seconds for u in usages),
+            eval_seconds=sum(u.eval_seconds for u in usages),
+            load_seconds=sum(u.load_seconds for u in usages),
+        )
+
+
+_request_usage: contextvars.ContextVar = contextvars.ContextVar("request_usage", default=None)
+
+
+@contextlib.contextmanager
+def usage_scope():
+    """Recoge las GenerationUsage de las llamadas a Ollama hechas dentro del bloque (una consulta)"""
+    usages: List[GenerationUsage] = []
+    token = _request_usage.set(usages)
+    try:
+        yield usages
+    finally:
+        _request_usage.reset(token)
+
+
+def _parse_duration(value: str) -> float:
+    """'10m' → 600.0, '30s' → 30.0, '1h' → 3600.0, '300' → 300.0"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def _matches(configured: str, names: Iterable[str]) -> bool:
+    """'phi' coincide con 'phi:latest'; 'phi:2.7b' solo con esa etiqueta"""
+    return any(name == configured or name.split(":")[0] == configured for name in names)
+
+
+class ModelManager:
+    def __init__(self, ollama_url: str, models: Iterable[str]):
+        self.ollama_url = ollama_url
+        self.models = list(dict.fromkeys(models))
+        self.keep_alive_seconds = _parse_duration(OLLAMA_KEEP_ALIVE)
+        self.pulled: Set[str] = set()
+        self._last_used: Dict[str, float] = {}
+        self._warm_until: Dict[str, float] = {}
+        self._refreshed = False
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # --- Estado consultado desde el camino de la petición (sin E/S) ---
+
+    def is_available(self, model: str) -> bool:
+        """Sin inventario todavía se asume disponible y Ollama decidirá"""
+        return not self._refreshed or _matches(model, self.pulled)
+
+    def is_warm(self, model: str) -> bool:
+        return self._warm_until.get(model, 0) > time.time()
+
+    def timeout_for(self, model: str) -> float:
+        """Timeout de la petición: más largo si el modelo tiene que cargarse"""
+        return OLLAMA_WARM_TIMEOUT if self.is_warm(model) else OLLAMA_COLD_TIMEOUT
+
+    def observe_response(self, model: str, result: Dict, reason: str = "request") -> GenerationUsage:
+        """Separa carga del modelo e inferencia usando las duraciones (ns) que devuelve Ollama"""
+        now = time.time()
+        self._last_used[model] = now
+        self._warm_until[model] = now + self.keep_alive_seconds
+        usage = GenerationUsage.from_response(model, result)
+        total = result.get("total_duration", 0) / 1e9
+        if usage.cold:
+            telemetry.observe("edu_ollama_load_seconds", usage.load_seconds, model=model)
+            telemetry.inc("edu_ollama_model_loads_total", model=model, reason=reason)
+            logger.info("🧊 Carga de %s en %.1fs (%s)", model, usage.load_seconds, reason,
+                        extra=log_event("ollama.cold_load", model=model, reason=reason))
+        if total:
+            telemetry.observe("edu_ollama_inference_seconds", max(0.0, total - usage.load_seconds), model=model)
+        if reason == "request":
+            telemetry.inc("edu_ollama_tokens_total", usage.prompt_tokens, model=model, kind="prompt")
+            telemetry.inc("edu_ollama_tokens_total", usage.completion_tokens, model=model, kind="completion")
+            if usage.tokens_per_second is not None:
+                telemetry.observe("edu_ollama_tokens_per_second", usage.tokens_per_second, model=model)
+            usages = _request_usage.get()
+            if usages is not None:
+                usages.append(usage)
+        return usage
+
+    # --- Tareas de fondo ---
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ollama-models", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def refresh(self) -> None:
+        """Inventario de modelos descargados (/api/tags) y cargados en memoria (/api/ps)"""
+        r = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
+        r.raise_for_status()
+        self.pulled = {m["name"] for m in r.json().get("models", [])}
+        self._refreshed = True
+        try:
+            r = requests.get(f"{self.ollama_url}/api/ps", timeout=5)
+            if r.status_code == 200:
+                loaded = {m["name"] for m in r.json().get("models", [])}
+                for model in self.models:
+                    if not _matches(model, loaded):
+                        self._warm_until.pop(model, None)
+        except requests.RequestException:
+            pass  # versiones antiguas de Ollama no tienen /api/ps
+
+    def verify(self) -> None:
+        """Avisa (o descarga, con OLLAMA_AUTO_PULL=1) si un modelo configurado no está en Ollama"""
+        for model in self.models:
+            missing = not _matches(model, self.pulled)
+            telemetry.set_gauge("edu_ollama_model_missing", 1 if missing else 0, model=model)
+            if not missing:
+                continue
+            if OLLAMA_AUTO_PULL:
+                logger.warning("⬇️ Descargando modelo %s en Ollama...", model, extra=log_event("ollama.pull", model=model))
+                requests.post(f"{self.ollama_url}/api/pull", json={"name": model, "stream": False},
+                              timeout=3600).raise_for_status()
+            else:
+                logger.error("❌ Modelo configurado %s no está descargado en Ollama (disponibles: %s)", model,
+                             sorted(self.pulled), extra=log_event("ollama.model_missing", model=model))
+        if OLLAMA_AUTO_PULL:
+            self.refresh()
+
+    def preload(self, model: str, reason: str = "preload") -> None:
+        """Una petición sin prompt carga el modelo y renueva su keep_alive"""
+        start = time.time()
+        r = requests.post(f"{self.ollama_url}/api/generate",
+                          json={"model": model, "prompt": "", "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE},
+                          timeout=OLLAMA_COLD_TIMEOUT)
+        r.raise_for_status()
+        result = r.json()
+        if reason == "preload":
+            logger.info("🔥 Modelo %s precargado en %.1fs", model, time.time() - start,
+                        extra=log_event("ollama.preloaded", model=model))
+        last_used = self._last_used.get(model)
+        self.observe_response(model, result, reason)
+        if last_used is not None:
+            self._last_used[model] = last_used  # un ping no cuenta como tráfico
+
+    def _run(self) -> None:
+        try:
+            self.refresh()
+            self.verify()
+            for model in self.models:
+                if self.is_available(model):
+                    self.preload(model)
+                    self._last_used[model] = time.time()
+        except Exception as e:
+            logger.error("❌ No se pudieron precargar los modelos de Ollama: %.200s", e, extra=log_event("ollama.preload_failed"))
+
+        # Pings antes de que venza el keep_alive, solo para modelos con tráfico reciente
+        interval = max(30.0, self.keep_alive_seconds / 2)
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+                now = time.time()
+                for model in self.models:
+                    recently_used = now - self._last_used.get(model, 0) < OLLAMA_IDLE_WINDOW
+                    if recently_used and self.is_available(model):
+                        self.preload(model, reason="keep_alive")
+            except Exception as e:
+                logger.warning("⚠️ Error en keep-alive de Ollama: %.200s", e, extra=log_event("ollama.keep_alive_failed"))
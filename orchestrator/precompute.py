@@ -0,0 +1,198 @@
+# orchestrator/precompute.py - Job fuera de horas que precalcula respuestas frecuentes
+#
+# Reúne preguntas esperadas (temas de los asistentes) y frecuentes (tabla queries o
+# captura JSONL), las responde con los asistentes de siempre (mismo enrutado, mismos
+# fallbacks, mismo plazo) a concurrencia limitada y escribe una versión nueva del
+# almacén de answers.py, que los workers del orquestador cargan sin reiniciar.
+#
+#   docker compose exec orchestrator python precompute.py --from-db 500 --window 01:00-06:00
+#
+# Pensado para cron (p. ej. "0 1 * * *"): con --window espera a que empiece la franja y
+# deja de lanzar preguntas cuando termina; lo que no dio tiempo a recalcular conserva la
+# respuesta de la versión anterior.
+#
+# Variables de entorno:
+#   PRECOMPUTE_CONCURRENCY  preguntas en vuelo a la vez (2: Ollama no atiende más en paralelo)
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from answers import ANSWER_STORE_DIR, AnswerStore, answer_key, write_answers
+from db_utils import get_db_connection
+from common.deadline import Deadline, REQUEST_BUDGET_SECONDS, deadline_scope
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "2"))
+
+# Temas que cubren las reglas de rule-based y los contextos de deeppavlov-nlu
+EXPECTED_QUESTIONS = [
+    "Hola", "Hola, ¿cómo estás?", "¿Cómo te llamas?", "Cuéntame un chiste", "Adiós",
+    "¿Qué es la suma?", "¿Cuánto es 2+2?", "¿Cuánto es 5*5?", "¿Qué es la fotosíntesis?",
+    "¿Qué es la mitosis?", "Causas de la Revolución Francesa", "¿Cuál es la capital de Francia?",
+    "¿Cuál es la capital de España?", "¿Quién fue Einstein?", "¿Quién fue Newton?",
+    "¿Quién fue Albert Einstein?", "¿Qué son las matemáticas?", "¿Qué es el álgebra?",
+    "¿Qué fue la Revolución Francesa?", "¿Qué es el agua?", "¿Qué es la Tierra?",
+    "¿Quién fue Cristóbal Colón?", "What is photosynthesis?", "What is mitosis?",
+    "Who was Albert Einstein?", "What is algebra?",
+]
+
+
+def questions_from_file(path: str) -> List[str]:
+    """Una pregunta por línea, o JSONL con campo "query" (el formato de CAPTURE_TRAFFIC=file)"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return questions
+
+
+def questions_from_db(days: int, limit: int) -> List[Tuple[str, int]]:
+    """Consultas más repetidas de los últimos `days` días (necesita CAPTURE_TRAFFIC=db)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT query, COUNT(*) FROM queries
+        WHERE timestamp >= LOCALTIMESTAMP - %s * INTERVAL '1 day'
+        GROUP BY query ORDER BY COUNT(*) DESC LIMIT %s
+    """, (days, limit))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+
+def rank_questions(weighted: Iterable[Tuple[str, int]]) -> List[str]:
+    """Agrupa variantes con la misma clave y ordena por frecuencia; una pregunta por clave"""
+    counts: Counter = Counter()
+    text: Dict[str, str] = {}
+    for question, count in weighted:
+        key = answer_key(question)
+        if key:
+            counts[key] += count
+            text.setdefault(key, question)
+    return [text[key] for key, _ in counts.most_common()]
+
+
+def parse_window(spec: str) -> Tuple[datetime, datetime]:
+    """"HH:MM-HH:MM" → (inicio, fin) de la próxima franja (o la actual); admite cruzar medianoche"""
+    start_s, _, end_s = spec.partition("-")
+    now = datetime.now()
+    start = datetime.combine(now.date(), datetime.strptime(start_s.strip(), "%H:%M").time())
+    end = datetime.combine(now.date(), datetime.strptime(end_s.strip(), "%H:%M").time())
+    if end <= start:
+        end += timedelta(days=1)
+    if now >= end:
+        start, end = start + timedelta(days=1), end + timedelta(days=1)
+    elif end - timedelta(days=1) > now:  # estamos en la cola de la franja que empezó ayer
+        start, end = start - timedelta(days=1), end - timedelta(days=1)
+    return start, end
+
+
+def answer_question(question: str, budget: float) -> Optional[List[str]]:
+    """Responde como una consulta normal sin sesión; None si no la dio el asistente primario"""
+    from main import _answer, orchestrator, tracer
+
+    analysis = orchestrator.analyze_query(question)
+    with tracer.start_trace("precompute") as root, deadline_scope(Deadline.after(budget)):
+        response, _, error_rate, assistant, outcome = _answer(question, analysis["assistant"], None,
+                                                              analysis["route"], root)
+    # Mismo criterio que la caché: un fallback o una respuesta de emergencia no se guardan
+    if outcome != "primary" or error_rate > 0:
+        return None
+    return [response, assistant, analysis["route"]]
+
+
+def precompute(questions: List[str], concurrency: int = PRECOMPUTE_CONCURRENCY,
+               budget: float = REQUEST_BUDGET_SECONDS, until: Optional[datetime] = None) -> Dict[str, List[str]]:
+    """Respuestas {clave: [respuesta, asistente, ruta]}; deja de lanzar preguntas al llegar a `until`"""
+    answers: Dict[str, List[str]] = {}
+    stop = threading.Event()
+
+    def run(question: str) -> Tuple[str, Optional[List[str]]]:
+        if stop.is_set() or (until is not None and datetime.now() >= until):
+            stop.set()
+            return question, None
+        try:
+            return question, answer_question(question, budget)
+        except Exception as e:
+            logger.warning("⚠️ '%.200s': %.200s", question, e, extra=log_event("precompute.failed"))
+            return question, None
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(run, question) for question in questions]
+        for done, future in enumerate(as_completed(futures), 1):
+            question, entry = future.result()
+            if entry is not None:
+                answers[answer_key(question)] = entry
+            if done % 50 == 0:
+                logger.info("⏳ %d/%d preguntas (%d respondidas)", done, len(questions), len(answers),
+                            extra=log_event("precompute.progress"))
+    if stop.is_set():
+        logger.warning("⏱️ Fin de la franja: %d/%d preguntas recalculadas", len(answers), len(questions),
+                       extra=log_event("precompute.window_closed"))
+    logger.info("✅ %d respuestas en %.1fs (concurrencia %d)", len(answers), time.time() - start, concurrency,
+                extra=log_event("precompute.done"))
+    return answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula respuestas frecuentes para el orquestador")
+    parser.add_argument("--out", default=ANSWER_STORE_DIR, help="directorio del almacén (ANSWER_STORE_DIR)")
+    parser.add_argument("--questions", action="append", default=[], help="fichero de preguntas (txt o JSONL)")
+    parser.add_argument("--from-db", type=int, default=0, metavar="N", help="las N consultas más frecuentes")
+    parser.add_argument("--days", type=int, default=30, help="antigüedad máxima de las consultas de --from-db")
+    parser.add_argument("--min-count", type=int, default=2, help="repeticiones mínimas en --from-db")
+    parser.add_argument("--no-expected", action="store_true", help="no incluir las preguntas esperadas")
+    parser.add_argument("--concurrency", type=int, default=PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--budget", type=float, default=REQUEST_BUDGET_SECONDS, help="plazo por pregunta (s)")
+    parser.add_argument("--window", help="franja fuera de horas, p. ej. 01:00-06:00")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not args.out:
+        parser.error("indica --out o ANSWER_STORE_DIR")
+
+    weighted: List[Tuple[str, int]] = []
+    if args.from_db:
+        # Las consultas más repetidas van primero: si la franja se acaba, son las que quedan al día
+        weighted += [(q, c) for q, c in questions_from_db(args.days, args.from_db) if c >= args.min_count]
+    for path in args.questions:
+        weighted += [(q, 1) for q in questions_from_file(path)]
+    if not args.no_expected:
+        weighted += [(q, 1) for q in EXPECTED_QUESTIONS]
+    questions = rank_questions(weighted)
+    logger.info("📝 %d preguntas distintas a precalcular", len(questions))
+
+    until = None
+    if args.window:
+        begin, until = parse_window(args.window)
+        if datetime.now() < begin:
+            logger.info("🌙 Esperando a la franja %s (%s)", args.window, f"{begin:%Y-%m-%d %H:%M}")
+            time.sleep((begin - datetime.now()).total_seconds())
+
+    answers = precompute(questions, args.concurrency, args.budget, until)
+    # Lo que no se recalculó (fin de franja, asistente caído) mantiene la respuesta anterior
+    previous = AnswerStore(args.out)
+    previous.load()
+    keys = {answer_key(q) for q in questions}
+    carried = {k: v for k, v in previous.entries().items() if k in keys and k not in answers}
+    path = write_answers({**carried, **answers}, args.out, meta={
+        "questions": len(questions), "computed": len(answers), "carried": len(carried),
+        "previous_version": previous.version, "concurrency": args.concurrency,
+    })
+    logger.info("💾 %d respuestas (%d de la versión anterior) en %s", len(answers) + len(carried), len(carried), path)
+
+
+if __name__ == "__main__":
+    main()
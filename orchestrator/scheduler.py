@@ -0,0 +1,263 @@
+# orchestrator/scheduler.py - Reparto justo de los backends entre usuarios (WFQ por rol)
+#
+# Cada backend (ollama, deeppavlov, rule_based) tiene un número fijo de llamadas en vuelo
+# por worker (SCHEDULER_SLOTS). Cuando están ocupadas, las consultas esperan en una cola
+# de reparto justo ponderado (start-time fair queuing): cada usuario avanza su propio
+# reloj virtual en 1/peso por consulta, así quien dispara preguntas en bucle solo se
+# adelanta a sí mismo. El peso sale de users.rol (SCHEDULER_ROLE_WEIGHTS); un usuario sin
+# rol cuenta como "default", nunca como el nombre que envía el cliente.
+#
+# El reloj virtual es por nombre de usuario: el session_id lo elige el cliente, y con una
+# sesión nueva en cada consulta se empezaría siempre con el reloj a cero.
+#
+# Los lotes de /batch esperan turno como el rol "batch", con el peso más bajo.
+#
+# Además, token buckets por rol (SCHEDULER_ROLE_RATES = "rol=fichas_por_segundo:capacidad")
+# rechazan con 429 a quien se queda sin fichas antes de que llegue a ocupar cola. Hay dos:
+#   - uno por sesión (o por usuario si la consulta no trae session_id), con el ritmo del rol;
+#   - uno por nombre de usuario, SCHEDULER_USER_SESSIONS veces mayor: la UI entra con el nombre
+#     del perfil ("estudiante"...) y lo comparte toda una clase, pero cambiar de sesión no da
+#     fichas nuevas más allá de ese tope.
+# El de la sesión se consulta primero, así quien agota el suyo no gasta las fichas del resto.
+# Los buckets viven en el almacén compartido (state.py), igual que RATE_LIMIT_PER_MINUTE, así
+# que valen para todos los workers. La reproducción de tráfico (loadtest/replay.py, con
+# X-Admin-Token o en proceso) no pasa por los límites, pero sí por la cola justa.
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from state import rate_limiter
+from telemetry import telemetry
+from common.deadline import DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER", "1") == "1"
+DEFAULT_ROLE = "default"
+BATCH_ROLE = "batch"
+MAX_TRACKED_USERS = 10000
+
+telemetry.describe("edu_scheduler_wait_seconds", "summary", "Espera en la cola justa antes de llamar al backend")
+telemetry.describe("edu_scheduler_queue_depth", "gauge", "Consultas esperando turno por backend")
+telemetry.describe("edu_scheduler_rejected_total", "counter", "Consultas rechazadas por el límite de ritmo de su rol")
+
+
+def _parse_pairs(spec: str, defaults: Dict) -> Dict:
+    values = dict(defaults)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, value = item.partition("=")
+        values[key.strip().lower()] = value.strip()
+    return values
+
+
+SCHEDULER_SLOTS = {k: int(v) for k, v in _parse_pairs(
+    os.getenv("SCHEDULER_SLOTS", ""), {"ollama": 2, "deeppavlov": 4, "rule_based": 16}).items()}
+SCHEDULER_ROLE_WEIGHTS = {k: float(v) for k, v in _parse_pairs(
+    os.getenv("SCHEDULER_ROLE_WEIGHTS", ""),
+    {"profesor": 4, "docente": 4, "admin": 4, "estudiante": 1, "invitado": 0.5, BATCH_ROLE: 0.1,
+     DEFAULT_ROLE: 1}).items()}
+
+
+def _parse_rate(value: str) -> Tuple[float, float]:
+    rate, _, burst = str(value).partition(":")
+    return float(rate), float(burst or rate)
+
+
+SCHEDULER_ROLE_RATES = {k: _parse_rate(v) for k, v in _parse_pairs(
+    os.getenv("SCHEDULER_ROLE_RATES", ""),
+    {"profesor": "2:30", "docente": "2:30", "admin": "5:50", "estudiante": "1:20", "invitado": "0.2:5",
+     DEFAULT_ROLE: "0.5:10"}).items()}
+# Sesiones a pleno ritmo que caben en el bucket de un mismo nombre de usuario (una clase)
+SCHEDULER_USER_SESSIONS = float(os.getenv("SCHEDULER_USER_SESSIONS", "30"))
+
+
+class RateLimited(Exception):
+    """El usuario agotó su token bucket; retry_after en segundos"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Reintentar en {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("start", "event", "granted", "cancelled")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class FairQueue:
+    """Plazas de un backend repartidas por start-time fair queuing"""
+
+    def __init__(self, name: str, slots: int):
+        self.name = name
+        self.slots = slots
+        self.in_flight = 0
+        self.virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._heap = []
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, user: str, weight: float, timeout: Optional[float]) -> float:
+        """Bloquea hasta tener plaza; devuelve la espera en segundos"""
+        wait_start = time.perf_counter()
+        with self._lock:
+            start = max(self.virtual_time, self._last_finish.get(user, 0.0))
+            self._last_finish[user] = start + 1.0 / weight
+            if self.in_flight < self.slots and not self._waiting:
+                self.in_flight += 1
+                self.virtual_time = start
+                return 0.0
+            waiter = _Waiter(start)
+            heapq.heappush(self._heap, (start + 1.0 / weight, next(self._seq), waiter))
+            self._waiting += 1
+            telemetry.set_gauge("edu_scheduler_queue_depth", self._waiting, backend=self.name)
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted:
+                    # Se descarta al sacarlo del heap; su turno no se le devuelve
+                    waiter.cancelled = True
+                    self._waiting -= 1
+                    telemetry.set_gauge("edu_scheduler_queue_depth", self._waiting, backend=self.name)
+                    raise DeadlineExceeded("scheduler")
+        return time.perf_counter() - wait_start
+
+    def release(self) -> None:
+        with self._lock:
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                # La plaza pasa directamente al siguiente: in_flight no cambia
+                waiter.granted = True
+                self._waiting -= 1
+                self.virtual_time = waiter.start
+                telemetry.set_gauge("edu_scheduler_queue_depth", self._waiting, backend=self.name)
+                waiter.event.set()
+                return
+            self.in_flight -= 1
+            if len(self._last_finish) > MAX_TRACKED_USERS:
+                # Un usuario sin turnos pendientes equivale a uno nuevo
+                self._last_finish = {u: f for u, f in self._last_finish.items() if f > self.virtual_time}
+
+
+_current_requester: contextvars.ContextVar = contextvars.ContextVar("current_requester", default=None)
+
+
+class Scheduler:
+    def __init__(self, slots: Dict[str, int] = SCHEDULER_SLOTS, enabled: bool = SCHEDULER_ENABLED):
+        self.enabled = enabled
+        self.queues = {name: FairQueue(name, n) for name, n in slots.items()}
+        self._stats: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def role_of(rol: Optional[str]) -> str:
+        """Rol de users.rol (los desconocidos o vacíos, "default")"""
+        rol = (rol or "").strip().lower()
+        return rol if rol in SCHEDULER_ROLE_WEIGHTS else DEFAULT_ROLE
+
+    def admit(self, username: str, session_id: Optional[str], rol: Optional[str]) -> None:
+        """Límites de ritmo (compartidos entre workers): lanza RateLimited si la sesión o el usuario
+        se quedan sin fichas"""
+        retry_after = rate_limiter.exceeded(username)
+        if retry_after is None and self.enabled:
+            role = self.role_of(rol)
+            rate, burst = SCHEDULER_ROLE_RATES.get(role, SCHEDULER_ROLE_RATES[DEFAULT_ROLE])
+            rate = rate if rate > 0 else burst / 3600.0  # ritmo 0: la capacidad se rellena en una hora
+            retry_after = rate_limiter.take(f"{role}:{username}/{session_id or '-'}", rate, burst)
+            if retry_after is None:
+                retry_after = rate_limiter.take(f"{role}:{username}", rate * SCHEDULER_USER_SESSIONS,
+                                                burst * SCHEDULER_USER_SESSIONS)
+            if retry_after is not None:
+                telemetry.inc("edu_scheduler_rejected_total", role=role)
+        if retry_after is not None:
+            with self._lock:
+                self._user_stats(username, rol)["rejected"] += 1
+            raise RateLimited(retry_after)
+
+    @contextlib.contextmanager
+    def requester(self, requester: str, rol: Optional[str]):
+        """Quién pide (el nombre de usuario): lo lee slot() sin pasarlo por todas las llamadas"""
+        token = _current_requester.set((requester, rol))
+        try:
+            yield
+        finally:
+            _current_requester.reset(token)
+
+    @contextlib.contextmanager
+    def slot(self, backend: str):
+        """Espera turno justo para `backend` (como mucho, lo que quede del plazo)"""
+        requester = _current_requester.get()
+        queue = self.queues.get(backend)
+        if not self.enabled or requester is None or queue is None:
+            yield 0.0
+            return
+        username, rol = requester
+        role = self.role_of(rol)
+        deadline = current_deadline()
+        timeout = deadline.remaining() if deadline is not None else None
+        try:
+            wait = queue.acquire(username, SCHEDULER_ROLE_WEIGHTS[role], timeout)
+        except DeadlineExceeded:
+            self._record_wait(username, rol, timeout or 0.0)
+            raise
+        self._record_wait(username, rol, wait)
+        telemetry.observe("edu_scheduler_wait_seconds", wait, backend=backend, role=role)
+        try:
+            yield wait
+        finally:
+            queue.release()
+
+    def _user_stats(self, username: str, rol: Optional[str]) -> Dict:
+        stats = self._stats.get(username)
+        if stats is None:
+            stats = self._stats[username] = {"role": self.role_of(rol), "requests": 0, "rejected": 0,
+                                             "wait_sum": 0.0, "wait_max": 0.0}
+            if len(self._stats) > MAX_TRACKED_USERS:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(username)
+        return stats
+
+    def _record_wait(self, username: str, rol: Optional[str], wait: float) -> None:
+        with self._lock:
+            stats = self._user_stats(username, rol)
+            stats["requests"] += 1
+            stats["wait_sum"] += wait
+            stats["wait_max"] = max(stats["wait_max"], wait)
+
+    def snapshot(self, top: int = 20) -> Dict:
+        """Colas por backend y los usuarios que más han esperado (en este worker)"""
+        with self._lock:
+            users = [
+                {"requester": requester, "role": s["role"], "requests": s["requests"], "rejected": s["rejected"],
+                 "avg_wait_ms": round(s["wait_sum"] * 1000 / s["requests"], 2) if s["requests"] else 0,
+                 "max_wait_ms": round(s["wait_max"] * 1000, 2)}
+                for requester, s in self._stats.items()
+            ]
+        users.sort(key=lambda u: u["avg_wait_ms"], reverse=True)
+        return {
+            "enabled": self.enabled,
+            "backends": {
+                name: {"slots": q.slots, "in_flight": q.in_flight, "waiting": q._waiting}
+                for name, q in self.queues.items()
+            },
+            "users": users[:top],
+        }
+
+
+# Instancia global
+scheduler = Scheduler()
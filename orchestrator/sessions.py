@@ -0,0 +1,186 @@
+# orchestrator/sessions.py - Sesiones de chat en el servidor con reutilización del contexto de Ollama
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from telemetry import telemetry
+from state import MemoryStore, shared_store
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "1000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# Tope de tokens del contexto de Ollama; al superarlo se reinicia con los últimos turnos
+MAX_HISTORY_TOKENS = int(os.getenv("MAX_HISTORY_TOKENS", "2048"))
+MAX_HISTORY_TURNS = 20
+RESEED_TURNS = 3
+MAX_STORED_ANSWER_CHARS = 1000
+
+telemetry.describe("edu_sessions_active", "gauge", "Sesiones de chat en memoria")
+telemetry.describe("edu_sessions_evicted_total", "counter", "Sesiones expulsadas por inactividad o por el tope")
+telemetry.describe("edu_session_context_resets_total", "counter", "Contextos de Ollama reiniciados por el tope de tokens")
+
+
+class ChatSession:
+    """Historial de una conversación y tokens de contexto de Ollama (KV-cache reutilizable)"""
+
+    __slots__ = ("session_id", "history", "context", "context_model", "context_upto",
+                 "pending_context", "pending_model", "last_used", "lock", "version")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history: List[Tuple[str, str]] = []
+        self.context: Optional[array] = None   # tokens devueltos por /api/generate
+        self.context_model: Optional[str] = None  # el contexto solo sirve para el mismo modelo
+        self.context_upto = 0                  # turnos del historial ya incluidos en `context`
+        self.pending_context: Optional[array] = None
+        self.pending_model: Optional[str] = None
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+        self.version: Optional[str] = None     # versión guardada en el almacén compartido
+
+    def pending_turns(self, model: str) -> List[Tuple[str, str]]:
+        """Turnos que el modelo todavía no ha visto (p. ej. respondidos por rule_based)"""
+        if self.context is not None and self.context_model != model:
+            return self.history[-RESEED_TURNS:]  # contexto de otro modelo: transcripción corta
+        return self.history[self.context_upto:]
+
+    def ollama_context(self, model: str) -> Optional[List[int]]:
+        if self.context is None or self.context_model != model:
+            return None
+        return list(self.context)
+
+    def set_pending_context(self, context: Optional[List[int]], model: str) -> None:
+        """Lo llama call_ollama; se confirma en record() si la respuesta final es la del LLM"""
+        self.pending_context = array("I", context) if context else None
+        self.pending_model = model
+
+    def record(self, query: str, response: str) -> None:
+        with self.lock:
+            self.history.append((query, response[:MAX_STORED_ANSWER_CHARS]))
+            if self.pending_context is not None:
+                self.context = self.pending_context
+                self.context_model = self.pending_model
+                self.context_upto = len(self.history)
+                self.pending_context = None
+            if self.context is not None and len(self.context) > MAX_HISTORY_TOKENS:
+                # Reiniciar: los últimos turnos se reenviarán como transcripción resumida
+                self.context = None
+                self.context_upto = max(0, len(self.history) - RESEED_TURNS)
+                telemetry.inc("edu_session_context_resets_total")
+            while len(self.history) > MAX_HISTORY_TURNS:
+                self.history.pop(0)
+                self.context_upto = max(0, self.context_upto - 1)
+            self.last_used = time.time()
+
+    def export_state(self) -> Dict:
+        """Lo que otro worker necesita para continuar la conversación"""
+        return {
+            "version": self.version,
+            "history": self.history,
+            "context": list(self.context) if self.context is not None else None,
+            "context_model": self.context_model,
+            "context_upto": self.context_upto,
+        }
+
+    def load_state(self, state: Dict) -> None:
+        with self.lock:
+            self.version = state["version"]
+            self.history = [tuple(turn) for turn in state["history"]]
+            self.context = array("I", state["context"]) if state["context"] is not None else None
+            self.context_model = state["context_model"]
+            self.context_upto = state["context_upto"]
+
+
+class SessionStore:
+    """LRU acotado con expulsión por inactividad; con varios workers, respaldado por el almacén compartido"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_ttl: float = SESSION_IDLE_TTL, shared=None):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.shared = shared
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def get(self, session_id: str) -> ChatSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = time.time()
+            self._evict()
+            telemetry.set_gauge("edu_sessions_active", len(self._sessions))
+        if self.shared is not None:
+            self._sync(session)
+        return session
+
+    def _sync(self, session: ChatSession) -> None:
+        """Si otro worker respondió el último turno, la copia local se pone al día"""
+        try:
+            raw = self.shared.get(f"session:{session.session_id}")
+        except Exception as e:
+            logger.warning("⚠️ No se pudo leer la sesión compartida: %.200s", e, extra=log_event("session.read_failed"))
+            return
+        if raw:
+            state = json.loads(raw)
+            if state["version"] != session.version:
+                session.load_state(state)
+
+    def save(self, session: ChatSession) -> None:
+        """Publica la sesión tras cada turno (solo con almacén compartido)"""
+        if self.shared is None:
+            return
+        session.version = uuid.uuid4().hex[:12]
+        try:
+            self.shared.set(f"session:{session.session_id}", json.dumps(session.export_state()).encode("utf-8"),
+                            self.idle_ttl)
+        except Exception as e:
+            logger.warning("⚠️ No se pudo guardar la sesión compartida: %.200s", e, extra=log_event("session.write_failed"))
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            removed = self._sessions.pop(session_id, None) is not None
+            telemetry.set_gauge("edu_sessions_active", len(self._sessions))
+        if self.shared is not None:
+            try:
+                self.shared.delete(f"session:{session_id}")
+            except Exception as e:
+                logger.warning("⚠️ No se pudo borrar la sesión compartida: %.200s", e,
+                               extra=log_event("session.delete_failed"))
+        return removed
+
+    def _evict(self) -> None:
+        evicted = 0
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            evicted += 1
+        now = time.time()
+        if now - self._last_sweep > 60:
+            self._last_sweep = now
+            # El orden LRU permite parar en la primera sesión activa
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if now - oldest.last_used < self.idle_ttl:
+                    break
+                self._sessions.popitem(last=False)
+                evicted += 1
+        if evicted:
+            telemetry.inc("edu_sessions_evicted_total", evicted)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# Instancia global (con un solo proceso no hace falta pasar por el almacén)
+session_store = SessionStore(shared=None if isinstance(shared_store, MemoryStore) else shared_store)
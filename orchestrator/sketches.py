@@ -0,0 +1,60 @@
+# orchestrator/sketches.py - HyperLogLog para contar usuarios distintos en los rollups
+import hashlib
+import math
+from typing import Iterable, Optional, Tuple
+
+# 2^10 registros de 1 byte → 1 KB por sketch, error típico ~3%
+HLL_PRECISION = 10
+HLL_REGISTERS = 1 << HLL_PRECISION
+_HASH_BITS = 64
+
+
+def hll_position(value) -> Tuple[int, int]:
+    """Devuelve (registro, rango) de un valor para actualizar el sketch"""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    h = int.from_bytes(digest, "big")
+    index = h >> (_HASH_BITS - HLL_PRECISION)
+    rest = h & ((1 << (_HASH_BITS - HLL_PRECISION)) - 1)
+    rank = (_HASH_BITS - HLL_PRECISION) - rest.bit_length() + 1
+    return index, rank
+
+
+def hll_empty() -> bytearray:
+    return bytearray(HLL_REGISTERS)
+
+
+def hll_single(value: Optional[object]) -> bytes:
+    """Sketch con un único valor (o vacío si el valor es None)"""
+    registers = hll_empty()
+    if value is not None:
+        index, rank = hll_position(value)
+        registers[index] = rank
+    return bytes(registers)
+
+
+def hll_add(registers: bytearray, value) -> None:
+    index, rank = hll_position(value)
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def hll_merge(sketches: Iterable) -> bytes:
+    """Une varios sketches tomando el máximo de cada registro"""
+    sketches = [bytes(s) for s in sketches if s]
+    if not sketches:
+        return bytes(HLL_REGISTERS)
+    if len(sketches) == 1:
+        return sketches[0]
+    return bytes(map(max, *sketches))
+
+
+def hll_estimate(registers) -> int:
+    """Estimación de cardinalidad con corrección para rangos pequeños"""
+    registers = bytes(registers)
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
@@ -0,0 +1,438 @@
+# orchestrator/state.py - Estado compartido entre workers y réplicas del orquestador
+#
+# STATE_STORE elige dónde vive el estado que debe verse igual desde todos los procesos
+# (caché de respuestas, circuit breakers, contadores de ritmo y sesiones de chat):
+#   memory                              un solo proceso (defecto, como antes)
+#   sqlite:/dev/shm/edu-orchestrator.db varios workers en el mismo host (tmpfs = memoria compartida)
+#   redis://redis:6379/0                varias réplicas (cualquier servidor que hable RESP)
+#
+# Cada worker mantiene además una L1 pequeña (STATE_L1_SIZE claves, STATE_L1_TTL segundos)
+# para las claves calientes de la caché de respuestas y del breaker.
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from telemetry import telemetry
+from common.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+STATE_STORE = os.getenv("STATE_STORE", "memory")
+STATE_L1_SIZE = int(os.getenv("STATE_L1_SIZE", "256"))
+STATE_L1_TTL = float(os.getenv("STATE_L1_TTL", "2"))
+# 0 desactiva la caché de respuestas
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+# El breaker abre tras BREAKER_THRESHOLD fallos en BREAKER_WINDOW segundos y se cierra solo tras BREAKER_COOLDOWN
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "30"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+# Consultas por usuario y minuto (0 = sin límite)
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+
+telemetry.describe("edu_response_cache_total", "counter", "Consultas servidas o no desde la caché de respuestas")
+telemetry.describe("edu_breaker_open_total", "counter", "Aperturas del circuit breaker por asistente")
+telemetry.describe("edu_rate_limited_total", "counter", "Consultas rechazadas por el límite por usuario")
+telemetry.describe("edu_state_store_errors_total", "counter", "Errores del almacén de estado compartido")
+
+
+# --- Almacenes ---
+
+def _gcra(tat: float, now: float, rate: float, burst: float) -> Tuple[float, float]:
+    """Token bucket como GCRA: `tat` es el instante en que el bucket volvería a estar lleno.
+    Devuelve (tat nuevo, 0) si había ficha o (tat sin cambios, segundos hasta la siguiente ficha)"""
+    new_tat = max(tat, now) + 1.0 / rate
+    wait = new_tat - now - burst / rate
+    return (tat, wait) if wait > 0 else (new_tat, 0.0)
+
+
+class MemoryStore:
+    """Diccionario del proceso: correcto solo con un worker"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[object, Optional[float]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            value, expires_at = self._data.get(key, (0, None))
+            if expires_at is not None and expires_at < time.time():
+                value, expires_at = 0, None
+            value += amount
+            if expires_at is None and ttl:
+                expires_at = time.time() + ttl
+            self._data[key] = (value, expires_at)
+            return value
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Gasta una ficha del token bucket `key`: 0 si la había, si no segundos hasta la siguiente"""
+        with self._lock:
+            now = time.time()
+            item = self._data.get(key)
+            tat = item[0] if item is not None and item[1] >= now else now
+            tat, wait = _gcra(tat, now, rate, burst)
+            if not wait:
+                self._data[key] = (tat, tat)  # lleno otra vez = como si no existiera
+            return wait
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteStore:
+    """Fichero SQLite en modo WAL: lo comparten todos los workers del host (en /dev/shm no toca disco)"""
+
+    _PURGE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                expires_at REAL
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # es una caché: no hace falta sobrevivir a un corte
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                             (key, value, time.time() + ttl if ttl else None))
+        self._maybe_purge()
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Un contador vencido vuelve a empezar con su TTL nuevo
+            conn.execute("""
+                INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    value = CASE WHEN kv.expires_at < ? THEN excluded.value ELSE kv.value + excluded.value END,
+                    expires_at = CASE WHEN kv.expires_at < ? THEN excluded.expires_at ELSE kv.expires_at END
+            """, (key, amount, now + ttl if ttl else None, now, now))
+            value = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_purge()
+        return int(value)
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            tat, wait = _gcra(float(row[0]) if row is not None and row[1] >= now else now, now, rate, burst)
+            if not wait:
+                conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, tat, tat))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_purge()
+        return wait
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _maybe_purge(self) -> None:
+        self._writes += 1
+        if self._writes % self._PURGE_EVERY == 0:
+            self._conn().execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+
+
+class RedisStore:
+    """Cliente RESP mínimo (GET/SET/INCRBY/PEXPIRE/DEL/EVAL) con una conexión por hilo"""
+
+    # El mismo GCRA que _gcra(), atómico en el servidor (un solo viaje, sin carreras entre réplicas).
+    # Devuelve texto: Redis truncaría un número de Lua a entero
+    _TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or ARGV[1]), now)
+local new_tat = tat + tonumber(ARGV[2])
+local wait = new_tat - now - tonumber(ARGV[3])
+if wait > 0 then return tostring(wait) end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return '0'
+"""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = float(os.getenv("STATE_STORE_TIMEOUT", "0.5"))
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock, self._local.reader = sock, sock.makefile("rb")
+        if self.password:
+            self._send("AUTH", self.password)
+        if self.db:
+            self._send("SELECT", self.db)
+
+    def _send(self, *args):
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._local.sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("conexión cerrada por el servidor")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = self._local.reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._read() for _ in range(size)]
+        raise RuntimeError(f"Respuesta RESP inesperada: {line!r}")
+
+    def _command(self, *args):
+        # Un reintento con conexión nueva (el servidor pudo cerrar una conexión ociosa)
+        for attempt in range(2):
+            try:
+                if getattr(self._local, "sock", None) is None:
+                    self._connect()
+                return self._send(*args)
+            except (OSError, ConnectionError):
+                sock = getattr(self._local, "sock", None)
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._command("GET", key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self._command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self._command("SET", key, value)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = self._command("INCRBY", key, amount)
+        if ttl and value == amount:  # clave nueva: la ventana empieza ahora
+            self._command("PEXPIRE", key, int(ttl * 1000))
+        return value
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        return float(self._command("EVAL", self._TAKE_SCRIPT, 1, key, repr(time.time()), repr(1.0 / rate),
+                                   repr(burst / rate)))
+
+    def delete(self, key: str) -> None:
+        self._command("DEL", key)
+
+
+def open_store(spec: str = STATE_STORE):
+    if spec == "memory":
+        return MemoryStore()
+    if spec.startswith("sqlite:"):
+        return SQLiteStore(spec[len("sqlite:"):])
+    if spec.startswith(("redis://", "rediss://")):
+        return RedisStore(spec)
+    raise ValueError(f"STATE_STORE desconocido: {spec}")
+
+
+class LocalCache:
+    """L1 por worker: LRU pequeño con TTL corto delante del almacén compartido"""
+
+    def __init__(self, size: int = STATE_L1_SIZE, ttl: float = STATE_L1_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[object, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Devuelve (encontrado, valor); un valor None en caché también cuenta como encontrado"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] < time.time():
+                return False, None
+            self._items.move_to_end(key)
+            return True, item[0]
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._items[key] = (value, time.time() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+# --- Usos del almacén ---
+
+class ResponseCache:
+    """Respuestas a consultas sin sesión, compartidas entre workers (clave: texto normalizado)"""
+
+    def __init__(self, store, ttl: float = RESPONSE_CACHE_TTL):
+        self.store = store
+        self.ttl = ttl
+        self.enabled = ttl > 0
+        self.l1 = LocalCache()
+
+    def get(self, normalized_query: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        key = f"resp:{normalized_query}"
+        found, value = self.l1.get(key)
+        if not found:
+            try:
+                raw = self.store.get(key)
+            except Exception as e:
+                telemetry.inc("edu_state_store_errors_total", op="cache_get")
+                logger.warning("⚠️ Almacén de estado no disponible: %.200s", e, extra=log_event("state.unavailable"))
+                return None
+            value = json.loads(raw) if raw else None
+            self.l1.put(key, value)
+        telemetry.inc("edu_response_cache_total", result="hit" if value else "miss")
+        return value
+
+    def set(self, normalized_query: str, entry: Dict) -> None:
+        if not self.enabled:
+            return
+        key = f"resp:{normalized_query}"
+        try:
+            self.store.set(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"), self.ttl)
+        except Exception as e:
+            telemetry.inc("edu_state_store_errors_total", op="cache_set")
+            logger.warning("⚠️ No se pudo guardar en la caché de respuestas: %.200s", e,
+                           extra=log_event("state.cache_write_failed"))
+            return
+        self.l1.put(key, entry)
+
+
+class CircuitBreaker:
+    """Deja de enviar tráfico a un asistente que acumula fallos; el estado lo ven todos los workers"""
+
+    def __init__(self, store, threshold: int = BREAKER_THRESHOLD, window: float = BREAKER_WINDOW,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.store = store
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.l1 = LocalCache(ttl=min(STATE_L1_TTL, 1.0))
+
+    def is_open(self, assistant: str) -> bool:
+        key = f"breaker:open:{assistant}"
+        found, is_open = self.l1.get(key)
+        if not found:
+            try:
+                is_open = self.store.get(key) is not None
+            except Exception:
+                telemetry.inc("edu_state_store_errors_total", op="breaker_get")
+                is_open = False  # sin almacén, el breaker no bloquea
+            self.l1.put(key, is_open)
+        return is_open
+
+    def record_failure(self, assistant: str) -> None:
+        try:
+            failures = self.store.incr(f"breaker:fail:{assistant}", 1, self.window)
+            if failures == self.threshold:
+                self.store.set(f"breaker:open:{assistant}", b"1", self.cooldown)
+                self.store.delete(f"breaker:fail:{assistant}")
+                self.l1.put(f"breaker:open:{assistant}", True)
+                telemetry.inc("edu_breaker_open_total", assistant=assistant)
+                logger.warning("🔌 Breaker abierto para %s durante %.0fs (%d fallos en %.0fs)", assistant, self.cooldown,
+                               failures, self.window, extra=log_event("breaker.open", assistant=assistant))
+        except Exception:
+            telemetry.inc("edu_state_store_errors_total", op="breaker_incr")
+
+
+class RateLimiter:
+    """Token buckets en el almacén compartido (take() es atómico en los tres): el límite es el mismo
+    con uno o con varios workers/réplicas. Lo usa scheduler.admit() para RATE_LIMIT_PER_MINUTE y los buckets por rol"""
+
+    def __init__(self, store, limit: int = RATE_LIMIT_PER_MINUTE):
+        self.store = store
+        self.limit = limit
+
+    def take(self, key: str, rate: float, burst: float) -> Optional[float]:
+        """Gasta una ficha del bucket `key` (`rate` fichas/s, capacidad `burst`): None si la había,
+        si no segundos hasta la siguiente"""
+        try:
+            wait = self.store.take(f"rate:{key}", rate, burst)
+        except Exception:
+            telemetry.inc("edu_state_store_errors_total", op="rate_take")
+            return None  # sin almacén no se limita
+        return wait or None
+
+    def exceeded(self, key: str) -> Optional[float]:
+        """Segundos hasta poder consultar si `key` agotó RATE_LIMIT_PER_MINUTE; None si no.
+        Es un bucket de `limit` fichas que se rellena en un minuto: sin ráfagas dobles entre ventanas"""
+        if self.limit <= 0:
+            return None
+        retry_after = self.take(f"minute:{key}", self.limit / 60, self.limit)
+        if retry_after is not None:
+            telemetry.inc("edu_rate_limited_total")
+        return retry_after
+
+
+# Instancias globales (una por worker, todas sobre el mismo almacén)
+shared_store = open_store()
+response_cache = ResponseCache(shared_store)
+breaker = CircuitBreaker(shared_store)
+rate_limiter = RateLimiter(shared_store)
+logger.info("🗄️ Estado compartido en: %s", STATE_STORE)
+if isinstance(shared_store, MemoryStore) and int(os.getenv("UVICORN_WORKERS", "1")) > 1:
+    logger.warning("⚠️ Varios workers con STATE_STORE=memory: caché, breakers, límites y sesiones no se comparten")
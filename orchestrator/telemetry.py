@@ -0,0 +1,177 @@
+# orchestrator/telemetry.py - Histogramas de latencia en memoria y exportación Prometheus
+import math
+import threading
+from typing import Dict, Iterable, Tuple
+
+# Buckets log-lineales estilo HDR: 16 sub-buckets por potencia de 2 (error relativo < 4%)
+_SUB_BUCKETS = 16
+_MIN_EXP = -19   # 2^-20 s ≈ 1 µs
+_MAX_EXP = 12    # 2^12 s ≈ 68 min
+_NUM_BUCKETS = (_MAX_EXP - _MIN_EXP + 1) * _SUB_BUCKETS + 1
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _bucket_index(value: float) -> int:
+    if value <= 0:
+        return 0
+    mantissa, exp = math.frexp(value)  # value = mantissa * 2^exp, mantissa en [0.5, 1)
+    if exp < _MIN_EXP:
+        return 0
+    if exp > _MAX_EXP:
+        return _NUM_BUCKETS - 1
+    sub = int((mantissa - 0.5) * 2 * _SUB_BUCKETS)
+    return 1 + (exp - _MIN_EXP) * _SUB_BUCKETS + sub
+
+
+def _bucket_upper_bound(index: int) -> float:
+    if index == 0:
+        return math.ldexp(0.5, _MIN_EXP)
+    exp, sub = divmod(index - 1, _SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 1) / (2 * _SUB_BUCKETS), exp + _MIN_EXP)
+
+
+class LatencyHistogram:
+    """Histograma de latencias (segundos) con buckets fijos, fusionable entre procesos"""
+
+    __slots__ = ("_lock", "counts", "count", "sum", "max")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = _bucket_index(value)  # fuera del lock
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        counts, count, total, maximum = other.snapshot()
+        with self._lock:
+            for i, c in enumerate(counts):
+                if c:
+                    self.counts[i] += c
+            self.count += count
+            self.sum += total
+            self.max = max(self.max, maximum)
+
+    def snapshot(self) -> Tuple[list, int, float, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    def percentiles(self, quantiles: Iterable[float] = DEFAULT_QUANTILES) -> Dict[float, float]:
+        counts, count, _, maximum = self.snapshot()
+        result = {}
+        for q in quantiles:
+            if not count:
+                result[q] = 0.0
+                continue
+            target = max(1, math.ceil(q * count))
+            seen = 0
+            for i, c in enumerate(counts):
+                seen += c
+                if seen >= target:
+                    result[q] = min(_bucket_upper_bound(i), maximum)
+                    break
+        return result
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Telemetry:
+    """Registro en proceso de histogramas, contadores y gauges (sin base de datos)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._histograms: Dict[str, Dict[tuple, LatencyHistogram]] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._gauges: Dict[str, Dict[tuple, float]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        key = _label_key(labels)
+        series = self._histograms.get(name)
+        hist = series.get(key) if series else None
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(name, {}).setdefault(key, LatencyHistogram())
+        return hist
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        self.histogram(name, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def gauge_add(self, name: str, delta: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + delta
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def render_prometheus(self) -> str:
+        """Formato de texto de Prometheus (0.0.4); los histogramas salen como summary"""
+        lines = []
+        with self._lock:
+            histograms = {n: dict(s) for n, s in self._histograms.items()}
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            gauges = {n: dict(s) for n, s in self._gauges.items()}
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "summary")
+            for key, hist in sorted(series.items()):
+                for q, value in hist.percentiles().items():
+                    quantile = f'quantile="{q}"'
+                    lines.append(f"{name}{_format_labels(key, quantile)} {value:.6f}")
+                _, count, total, _ = hist.snapshot()
+                lines.append(f"{name}_sum{_format_labels(key)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        for kind, metrics in (("counter", counters), ("gauge", gauges)):
+            for name, series in sorted(metrics.items()):
+                self._header(lines, name, kind)
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name, kind):
+        _, help_text = self._help.get(name, (kind, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+# Instancia global
+telemetry = Telemetry()
+telemetry.describe("edu_assistant_latency_seconds", "summary", "Latencia de cada llamada a un asistente")
+telemetry.describe("edu_assistant_errors_total", "counter", "Llamadas fallidas por asistente")
+telemetry.describe("edu_assistant_in_flight", "gauge", "Llamadas en curso por asistente (profundidad de cola)")
+telemetry.describe("edu_request_latency_seconds", "summary", "Latencia de extremo a extremo por ruta y resultado")
+telemetry.describe("edu_requests_total", "counter", "Consultas procesadas por ruta y resultado")
+telemetry.describe("edu_requests_in_flight", "gauge", "Consultas en curso en el orquestador")
@@ -1,32 +1,80 @@
+import contextvars
 import time
-import ollama
-import spacy
-import requests
 import os
-from typing import Tuple
-# ← CORREGIDO: make_classification viene de sklearn.datasets
-from sklearn.datasets import make_classification
-from sklearn.ensemble import RandomForestClassifier
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+from common.deadline import call_timeout, deadline_headers
+from common.transport import AssistantClient, AssistantRequest
+from scheduler import scheduler
+from common.logs import log_event
 
+# ollama, spacy y sklearn se importan dentro de cada wrapper: importar este
+# módulo solo cuesta lo que cuestan los wrappers HTTP
 
+logger = logging.getLogger(__name__)
+
+# Artefactos de modelos entrenados: <nombre>-v<versión>.joblib
+MODEL_ARTIFACT_DIR = os.getenv("MODEL_ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts"))
+
+# Conexiones keep-alive por wrapper HTTP (y peticiones en vuelo en process_batch)
+WRAPPER_HTTP_POOL = int(os.getenv("WRAPPER_HTTP_POOL", "16"))
+# Ollama atiende OLLAMA_NUM_PARALLEL peticiones a la vez; más hilos solo hacen cola
+WRAPPER_LLM_CONCURRENCY = int(os.getenv("WRAPPER_LLM_CONCURRENCY", "2"))
+NLU_BATCH_SIZE = int(os.getenv("NLU_BATCH_SIZE", "256"))
+# NLUWrapper solo usa entidades: el resto del pipeline de spaCy se desactiva
+NLU_COMPONENTS = ("tok2vec", "ner")
+
+# Resultado por consulta: (salida, latencia, error_rate), igual que process()
+Result = Tuple[str, float, float]
+
+# nombre -> clase del wrapper (se rellena con @register)
+WRAPPERS: Dict[str, Callable] = {}
+
+
+def register(name: str):
+    def decorator(cls):
+        cls.name = name
+        WRAPPERS[name] = cls
+        return cls
+    return decorator
+
+
+def artifact_path(name: str, version: int) -> str:
+    return os.path.join(MODEL_ARTIFACT_DIR, f"{name}-v{version}.joblib")
+
+
+def map_concurrent(process: Callable[[str], Result], queries: List[str], workers: int) -> List[Result]:
+    """process_batch de los wrappers remotos: una petición por consulta, `workers` en vuelo"""
+    if len(queries) <= 1 or workers <= 1:
+        return [process(query) for query in queries]
+    # Cada consulta corre en una copia del contexto del llamante (solicitante del scheduler, plazo)
+    contexts = [contextvars.copy_context() for _ in queries]
+    with ThreadPoolExecutor(max_workers=min(workers, len(queries))) as pool:
+        return list(pool.map(lambda context, query: context.run(process, query), contexts, queries))
+
+
+def amortized(outputs: List[str], start: float) -> List[Result]:
+    """En inferencia vectorizada cada consulta se lleva su parte del tiempo total"""
+    latency = (time.time() - start) / max(1, len(outputs))
+    return [(output, latency, 0.0) for output in outputs]
+
+
+@register("rule_based")
 class RuleBasedWrapper:
     def __init__(self):
-        self.api_url = f"{os.getenv('RULE_BASED_HOST', 'http://rule-based:5001')}/query"
+        self.client = AssistantClient(os.getenv('RULE_BASED_HOST', 'http://rule-based:5001'), WRAPPER_HTTP_POOL)
 
     def process(self, query):
         start = time.time()
-        payload = {"query": query}
         try:
-            r = requests.post(self.api_url, json=payload, timeout=10)
-            r.raise_for_status()
-            data = r.json()
-           # ACEPTA AMBOS FORMATOS
-            if "output_data" in data and "response" in data["output_data"]:
-                output = data["output_data"]["response"]
-            elif "response" in data:
-                output = data["response"]
-            else:
-                output = "Rule-based devolvió formato inesperado"
+            # AssistantResponse ACEPTA AMBOS FORMATOS (msgpack tipado o JSON histórico)
+            with scheduler.slot("rule_based"):
+                data = self.client.query(AssistantRequest(query), headers=deadline_headers(),
+                                         timeout=call_timeout(10, "rule_based"))
+            output = data.response
             error_rate = 0.0
         except Exception as e:
             output = f"[Rule-based error]: {e}"
@@ -34,20 +82,22 @@ class RuleBasedWrapper:
         latency = time.time() - start
         return output, latency, error_rate
 
+    def process_batch(self, queries: List[str]) -> List[Result]:
+        return map_concurrent(self.process, queries, WRAPPER_HTTP_POOL)
+
 
+@register("deeppavlov")
 class DeepPavlovWrapper:
     def __init__(self):
-        self.api_url = f"{os.getenv('DEEPPAVLOV_HOST', 'http://deeppavlov-nlu:5002')}/query"
+        self.client = AssistantClient(os.getenv('DEEPPAVLOV_HOST', 'http://deeppavlov-nlu:5002'), WRAPPER_HTTP_POOL)
 
     def process(self, query: str) -> Tuple[str, float, float]:
         start = time.time()
-        payload = {"query": query}
         try:
-            r = requests.post(self.api_url, json=payload, timeout=30)
-            r.raise_for_status()
-            data = r.json()
-            # TU WRAPPER DEVUELVE {"response": "..."} → ¡ACEPTAMOS ESO!
-            output = data.get("response", "DeepPavlov no devolvió respuesta")
+            with scheduler.slot("deeppavlov"):
+                data = self.client.query(AssistantRequest(query), headers=deadline_headers(),
+                                         timeout=call_timeout(30, "deeppavlov"))
+            output = data.response or "DeepPavlov no devolvió respuesta"
             error_rate = 0.0
         except Exception as e:
             output = f"[DeepPavlov error]: {e}"
@@ -55,14 +105,23 @@ class DeepPavlovWrapper:
         latency = time.time() - start
         return output, latency, error_rate
 
+    def process_batch(self, queries: List[str]) -> List[Result]:
+        return map_concurrent(self.process, queries, WRAPPER_HTTP_POOL)
+
+@register("llm")
 class LLMWrapper:
-    def __init__(self):
-        self.model = 'tinyllama'
+    def __init__(self, model=None):
+        import ollama
+
+        self.model = model or os.getenv('LLM_WRAPPER_MODEL', 'tinyllama')
+        # Mismo servidor que el orquestador: ollama.chat a secas usaría OLLAMA_HOST (localhost)
+        self.client = ollama.Client(host=os.getenv('OLLAMA_URL', 'http://ollama:11434'))
 
     def process(self, query):
         start = time.time()
         try:
-            resp = ollama.chat(model=self.model, messages=[{'role': 'user', 'content': query}])
+            with scheduler.slot("ollama"):
+                resp = self.client.chat(model=self.model, messages=[{'role': 'user', 'content': query}])
             output = resp['message']['content']
             error_rate = 0.0
         except Exception as e:
@@ -71,27 +130,160 @@ class LLMWrapper:
         latency = time.time() - start
         return output, latency, error_rate
 
+    def process_batch(self, queries: List[str]) -> List[Result]:
+        # El cliente de ollama ya reutiliza conexiones; aquí solo se limita el paralelismo
+        return map_concurrent(self.process, queries, WRAPPER_LLM_CONCURRENCY)
+
 
+@register("nlu")
 class NLUWrapper:
     def __init__(self):
-        self.nlp = spacy.load('en_core_web_sm')
+        import spacy
+
+        self.nlp = spacy.load(os.getenv('SPACY_MODEL', 'en_core_web_sm'))
+        self.nlp.select_pipes(enable=[name for name in self.nlp.pipe_names if name in NLU_COMPONENTS])
+
+    @staticmethod
+    def format_entities(doc) -> str:
+        entities = [(ent.text, ent.label_) for ent in doc.ents]
+        return f"Entidades detectadas: {entities}"
 
     def process(self, query):
         start = time.time()
-        doc = self.nlp(query)
-        entities = [(ent.text, ent.label_) for ent in doc.ents]
+        output = self.format_entities(self.nlp(query))
         latency = time.time() - start
-        return f"Entidades detectadas: {entities}", latency, 0.0
+        return output, latency, 0.0
+
+    def process_batch(self, queries: List[str]) -> List[Result]:
+        start = time.time()
+        try:
+            outputs = [self.format_entities(doc) for doc in self.nlp.pipe(queries, batch_size=NLU_BATCH_SIZE)]
+        except Exception as e:
+            return [(f"[NLU error]: {e}", 0.0, 1.0)] * len(queries)
+        return amortized(outputs, start)
 
 
+@register("ml")
 class MLWrapper:
+    # Subir la versión cuando cambien los datos o los hiperparámetros de train()
+    ARTIFACT_NAME = "ml_recommender"
+    ARTIFACT_VERSION = 1
+
     def __init__(self):
+        self.model = self.load()
+
+    @classmethod
+    def train(cls):
+        # ← CORREGIDO: make_classification viene de sklearn.datasets
+        from sklearn.datasets import make_classification
+        from sklearn.ensemble import RandomForestClassifier
+
         X, y = make_classification(n_samples=100, random_state=42)
-        self.model = RandomForestClassifier()
-        self.model.fit(X, y)
+        model = RandomForestClassifier(random_state=42)
+        model.fit(X, y)
+        return model
+
+    @classmethod
+    def save(cls, model) -> str:
+        import joblib
+        import sklearn
+
+        path = artifact_path(cls.ARTIFACT_NAME, cls.ARTIFACT_VERSION)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        joblib.dump({
+            "model": model,
+            "version": cls.ARTIFACT_VERSION,
+            "sklearn_version": sklearn.__version__,
+            "trained_at": datetime.now().isoformat(),
+        }, tmp)
+        os.replace(tmp, path)  # otro proceso nunca ve un artefacto a medio escribir
+        return path
+
+    @classmethod
+    def load(cls):
+        """Carga el artefacto de la versión actual; solo entrena si no existe o no es compatible"""
+        import joblib
+        import sklearn
+
+        path = artifact_path(cls.ARTIFACT_NAME, cls.ARTIFACT_VERSION)
+        if os.path.exists(path):
+            artifact = joblib.load(path)
+            if artifact.get("sklearn_version") == sklearn.__version__:
+                return artifact["model"]
+            logger.warning("⚠️ %s se entrenó con scikit-learn %s, se reentrena con %s", path,
+                           artifact.get("sklearn_version"), sklearn.__version__)
+        model = cls.train()
+        logger.info("💾 Modelo ML guardado en %s", cls.save(model))
+        return model
+
+    def features(self, queries: List[str]):
+        """Matriz (n_consultas, n_features): la longitud de la consulta repetida en cada columna"""
+        import numpy as np
+
+        lengths = np.fromiter(map(len, queries), dtype=float, count=len(queries))
+        return np.broadcast_to(lengths[:, None], (len(queries), self.model.n_features_in_))
 
     def process(self, query):
         start = time.time()
-        pred = self.model.predict([[len(query)] * 20])[0]
+        pred = self.model.predict(self.features([query]))[0]
         latency = time.time() - start
-        return f"Recomendación educativa (ML): nivel {pred}", latency, 0.0
\ No newline at end of file
+        return f"Recomendación educativa (ML): nivel {pred}", latency, 0.0
+
+    def process_batch(self, queries: List[str]) -> List[Result]:
+        if not queries:
+            return []
+        start = time.time()
+        try:
+            preds = self.model.predict(self.features(queries))
+        except Exception as e:
+            return [(f"[ML error]: {e}", 0.0, 1.0)] * len(queries)
+        return amortized([f"Recomendación educativa (ML): nivel {pred}" for pred in preds], start)
+
+
+class AssistantRegistry:
+    """Construye cada wrapper la primera vez que se pide y lo reutiliza después"""
+
+    def __init__(self, factories: Dict[str, Callable]):
+        self.factories = factories
+        self._instances: Dict[str, object] = {}
+        self._load_times: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return list(self.factories)
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self.factories:
+            raise KeyError(f"Asistente desconocido: {name} (disponibles: {', '.join(self.factories)})")
+        with self._lock:
+            if name not in self._instances:
+                start = time.time()
+                self._instances[name] = self.factories[name]()
+                self._load_times[name] = time.time() - start
+                logger.info("📦 Wrapper %s cargado en %.2fs", name, self._load_times[name],
+                            extra=log_event("wrapper.loaded", wrapper=name))
+            return self._instances[name]
+
+    def process(self, name: str, query: str) -> Tuple[str, float, float]:
+        return self.get(name).process(query)
+
+    def process_batch(self, name: str, queries: List[str]) -> List[Result]:
+        return self.get(name).process_batch(queries)
+
+    def loaded(self) -> Dict[str, float]:
+        """Wrappers ya construidos y lo que tardaron en cargarse (segundos)"""
+        return dict(self._load_times)
+
+
+# Instancia global
+registry = AssistantRegistry(WRAPPERS)
+
+
+if __name__ == "__main__":
+    # python wrappers.py → (re)entrena y guarda los artefactos versionados
+    logging.basicConfig(level=logging.INFO)
+    print(f"💾 {MLWrapper.save(MLWrapper.train())}")
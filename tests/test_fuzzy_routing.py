@@ -0,0 +1,66 @@
+# tests/test_fuzzy_routing.py - Consultas con erratas: enrutado del orquestador y reglas de rule_based
+#
+#   python -m pytest tests/
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "orchestrator"), os.path.join(ROOT, "assistants", "rule-based")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import pytest  # noqa: E402
+
+from common.fuzzy import FuzzyIndex  # noqa: E402
+from common.transport import AssistantResponse  # noqa: E402
+from rules import FALLBACK, matcher  # noqa: E402
+import main  # noqa: E402
+
+TYPOS = ["fotosintessis", "fotosintesis", "mitossis", "revolucion fracesa"]
+
+
+@pytest.mark.parametrize("query", TYPOS)
+def test_typos_route_to_rule_based(query):
+    assert main.orchestrator.analyze_query(query)["assistant"] == "rule_based"
+
+
+@pytest.mark.parametrize("query", TYPOS)
+def test_rule_based_answers_typos(query):
+    response, match = matcher.answer(query)
+    assert match["match"] == "fuzzy"
+    assert response != FALLBACK
+
+
+@pytest.mark.parametrize("keyword", main.RULE_FUZZY_KEYWORDS)
+def test_fuzzy_keywords_are_answered_by_rules(keyword):
+    # El orquestador solo reencamina lo que el índice de rules.py sabe contestar
+    assert matcher.answer(keyword)[1]["match"] != "miss"
+
+
+def test_unrelated_queries_still_go_to_ollama():
+    assert main.orchestrator.analyze_query("cuentame algo sobre los volcanes")["assistant"] == "ollama"
+    assert matcher.answer("capital")[1]["match"] == "miss"
+
+
+def test_topics_only_for_short_queries():
+    # Una palabra suelta no basta para contestar una consulta larga con la regla de su tema
+    assert matcher.answer("mitossis")[1]["match"] == "fuzzy"
+    assert matcher.answer("en que se diferencian la mitosis y la meiosis")[1]["match"] == "miss"
+
+
+def test_single_word_needs_topic_index():
+    index = FuzzyIndex(["explicame fotosíntesis"])
+    assert index.match("fotosintessis") is None
+    assert FuzzyIndex(["fotosíntesis"]).match("fotosintessis")[0] == "fotosíntesis"
+
+
+class _MissClient:
+    def query(self, request, headers=None, timeout=None):
+        return AssistantResponse(FALLBACK, metadata={"match": "miss"})
+
+
+def test_rule_based_miss_is_a_failure(monkeypatch):
+    monkeypatch.setitem(main.orchestrator.clients, "rule_based", _MissClient())
+    result = main.orchestrator.call_rule_based("xyzzy")
+    assert not result["success"]
+    assert result["unanswered"]
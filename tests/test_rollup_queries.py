@@ -0,0 +1,81 @@
+# tests/test_rollup_queries.py - /stats y /metrics/generation contra Postgres de verdad
+#
+# Los SUM() sobre columnas BIGINT devuelven numeric, que psycopg2 entrega como Decimal:
+# solo una base de datos real da esos tipos. Necesita DB_HOST/DB_USER/DB_PASSWORD/DB_NAME
+# (p. ej. el servicio db de docker compose); sin base de datos accesible se omite.
+#
+#   DB_HOST=localhost DB_USER=postgres DB_PASSWORD=... DB_NAME=postgres python -m pytest tests/
+import os
+import sys
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "orchestrator")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import psycopg2  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def database():
+    """Base de datos temporal con el esquema de init-db.sql; DB_NAME apunta a ella mientras dura"""
+    if not os.getenv("DB_HOST"):
+        pytest.skip("sin DB_HOST: no hay Postgres para la prueba")
+    from db_utils import get_db_connection
+    try:
+        admin = get_db_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres no accesible: {e}")
+    admin.autocommit = True
+    name = f"edu_test_{uuid.uuid4().hex[:8]}"
+    admin.cursor().execute(f"CREATE DATABASE {name}")
+    original = os.environ["DB_NAME"]
+    os.environ["DB_NAME"] = name
+    try:
+        conn = get_db_connection()
+        with open(os.path.join(ROOT, "init-db.sql"), encoding="utf-8") as f:
+            conn.cursor().execute(f.read())
+        conn.commit()
+        conn.close()
+        yield name
+    finally:
+        os.environ["DB_NAME"] = original
+        admin.cursor().execute(f"DROP DATABASE IF EXISTS {name}")
+        admin.close()
+
+
+@pytest.fixture(scope="module")
+def api(database):
+    from db_utils import get_user, log_metric
+    from ollama_models import GenerationUsage
+    user_id, _ = get_user("ana")
+    log_metric("Ollama", 2.0, 0.0, user_id, route="default",
+               usages=[GenerationUsage("phi", 40, 120, 0.2, 3.0, 0.0)])
+    log_metric("Ollama", 4.0, 0.0, user_id, route="default",
+               usages=[GenerationUsage("phi", 60, 80, 0.3, 1.0, 2.5)])
+    log_metric("Rule_based", 0.01, 1.0, user_id, route="rule")
+    import api
+    return api
+
+
+def test_stats_from_rollups(api):
+    stats = api.get_stats()
+    assert "error" not in stats
+    assert stats["total_queries"] == 3
+    assert stats["avg_latency_ms"] == pytest.approx(6010 / 3, abs=0.01)
+    assert stats["success_rate_percentage"] == pytest.approx(66.67)
+    assert stats["active_users_7d"] == 1
+    assert [(a["assistant"], a["count"]) for a in stats["distribution_by_assistant"]] == [("Ollama", 2),
+                                                                                        ("Rule_based", 1)]
+
+
+def test_generation_metrics(api):
+    (row,) = api.get_generation_metrics(7)["generation"]
+    assert (row["route"], row["model"], row["calls"]) == ("default", "phi", 2)
+    assert row["completion_tokens"] == 200
+    assert row["tokens_per_second"] == pytest.approx(50.0)
+    assert row["prompt_tokens_per_second"] == pytest.approx(200.0)
+    assert row["avg_generation_ms"] == pytest.approx(2000.0)
+    assert row["cold_loads"] == 1
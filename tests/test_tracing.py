@@ -0,0 +1,33 @@
+# tests/test_tracing.py - Cabecera traceparent (W3C Trace Context) que envía el cliente
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from common.tracing import Tracer, _parse_traceparent  # noqa: E402
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+
+
+def test_valid_traceparent():
+    assert _parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-01") == (TRACE_ID, SPAN_ID, True)
+    assert _parse_traceparent(f" 00-{TRACE_ID}-{SPAN_ID}-00 ") == (TRACE_ID, SPAN_ID, False)
+
+
+@pytest.mark.parametrize("header", [
+    "", "basura", f"00-{TRACE_ID}-{SPAN_ID}-zz", f"00-{TRACE_ID[:-1]}x-{SPAN_ID}-01",
+    f"00-{TRACE_ID}-{SPAN_ID[:-1]}g-01", f"00-{TRACE_ID}-{SPAN_ID}-1", f"ff-{TRACE_ID}-{SPAN_ID}-01",
+    f"00-{'0' * 32}-{SPAN_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01", f"00-{TRACE_ID.upper()}-{SPAN_ID}-01",
+])
+def test_invalid_traceparent_is_ignored(header):
+    assert _parse_traceparent(header) is None
+
+
+def test_invalid_traceparent_starts_a_new_trace(tmp_path):
+    tracer = Tracer("test", sample_rate=1.0, export=f"file:{tmp_path / 'traces.jsonl'}")
+    with tracer.start_trace("root", f"00-{TRACE_ID}-{SPAN_ID}-zz") as span:
+        assert span.trace_id != TRACE_ID
+        assert span.parent_id is None
@@ -1,11 +1,16 @@
 # ./ui/app.py
 import streamlit as st
 import requests
-import pandas as pd
+import pyarrow as pa
+import threading
+import time
+import uuid
 from datetime import datetime
 
 # Configuración
 ORCHESTRATOR_URL = "http://orchestrator:8000"
+DASHBOARD_TTL = 10  # segundos entre actualizaciones del panel
+QUERY_TIMEOUT = 30  # la UI deja de esperar aquí: el orquestador recibe el mismo plazo
 
 # Configuración de la página
 st.set_page_config(
@@ -19,27 +24,75 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "user" not in st.session_state:
     st.session_state.user = "estudiante"
+if "session_id" not in st.session_state:
+    # El orquestador guarda el contexto de la conversación con este id
+    st.session_state.session_id = str(uuid.uuid4())
 
-# Función para obtener métricas
-def get_system_metrics():
-    try:
-        response = requests.get(f"{ORCHESTRATOR_URL}/stats", timeout=5)
-        if response.status_code == 200:
-            return response.json()
-    except:
-        return None
+# Panel del sistema: un hilo por proceso consulta /dashboard (con ETag) y el
+# renderizado solo lee la última instantánea, así el chat nunca espera por las métricas
+class DashboardClient:
+    def __init__(self, url, ttl):
+        self.url = url
+        self.ttl = ttl
+        self.data = None
+        self.etag = None
+        self.error = None
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        http = requests.Session()
+        while True:
+            try:
+                headers = {"If-None-Match": self.etag} if self.etag else {}
+                response = http.get(self.url, headers=headers, timeout=5)
+                if response.status_code == 200:
+                    self.data = response.json()
+                    self.etag = response.headers.get("ETag")
+                    self.error = None
+                elif response.status_code != 304:
+                    self.error = f"Error {response.status_code}"
+            except Exception as e:
+                self.error = str(e)
+            self._wake.wait(self.ttl)
+            self._wake.clear()
+
+    def refresh_now(self):
+        self._wake.set()
+
+@st.cache_resource
+def get_dashboard_client():
+    return DashboardClient(f"{ORCHESTRATOR_URL}/dashboard", DASHBOARD_TTL)
+
+dashboard_client = get_dashboard_client()
+dashboard = dashboard_client.data or {}
+
+# Análisis: rollups diarios en Arrow IPC (/metrics/export), columnas ya tipadas sin pasar por JSON
+@st.cache_data(ttl=DASHBOARD_TTL, show_spinner=False)
+def load_metrics_frame(days):
+    response = requests.get(
+        f"{ORCHESTRATOR_URL}/metrics/export",
+        params={"source": "rollup_day", "days": days, "format": "arrow"},
+        timeout=QUERY_TIMEOUT
+    )
+    response.raise_for_status()
+    return pa.ipc.open_stream(response.content).read_pandas()
 
 # Función para enviar consulta
-def send_query_to_orchestrator(query, username):
+def send_query_to_orchestrator(query, username, session_id=None):
     try:
         response = requests.post(
             f"{ORCHESTRATOR_URL}/query",
-            json={"query": query, "username": username},
-            timeout=30
+            json={"query": query, "username": username, "session_id": session_id},
+            headers={"X-Request-Deadline-Ms": str(int((time.time() + QUERY_TIMEOUT) * 1000))},
+            timeout=QUERY_TIMEOUT
         )
         
         if response.status_code == 200:
             return response.json()
+        elif response.status_code == 429:
+            wait = response.headers.get("Retry-After", "unos")
+            return {"error": f"Vas muy rápido: espera {wait} segundos antes de la siguiente pregunta"}
         else:
             return {"error": f"Error {response.status_code}"}
     except Exception as e:
@@ -61,29 +114,26 @@ with st.sidebar:
     
     st.divider()
     
-    # Estado del sistema
+    # Estado del sistema (última instantánea del panel)
     st.header("📊 Estado")
-    try:
-        health_response = requests.get(f"{ORCHESTRATOR_URL}/health", timeout=3)
-        if health_response.status_code == 200:
-            health_data = health_response.json()
-            status = health_data.get("status", "unknown")
-            
-            if status == "healthy":
-                st.success("✅ Sistema operativo")
-            elif status == "degraded":
-                st.warning("⚠️ Sistema degradado")
-            else:
-                st.error("❌ Sistema no disponible")
+    if "health" in dashboard:
+        status = dashboard["health"].get("status", "unknown")
+        
+        if status == "healthy":
+            st.success("✅ Sistema operativo")
+        elif status == "degraded":
+            st.warning("⚠️ Sistema degradado")
         else:
-            st.error("❌ No se pudo verificar")
-    except:
+            st.error("❌ Sistema no disponible")
+    elif dashboard_client.error:
         st.error("❌ Error de conexión")
+    else:
+        st.info("⏳ Verificando...")
     
     st.divider()
     
     # Métricas
-    metrics = get_system_metrics()
+    metrics = dashboard.get("stats")
     if metrics:
         st.header("📈 Métricas")
         st.metric("Consultas Totales", metrics.get("total_queries", 0))
@@ -93,7 +143,12 @@ with st.sidebar:
     st.divider()
     
     if st.button("🗑️ Limpiar Chat"):
+        try:
+            requests.delete(f"{ORCHESTRATOR_URL}/sessions/{st.session_state.session_id}", timeout=3)
+        except Exception:
+            pass
         st.session_state.messages = []
+        st.session_state.session_id = str(uuid.uuid4())
         st.rerun()
     
     st.caption("Versión 1.0.0")
@@ -121,7 +176,7 @@ if prompt:
     # Obtener respuesta
     with st.chat_message("assistant"):
         with st.spinner("🔄 Procesando..."):
-            response_data = send_query_to_orchestrator(prompt, st.session_state.user)
+            response_data = send_query_to_orchestrator(prompt, st.session_state.user, st.session_state.session_id)
             
             if isinstance(response_data, dict) and "error" in response_data:
                 response_text = f"**Error:** {response_data['error']}"
@@ -144,36 +199,39 @@ if prompt:
 st.divider()
 st.header("📊 Análisis del Sistema")
 
+period_days = st.selectbox("Período", [7, 30, 90], format_func=lambda d: f"{d} días")
+
 if st.button("🔄 Actualizar Métricas"):
+    dashboard_client.refresh_now()
+    load_metrics_frame.clear()
     st.rerun()
 
 try:
-    response = requests.get(f"{ORCHESTRATOR_URL}/metrics?days=7", timeout=10)
-    if response.status_code == 200:
-        data = response.json()
+    df = load_metrics_frame(period_days)
+    if not df.empty:
+        df["avg_latency_ms"] = df["latency_sum"] * 1000 / df["total_queries"]
+        df["avg_error_rate"] = df["error_rate_sum"] / df["total_queries"]
         
-        if data.get("metrics"):
-            df = pd.DataFrame(data["metrics"])
-            
-            # Mostrar resumen
-            cols = st.columns(3)
-            with cols[0]:
-                total = sum(m.get("total_queries", 0) for m in data.get("metrics", []))
-                st.metric("Consultas (7d)", total)
-            with cols[1]:
-                st.metric("Métricas", data.get("total_metrics", 0))
-            with cols[2]:
-                st.metric("Período", "7 días")
-            
-            # Gráfico
-            if "assistant_type" in df.columns and "total_queries" in df.columns:
-                st.subheader("Consultas por Asistente")
-                chart_data = df.groupby("assistant_type")["total_queries"].sum()
-                st.bar_chart(chart_data)
-            
-            # Tabla
-            st.subheader("Detalles")
-            st.dataframe(df)
+        # Mostrar resumen
+        cols = st.columns(3)
+        with cols[0]:
+            st.metric(f"Consultas ({period_days}d)", int(df["total_queries"].sum()))
+        with cols[1]:
+            st.metric("Métricas", len(df))
+        with cols[2]:
+            st.metric("Período", f"{period_days} días")
+        
+        # Gráficos
+        st.subheader("Consultas por Asistente")
+        st.bar_chart(df.groupby("assistant_type")["total_queries"].sum())
+        
+        st.subheader("Latencia media diaria (ms)")
+        daily = df.groupby("bucket")[["latency_sum", "total_queries"]].sum()
+        st.line_chart(daily["latency_sum"] * 1000 / daily["total_queries"])
+        
+        # Tabla
+        st.subheader("Detalles")
+        st.dataframe(df.drop(columns=["latency_sum", "latency_sumsq", "error_rate_sum"]))
     else:
         st.info("No hay métricas disponibles todavía")
 except: